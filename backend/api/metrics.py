@@ -0,0 +1,306 @@
+"""Per-route request histograms in the Prometheus text format.
+
+Every worker aggregates its own requests in memory. With METRICS_DIR
+set, a background thread writes them to ``<METRICS_DIR>/<pid>.json``
+every METRICS_FLUSH_INTERVAL seconds and the metrics view sums the
+files of all workers, so any gunicorn worker can answer a scrape.
+"""
+import atexit
+import ipaddress
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from pathlib import Path
+
+from django.conf import settings
+from django.http import Http404, HttpResponse
+from django.views.decorators.http import require_GET
+
+from users.authentication import token_cache
+
+PREFIX = "foodgram"
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+# Name -> (help, buckets); values are observed once per request.
+HISTOGRAMS = {
+    "http_request_duration_seconds": (
+        "Time from the request reaching Django to the response.",
+        DURATION_BUCKETS,
+    ),
+    "http_request_sql_queries": (
+        "SQL queries run while handling a request.",
+        QUERY_BUCKETS,
+    ),
+    "http_request_sql_duration_seconds": (
+        "Time spent in SQL queries while handling a request.",
+        DURATION_BUCKETS,
+    ),
+    "http_request_serializer_duration_seconds": (
+        "Time spent producing serializer.data while handling a request.",
+        DURATION_BUCKETS,
+    ),
+    "http_response_size_bytes": (
+        "Size of the response body; streamed bodies of unknown length "
+        "are not observed.",
+        SIZE_BUCKETS,
+    ),
+}
+TOKEN_CACHE_COUNTERS = ("hits", "misses")
+TOKEN_CACHE_GAUGES = {"currsize": "entries", "maxsize": "capacity"}
+
+
+class Registry:
+    """Request metrics of this process."""
+
+    def __init__(self):
+        self._reset()
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        # A forked worker starts empty: its parent's requests are counted
+        # by the parent.
+        self._lock = threading.Lock()
+        self._flusher = None
+        self._inherited = False
+        self._dirty = False
+        self.requests = {}
+        self.histograms = {name: {} for name in HISTOGRAMS}
+
+    def observe(self, route, method, status, values):
+        """Count a request and add ``values`` to the route's histograms."""
+        with self._lock:
+            key = f"{route}\t{method}\t{status}"
+            self.requests[key] = self.requests.get(key, 0) + 1
+            for name, value in values.items():
+                buckets = HISTOGRAMS[name][1]
+                series = self.histograms[name].get(route)
+                if series is None:
+                    # Bucket counts, the +Inf bucket, then the sum.
+                    series = self.histograms[name][route] = (
+                        [0] * (len(buckets) + 2)
+                    )
+                series[bisect_left(buckets, value)] += 1
+                series[-1] += value
+            self._dirty = True
+        if self._flusher is None and settings.METRICS_DIR:
+            self._start_flusher()
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "requests": dict(self.requests),
+                "histograms": {
+                    name: {route: list(series) for route, series in
+                           routes.items()}
+                    for name, routes in self.histograms.items()
+                },
+                "token_cache": token_cache.info()._asdict(),
+            }
+
+    def _merge_file(self, path):
+        # A new process that got the pid of a dead one takes over its
+        # counts, so the sums over all files never go down.
+        try:
+            previous = json.loads(path.read_text())
+        except (OSError, ValueError):
+            return
+        with self._lock:
+            merge(
+                {"requests": self.requests, "histograms": self.histograms},
+                previous,
+            )
+
+    def flush(self):
+        """Write this process' metrics to its file in METRICS_DIR."""
+        directory = Path(settings.METRICS_DIR)
+        path = directory / f"{os.getpid()}.json"
+        if not self._inherited:
+            self._merge_file(path)
+            self._inherited = True
+        self._dirty = False
+        directory.mkdir(parents=True, exist_ok=True)
+        temporary = path.with_suffix(".tmp")
+        temporary.write_text(json.dumps(self.snapshot()))
+        os.replace(temporary, path)
+
+    def _flush_quietly(self):
+        try:
+            self.flush()
+        except OSError:
+            pass
+
+    def _start_flusher(self):
+        with self._lock:
+            if self._flusher is not None:
+                return
+            self._flusher = threading.Thread(
+                target=self._flush_periodically,
+                name="metrics-flush",
+                daemon=True,
+            )
+        self._flusher.start()
+        atexit.register(self._flush_quietly)
+
+    def _flush_periodically(self):
+        while True:
+            time.sleep(settings.METRICS_FLUSH_INTERVAL)
+            if self._dirty:
+                self._flush_quietly()
+
+
+registry = Registry()
+
+
+def merge(total, snapshot):
+    """Add the counts of ``snapshot`` to ``total`` in place."""
+    requests = total.setdefault("requests", {})
+    for key, count in snapshot.get("requests", {}).items():
+        requests[key] = requests.get(key, 0) + count
+    histograms = total.setdefault("histograms", {})
+    for name, routes in snapshot.get("histograms", {}).items():
+        if name not in HISTOGRAMS:
+            continue
+        merged = histograms.setdefault(name, {})
+        for route, series in routes.items():
+            if route not in merged:
+                merged[route] = list(series)
+            # Files written before the buckets changed are skipped.
+            elif len(merged[route]) == len(series):
+                merged[route] = [a + b for a, b in zip(merged[route], series)]
+    return total
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _snapshots():
+    """(snapshot, running) of every worker."""
+    if not settings.METRICS_DIR:
+        yield registry.snapshot(), True
+        return
+    registry.flush()
+    for path in Path(settings.METRICS_DIR).glob("*.json"):
+        try:
+            snapshot = json.loads(path.read_text())
+        except (OSError, ValueError):
+            continue
+        yield snapshot, path.stem.isdigit() and _alive(int(path.stem))
+
+
+def collect():
+    """Summed counts of all workers and the token caches of running ones."""
+    total = {"token_cache": dict.fromkeys(TOKEN_CACHE_COUNTERS, 0)}
+    caches = []
+    for snapshot, running in _snapshots():
+        merge(total, snapshot)
+        cache_info = snapshot.get("token_cache", {})
+        for field in TOKEN_CACHE_COUNTERS:
+            total["token_cache"][field] += cache_info.get(field, 0)
+        # Gauges of workers that exited are stale.
+        if running:
+            caches.append(cache_info)
+    return total, caches
+
+
+def _escape(value):
+    return (
+        str(value)
+        .replace("\\", r"\\")
+        .replace('"', r"\"")
+        .replace("\n", r"\n")
+    )
+
+
+def _labels(**labels):
+    return "{" + ",".join(
+        f'{name}="{_escape(value)}"' for name, value in labels.items()
+    ) + "}"
+
+
+def _bound(value):
+    return repr(float(value))
+
+
+def render(total, caches):
+    """Prometheus text exposition of collect()'s result."""
+    lines = [
+        f"# HELP {PREFIX}_http_requests_total Requests handled, by route, "
+        "method and status.",
+        f"# TYPE {PREFIX}_http_requests_total counter",
+    ]
+    for key, count in sorted(total.get("requests", {}).items()):
+        route, method, status = key.split("\t")
+        lines.append(
+            f"{PREFIX}_http_requests_total"
+            f"{_labels(route=route, method=method, status=status)} {count}"
+        )
+    for name, (help_text, buckets) in HISTOGRAMS.items():
+        metric = f"{PREFIX}_{name}"
+        lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} histogram"]
+        routes = total.get("histograms", {}).get(name, {})
+        for route, series in sorted(routes.items()):
+            cumulative = 0
+            for bound, count in zip(
+                [*map(_bound, buckets), "+Inf"], series[:-1]
+            ):
+                cumulative += count
+                lines.append(
+                    f"{metric}_bucket{_labels(route=route, le=bound)} "
+                    f"{cumulative}"
+                )
+            lines += [
+                f"{metric}_sum{_labels(route=route)} {series[-1]}",
+                f"{metric}_count{_labels(route=route)} {cumulative}",
+            ]
+    for field in TOKEN_CACHE_COUNTERS:
+        metric = f"{PREFIX}_token_cache_{field}_total"
+        lines += [
+            f"# HELP {metric} Token cache {field} of all workers.",
+            f"# TYPE {metric} counter",
+            f"{metric} {total['token_cache'][field]}",
+        ]
+    for field, name in TOKEN_CACHE_GAUGES.items():
+        metric = f"{PREFIX}_token_cache_{name}"
+        lines += [
+            f"# HELP {metric} Token cache {name} of the running workers.",
+            f"# TYPE {metric} gauge",
+            f"{metric} {sum(cache.get(field, 0) for cache in caches)}",
+        ]
+    lines += [
+        f"# HELP {PREFIX}_workers Worker processes reporting metrics.",
+        f"# TYPE {PREFIX}_workers gauge",
+        f"{PREFIX}_workers {len(caches)}",
+    ]
+    return "\n".join(lines) + "\n"
+
+
+def is_allowed(address):
+    try:
+        address = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(
+        address in ipaddress.ip_network(network, strict=False)
+        for network in settings.METRICS_ALLOWED_IPS
+    )
+
+
+@require_GET
+def metrics(request):
+    """Prometheus scrape endpoint; hidden from addresses not allowed."""
+    if not is_allowed(request.META.get("REMOTE_ADDR", "")):
+        raise Http404
+    return HttpResponse(render(*collect()), content_type=CONTENT_TYPE)
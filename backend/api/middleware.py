@@ -0,0 +1,200 @@
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from rest_framework import serializers
+
+from api.metrics import is_allowed, registry
+
+UNMATCHED_ROUTE = "unmatched"
+
+
+class RequestStats:
+    """SQL and serializer time of the request being handled."""
+
+    __slots__ = ("queries", "sql_time", "serializer_time", "serializing")
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_time = 0.0
+        self.serializer_time = 0.0
+        self.serializing = False
+
+
+# Context variables reach the threads sync_to_async() runs queries in.
+current_stats = ContextVar("current_stats", default=None)
+
+
+def record_query(execute, sql, params, many, context):
+    """Database execute wrapper counting the queries of the request."""
+    stats = current_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.queries += 1
+        stats.sql_time += time.perf_counter() - started
+
+
+class measure_serialization:
+    """Add the time spent in the block to the request's serializer time.
+
+    Nested blocks, like a serializer reading another one's data, are
+    counted once.
+    """
+
+    def __enter__(self):
+        self.stats = current_stats.get()
+        if self.stats is None or self.stats.serializing:
+            self.stats = None
+        else:
+            self.stats.serializing = True
+            self.started = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        if self.stats is not None:
+            self.stats.serializer_time += time.perf_counter() - self.started
+            self.stats.serializing = False
+
+
+class TimedListSerializer(serializers.ListSerializer):
+    """ListSerializer whose ``data`` counts as serializer time."""
+
+    @property
+    def data(self):
+        with measure_serialization():
+            return super().data
+
+
+class TimedSerializerMixin:
+    """Base of the API's serializers: reading ``data`` counts as the
+    request's serializer time.
+
+    ``many=True`` builds a TimedListSerializer unless Meta names another
+    list serializer class. Serializers of DRF and djoser are not timed.
+    """
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # Only a Meta of the class itself: an inherited one may be
+        # djoser's.
+        meta = cls.__dict__.get("Meta")
+        if meta is not None and not hasattr(meta, "list_serializer_class"):
+            meta.list_serializer_class = TimedListSerializer
+
+    @property
+    def data(self):
+        with measure_serialization():
+            return super().data
+
+
+def shows_timing(request):
+    """Whether the response may carry Server-Timing.
+
+    Only with DEBUG on or to METRICS_ALLOWED_IPS; behind nginx the
+    client's address in X-Real-IP has to be allowed as well.
+    """
+    if settings.DEBUG:
+        return True
+    addresses = [request.META.get("REMOTE_ADDR", "")]
+    if "HTTP_X_REAL_IP" in request.META:
+        addresses.append(request.META["HTTP_X_REAL_IP"])
+    return all(map(is_allowed, addresses))
+
+
+def _ms(seconds):
+    return f"{seconds * 1000:.1f}"
+
+
+class MetricsMiddleware:
+    """Record SQL, serializer and total time and the size of responses.
+
+    The numbers go to the route's histograms in api.metrics and, for
+    developers, to a Server-Timing header, which browser dev tools show
+    per request.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats = RequestStats()
+        token = current_stats.set(stats)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            current_stats.reset(token)
+        return self.finish(request, response, stats, started)
+
+    async def __acall__(self, request):
+        stats = RequestStats()
+        token = current_stats.set(stats)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_stats.reset(token)
+        return self.finish(request, response, stats, started)
+
+    def finish(self, request, response, stats, started):
+        elapsed = time.perf_counter() - started
+        values = {
+            "http_request_duration_seconds": elapsed,
+            "http_request_sql_queries": stats.queries,
+            "http_request_sql_duration_seconds": stats.sql_time,
+            "http_request_serializer_duration_seconds": stats.serializer_time,
+        }
+        if not response.streaming:
+            values["http_response_size_bytes"] = len(response.content)
+        elif response.has_header("Content-Length"):
+            values["http_response_size_bytes"] = int(
+                response["Content-Length"]
+            )
+        match = request.resolver_match
+        registry.observe(
+            match.view_name if match else UNMATCHED_ROUTE,
+            request.method,
+            response.status_code,
+            values,
+        )
+        if shows_timing(request):
+            response["Server-Timing"] = (
+                f"db;dur={_ms(stats.sql_time)};"
+                f'desc="{stats.queries} queries", '
+                f"serialize;dur={_ms(stats.serializer_time)}, "
+                f"total;dur={_ms(elapsed)}"
+            )
+        return response
+
+
+class AsgiUrlconfMiddleware:
+    """Route requests served under ASGI with settings.ASGI_URLCONF.
+
+    Requests from WSGI workers keep ROOT_URLCONF, whatever else the
+    process has imported.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if isinstance(request, ASGIRequest):
+            request.urlconf = settings.ASGI_URLCONF
+        return self.get_response(request)
@@ -0,0 +1,259 @@
+"""Async read path for tags, ingredients and recipes under ASGI.
+
+The views answer GET and HEAD with the same bodies, ETags and status
+codes as the viewsets, sharing their filters, pagination and versions.
+Anything else is handed to the sync view ROOT_URLCONF routes the path to.
+"""
+import functools
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.http import JsonResponse
+from django.urls import resolve
+from django.utils.cache import get_conditional_response
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.exceptions import (
+    APIException,
+    AuthenticationFailed,
+    ValidationError,
+)
+from rest_framework.request import Request
+
+from api.middleware import measure_serialization
+from api.recipes.filters import RecipeFilter
+from api.recipes.mixins import add_validators, get_validators
+from api.recipes.pagination import RecipeCursorPagination, RecipePagination
+from api.recipes.serializers import (
+    IngredientSerializer,
+    RecipeSerializer,
+    TagSerializer,
+)
+from api.recipes.views import page_version, version_rows
+from recipes.autocomplete import get_index
+from recipes.models import Ingredient, Recipe, Tag
+from recipes.versions import (
+    INGREDIENTS_VERSION,
+    RECIPES_VERSION,
+    TAGS_VERSION,
+    aget_version,
+    viewer_version_name,
+)
+from users.authentication import CachedTokenAuthentication
+
+JSON_MEDIA_TYPE = "application/json"
+TAG_FIELDS = TagSerializer.Meta.fields
+INGREDIENT_FIELDS = IngredientSerializer.Meta.fields
+
+_authentication = CachedTokenAuthentication()
+
+
+def json_response(data, status=200):
+    # The bytes DRF's JSONRenderer would produce.
+    return JsonResponse(
+        data,
+        status=status,
+        safe=False,
+        json_dumps_params={"ensure_ascii": False, "separators": (",", ":")},
+    )
+
+
+def error_response(error):
+    # The body DRF's exception handler would send.
+    data = error.detail
+    if not isinstance(data, (list, dict)):
+        data = {"detail": data}
+    return json_response(data, status=error.status_code)
+
+
+def not_found(model):
+    return json_response(
+        {"detail": f"No {model._meta.object_name} matches the given query."},
+        status=404,
+    )
+
+
+def wants_json(request):
+    # The browsable API and ?format= are left to DRF.
+    return (
+        "format" not in request.GET
+        and "text/html" not in request.headers.get("Accept", "")
+    )
+
+
+def read_only(handler):
+    """Serve GET and HEAD with ``handler``, everything else synchronously.
+
+    The handler may also return None to pass a read on to the sync view.
+    """
+
+    # DRF enforces CSRF itself, for session authentication only.
+    @csrf_exempt
+    @functools.wraps(handler)
+    async def view(request, *args, **kwargs):
+        if request.method in ("GET", "HEAD") and wants_json(request):
+            try:
+                authenticated = await _authentication.aauthenticate(request)
+            except AuthenticationFailed as error:
+                response = error_response(error)
+                response["WWW-Authenticate"] = _authentication.keyword
+                return response
+            request.user = (
+                authenticated[0] if authenticated else AnonymousUser()
+            )
+            response = await handler(request, *args, **kwargs)
+            if response is not None:
+                return response
+        match = resolve(request.path_info, urlconf=settings.ROOT_URLCONF)
+        return await sync_to_async(match.func)(
+            request, *match.args, **match.kwargs
+        )
+
+    return view
+
+
+async def conditional(request, version, render, last_modified=None,
+                      personalized=False):
+    """ConditionalGetMixin.conditional_response() for async views."""
+    viewer_version = None
+    if personalized and request.user.is_authenticated:
+        viewer_version = await aget_version(
+            viewer_version_name(request.user.pk)
+        )
+    etag, timestamp = get_validators(
+        request, JSON_MEDIA_TYPE, version, last_modified, viewer_version
+    )
+    response = get_conditional_response(
+        request, etag=etag, last_modified=timestamp
+    )
+    if response is None:
+        response = await render()
+        if response.status_code != 200:
+            return response
+    return add_validators(response, etag, timestamp)
+
+
+@read_only
+async def tag_list(request):
+    async def render():
+        return json_response(
+            [tag async for tag in Tag.objects.values(*TAG_FIELDS)]
+        )
+
+    return await conditional(request, await aget_version(TAGS_VERSION), render)
+
+
+@read_only
+async def tag_detail(request, pk):
+    async def render():
+        try:
+            return json_response(
+                await Tag.objects.values(*TAG_FIELDS).aget(pk=pk)
+            )
+        except Tag.DoesNotExist:
+            return not_found(Tag)
+
+    return await conditional(request, await aget_version(TAGS_VERSION), render)
+
+
+@read_only
+async def ingredient_list(request):
+    name = request.GET.get("name", "")
+
+    async def render():
+        if name.strip():
+            # Only a stale index touches the database.
+            index = await sync_to_async(get_index)()
+            return json_response(
+                index.search(name, settings.INGREDIENT_AUTOCOMPLETE_LIMIT)
+            )
+        return json_response([
+            ingredient async for ingredient in
+            Ingredient.objects.values(*INGREDIENT_FIELDS)
+        ])
+
+    return await conditional(
+        request, await aget_version(INGREDIENTS_VERSION), render
+    )
+
+
+@read_only
+async def ingredient_detail(request, pk):
+    async def render():
+        try:
+            return json_response(
+                await Ingredient.objects.values(*INGREDIENT_FIELDS).aget(
+                    pk=pk
+                )
+            )
+        except Ingredient.DoesNotExist:
+            return not_found(Ingredient)
+
+    return await conditional(
+        request, await aget_version(INGREDIENTS_VERSION), render
+    )
+
+
+def _recipe_page(request, drf_request):
+    """The paginator and the filtered recipes of the requested page."""
+    filterset = RecipeFilter(
+        request.GET, queryset=Recipe.objects.all(), request=request
+    )
+    if not filterset.is_valid():
+        raise ValidationError(filterset.errors)
+    paginator = RecipePagination()
+    page = paginator.paginate_queryset(
+        filterset.qs.with_user_flags(request.user), drf_request
+    )
+    return paginator, page
+
+
+@read_only
+async def recipe_list(request):
+    if RecipeCursorPagination.is_requested(request):
+        return None
+    # Pagination reads query_params, which only DRF requests have.
+    drf_request = Request(request)
+    # Filtering and pagination take one thread hop rather than one per
+    # query.
+    try:
+        paginator, page = await sync_to_async(_recipe_page)(
+            request, drf_request
+        )
+    except APIException as error:
+        return error_response(error)
+    version = page_version(
+        await aget_version(RECIPES_VERSION), paginator, page
+    )
+
+    async def render():
+        serializer = RecipeSerializer(context={"request": request})
+        with measure_serialization():
+            results = await serializer.arepresent_many(page)
+        return json_response(paginator.get_paginated_response(results).data)
+
+    return await conditional(request, version, render, personalized=True)
+
+
+@read_only
+async def recipe_detail(request, pk):
+    row = await version_rows(pk).afirst()
+
+    async def render():
+        recipe = await (
+            Recipe.objects.with_user_flags(request.user).filter(pk=pk).afirst()
+        )
+        if recipe is None:
+            return not_found(Recipe)
+        serializer = RecipeSerializer(context={"request": request})
+        with measure_serialization():
+            results = await serializer.arepresent_many([recipe])
+        return json_response(results[0])
+
+    return await conditional(
+        request,
+        row,
+        render,
+        last_modified=row[0] if row else None,
+        personalized=True,
+    )
@@ -1,6 +1,27 @@
+from django.core.cache import cache
+from django.db.models import Exists, OuterRef
 from django_filters import rest_framework as filters
+from rest_framework.exceptions import ValidationError
 
-from recipes.models import Ingredient, Recipe
+from api.recipes.pagination import RecipeCursorPagination
+from recipes.models import Favorite, Ingredient, Recipe, ShoppingCart, Tag
+from recipes.search import search_recipes
+from recipes.versions import TAGS_VERSION, get_version
+
+TAG_IDS_CACHE_PREFIX = "tag_ids"
+
+
+def tag_ids_by_slug():
+    """Slug to id map of all tags, cached until a tag changes."""
+    return cache.get_or_set(
+        f"{TAG_IDS_CACHE_PREFIX}:{get_version(TAGS_VERSION)}",
+        lambda: dict(Tag.objects.values_list("slug", "id")),
+        timeout=None,
+    )
+
+
+def tag_choices():
+    return [(slug, slug) for slug in tag_ids_by_slug()]
 
 
 class IngredientFilter(filters.FilterSet):
@@ -13,25 +34,80 @@ class IngredientFilter(filters.FilterSet):
         fields = ("name",)
 
 
+class TagFilter(filters.MultipleChoiceFilter):
+    """Recipes with any of the given tag slugs.
+
+    Choices come from the cached tag map and the match is an EXISTS
+    subquery, so no join can repeat a recipe.
+    """
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault("choices", tag_choices)
+        super().__init__(*args, **kwargs)
+
+    def filter(self, qs, value):
+        if not value:
+            return qs
+        # A tag deleted or renamed since the choices were validated is
+        # missing from a newer map and matches nothing.
+        tag_ids = tag_ids_by_slug()
+        return qs.filter(
+            Exists(
+                Recipe.tags.through.objects.filter(
+                    recipe_id=OuterRef("pk"),
+                    tag_id__in=[
+                        tag_ids[slug] for slug in value if slug in tag_ids
+                    ],
+                )
+            )
+        )
+
+
 class RecipeFilter(filters.FilterSet):
     """Recipe filter."""
 
-    tags = filters.AllValuesMultipleFilter(field_name="tags__slug")
+    tags = TagFilter()
     is_favorited = filters.BooleanFilter(method="filter_is_favorited")
     is_in_shopping_cart = filters.BooleanFilter(
         method="filter_is_in_shopping_cart"
     )
+    search = filters.CharFilter(method="filter_search")
 
     class Meta:
         model = Recipe
-        fields = ("tags", "author", "is_favorited", "is_in_shopping_cart")
+        fields = (
+            "tags", "author", "is_favorited", "is_in_shopping_cart", "search"
+        )
 
     def filter_is_favorited(self, queryset, name, value):
         if value and self.request.user.is_authenticated:
-            return queryset.filter(favorites__user=self.request.user)
+            return queryset.filter(
+                Exists(
+                    Favorite.objects.filter(
+                        user=self.request.user, recipe=OuterRef("pk")
+                    )
+                )
+            )
         return queryset
 
     def filter_is_in_shopping_cart(self, queryset, name, value):
         if value and self.request.user.is_authenticated:
-            return queryset.filter(shopping_cart__user=self.request.user)
+            return queryset.filter(
+                Exists(
+                    ShoppingCart.objects.filter(
+                        user=self.request.user, recipe=OuterRef("pk")
+                    )
+                )
+            )
         return queryset
+
+    def filter_search(self, queryset, name, value):
+        """Full-text match on name, ingredients and text, best first."""
+        if not value.strip():
+            return queryset
+        # Cursors follow (pub_date, id), which would discard the ranking.
+        if RecipeCursorPagination.is_requested(self.request):
+            raise ValidationError(
+                {"search": "Поиск не поддерживает курсорную пагинацию."}
+            )
+        return search_recipes(queryset, value)
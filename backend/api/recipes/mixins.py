@@ -0,0 +1,97 @@
+import hashlib
+
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+from recipes.fields import requested_image_format
+from recipes.versions import get_version, viewer_version_name
+
+VARY_HEADERS = ("Accept", "Authorization", "X-Image-Format")
+
+
+def make_etag(parts):
+    digest = hashlib.md5(
+        "|".join(map(str, parts)).encode(), usedforsecurity=False
+    ).hexdigest()
+    return quote_etag(digest)
+
+
+def get_validators(request, media_type, version, last_modified=None,
+                   viewer_version=None):
+    """ETag and Last-Modified timestamp of the response to ``request``.
+
+    A ``viewer_version`` makes the ETag personal and drops Last-Modified,
+    which cannot tell viewers apart.
+    """
+    parts = [
+        request.get_full_path(),
+        media_type,
+        requested_image_format(request),
+        version,
+    ]
+    if viewer_version is not None:
+        # Flags like is_favorited differ per viewer and change without
+        # touching the recipes themselves.
+        parts += [request.user.pk, viewer_version]
+        last_modified = None
+    timestamp = last_modified.timestamp() if last_modified else None
+    return make_etag(parts), timestamp
+
+
+def add_validators(response, etag, timestamp=None):
+    """Add the ETag, Last-Modified and Vary headers of a 200 response."""
+    response["ETag"] = etag
+    if timestamp is not None:
+        response["Last-Modified"] = http_date(timestamp)
+    patch_vary_headers(response, VARY_HEADERS)
+    return response
+
+
+class ConditionalGetMixin:
+    """Answer list and retrieve with 304 Not Modified when possible.
+
+    Views provide ``get_content_version()``, a cheap value that changes
+    whenever the response body would, and may provide
+    ``get_last_modified()``. The check runs before any serialization.
+    """
+
+    personalized = False
+
+    def get_content_version(self):
+        raise NotImplementedError
+
+    def get_last_modified(self):
+        return None
+
+    def get_viewer_version(self, request):
+        if self.personalized and request.user.is_authenticated:
+            return get_version(viewer_version_name(request.user.pk))
+        return None
+
+    def conditional_response(self, handler, request, *args, **kwargs):
+        viewer_version = self.get_viewer_version(request)
+        etag, timestamp = get_validators(
+            request,
+            request.accepted_media_type,
+            self.get_content_version(),
+            self.get_last_modified() if viewer_version is None else None,
+            viewer_version,
+        )
+        response = get_conditional_response(
+            request, etag=etag, last_modified=timestamp
+        )
+        if response is None:
+            response = handler(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+        return add_validators(response, etag, timestamp)
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(
+            super().list, request, *args, **kwargs
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(
+            super().retrieve, request, *args, **kwargs
+        )
@@ -1,4 +1,50 @@
-from rest_framework.pagination import PageNumberPagination
+import base64
+import binascii
+import hashlib
+from datetime import datetime
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import (
+    BasePagination,
+    CursorPagination,
+    PageNumberPagination,
+)
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+COUNT_CACHE_PREFIX = "recipe_count"
+
+
+def count_cache_key(query):
+    sql, params = query.sql_with_params()
+    return COUNT_CACHE_PREFIX + ":" + hashlib.md5(
+        f"{sql}|{params!r}".encode(), usedforsecurity=False
+    ).hexdigest()
+
+
+class CachedCountPaginator(Paginator):
+    """Paginator that reuses COUNT(*) results for a short while.
+
+    With RECIPE_COUNT_CACHE_TIMEOUT set, the total is approximate: it may
+    lag behind by that many seconds. Zero keeps exact counts.
+    """
+
+    @cached_property
+    def count(self):
+        timeout = settings.RECIPE_COUNT_CACHE_TIMEOUT
+        query = getattr(self.object_list, "query", None)
+        if not timeout or query is None:
+            return super().count
+        key = count_cache_key(query)
+        count = cache.get(key)
+        if count is None:
+            count = super().count
+            cache.set(key, count, timeout)
+        return count
 
 
 class RecipePagination(PageNumberPagination):
@@ -6,3 +52,89 @@ class RecipePagination(PageNumberPagination):
 
     page_size = 6
     page_size_query_param = "limit"
+    django_paginator_class = CachedCountPaginator
+
+
+class RecipeCursorPagination(CursorPagination):
+    """Keyset pagination over (pub_date, id) for infinite scrolling.
+
+    Selected with ``?pagination=cursor``; follow-up pages carry
+    ``?cursor=``. Never counts rows and never uses OFFSET beyond recipes
+    that share a publication timestamp. Ranked search results page by
+    number only.
+    """
+
+    page_size = 6
+    page_size_query_param = "limit"
+    ordering = ("-pub_date", "-id")
+    mode_query_param = "pagination"
+
+    @classmethod
+    def is_requested(cls, request):
+        # GET rather than query_params: async views pass Django requests.
+        return (
+            request.GET.get(cls.mode_query_param) == "cursor"
+            or cls.cursor_query_param in request.GET
+        )
+
+
+class FeedPagination(BasePagination):
+    """Keyset pagination over (pub_date, recipe id) feed positions."""
+
+    page_size = 6
+    page_size_query_param = "limit"
+    max_page_size = 100
+    cursor_query_param = "cursor"
+    invalid_cursor_message = "Неверный курсор."
+
+    def paginate_positions(self, fetch_positions, request):
+        """Positions of the requested page from ``fetch(before, limit)``."""
+        self.request = request
+        limit = self.get_page_size(request)
+        positions = fetch_positions(self.decode_cursor(request), limit + 1)
+        page = positions[:limit]
+        self.next_position = page[-1] if len(positions) > limit else None
+        return page
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def decode_cursor(self, request):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None
+        try:
+            pub_date, recipe_id = (
+                base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+            )
+            return datetime.fromisoformat(pub_date), int(recipe_id)
+        except (binascii.Error, UnicodeDecodeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, position):
+        pub_date, recipe_id = position
+        return base64.urlsafe_b64encode(
+            f"{pub_date.isoformat()}|{recipe_id}".encode()
+        ).decode()
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            self.encode_cursor(self.next_position),
+        )
+
+    def get_paginated_response(self, data):
+        return Response({
+            "next": self.get_next_link(),
+            "previous": None,
+            "results": data,
+        })
@@ -0,0 +1,41 @@
+import json
+
+from rest_framework.renderers import BaseRenderer
+
+
+class PassthroughRenderer(BaseRenderer):
+    """Renderer for views that build their own response body.
+
+    Only error payloads produced by DRF itself go through ``render``.
+    """
+
+    charset = "utf-8"
+    encoding = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, bytes):
+            return data
+        if isinstance(data, str):
+            return data.encode(self.encoding)
+        return json.dumps(data, ensure_ascii=False).encode(self.encoding)
+
+
+class PlainTextRenderer(PassthroughRenderer):
+    media_type = "text/plain"
+    format = "txt"
+
+
+class CSVRenderer(PassthroughRenderer):
+    media_type = "text/csv"
+    format = "csv"
+
+
+class JSONFileRenderer(PassthroughRenderer):
+    media_type = "application/json"
+    format = "json"
+
+
+class PDFRenderer(PassthroughRenderer):
+    media_type = "application/pdf"
+    format = "pdf"
+    charset = None
@@ -0,0 +1,58 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+
+from recipes.fields import requested_image_format
+
+CACHE_PREFIX = "recipe"
+
+
+def _variant(request):
+    """Part of the key for everything a request adds to the output."""
+    if request is None:
+        return requested_image_format(None)
+    origin = request.build_absolute_uri("/")
+    return hashlib.md5(
+        f"{origin}|{requested_image_format(request)}".encode(),
+        usedforsecurity=False,
+    ).hexdigest()
+
+
+def cache_key(recipe, variant):
+    # updated_at moves whenever the recipe, its tags, ingredients or
+    # author change, so stale entries are simply never read again.
+    return (
+        f"{CACHE_PREFIX}:{recipe.pk}:{recipe.updated_at.timestamp()}:"
+        f"{variant}"
+    )
+
+
+def get_many(recipes, request):
+    """Cached shared representations of ``recipes``, keyed by pk."""
+    variant = _variant(request)
+    keys = {cache_key(recipe, variant): recipe.pk for recipe in recipes}
+    return {
+        keys[key]: data for key, data in cache.get_many(list(keys)).items()
+    }
+
+
+def set_many(representations, recipes, request):
+    variant = _variant(request)
+    cache.set_many(
+        {
+            cache_key(recipe, variant): representations[recipe.pk]
+            for recipe in recipes
+        },
+        settings.RECIPE_CACHE_TIMEOUT,
+    )
+
+
+async def aget_many(recipes, request):
+    """get_many() for async views."""
+    variant = _variant(request)
+    keys = {cache_key(recipe, variant): recipe.pk for recipe in recipes}
+    return {
+        keys[key]: data
+        for key, data in (await cache.aget_many(list(keys))).items()
+    }
@@ -1,5 +1,7 @@
+from asgiref.sync import sync_to_async
 from rest_framework import serializers
-from django.db import transaction
+from django.db import models, transaction
+from django.db.models import prefetch_related_objects
 from recipes.models import (
     Recipe,
     Ingredient,
@@ -8,25 +10,32 @@ from recipes.models import (
     Favorite,
     ShoppingCart
 )
-from recipes.fields import Base64ImageField
-from api.users.serializers import UserProfileSerializer
+from recipes.fields import Base64ImageField, ImageVariantField
+from api.middleware import TimedListSerializer, TimedSerializerMixin
+from api.recipes import representation_cache
+from api.users.serializers import AuthorSerializer
+from users.models import Subscription
 
+MAX_BULK_RECIPES = 1000
 
-class IngredientSerializer(serializers.ModelSerializer):
+
+class IngredientSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Serializer for ingredients."""
     class Meta:
         model = Ingredient
         fields = ['id', 'name', 'measurement_unit']
 
 
-class TagSerializer(serializers.ModelSerializer):
+class TagSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Serializer for tags."""
     class Meta:
         model = Tag
         fields = ['id', 'name', 'color', 'slug']
 
 
-class IngredientInRecipeSerializer(serializers.ModelSerializer):
+class IngredientInRecipeSerializer(
+    TimedSerializerMixin, serializers.ModelSerializer
+):
     id = serializers.ReadOnlyField(source='ingredient.id')
     name = serializers.ReadOnlyField(source='ingredient.name')
     measurement_unit = serializers.ReadOnlyField(
@@ -38,34 +47,136 @@ class IngredientInRecipeSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'measurement_unit', 'amount')
 
 
-class RecipeSerializer(serializers.ModelSerializer):
-    """Serializer for recipes."""
+class RecipeListSerializer(TimedListSerializer):
+    """Represents a whole page of recipes with one cache round trip."""
+
+    def to_representation(self, data):
+        if isinstance(data, models.manager.BaseManager):
+            data = data.all()
+        return self.child.represent_many(list(data))
+
+
+class RecipeSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    """Serializer for recipes.
+
+    Everything except the viewer flags and the counters is the same for
+    every reader and is cached per recipe version; the rest is merged in
+    per request.
+    """
     ingredients = serializers.SerializerMethodField()
     tags = TagSerializer(many=True, read_only=True)
     image = Base64ImageField()
+    image_small = ImageVariantField(source='image', variant='small')
+    image_medium = ImageVariantField(source='image', variant='medium')
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
-    author = UserProfileSerializer(read_only=True)
+    author = AuthorSerializer(read_only=True)
+
+    viewer_fields = ('is_favorited', 'is_in_shopping_cart')
+    # Counters are updated without touching updated_at.
+    counter_fields = ('favorites_count', 'in_carts_count')
 
     class Meta:
         model = Recipe
         fields = [
             'id', 'tags', 'author', 'ingredients', 'is_favorited',
-            'is_in_shopping_cart', 'name', 'image', 'text', 'cooking_time'
+            'is_in_shopping_cart', 'name', 'image', 'image_small',
+            'image_medium', 'text', 'cooking_time', 'favorites_count',
+            'in_carts_count'
+        ]
+        read_only_fields = ('favorites_count', 'in_carts_count')
+        list_serializer_class = RecipeListSerializer
+
+    def to_representation(self, instance):
+        return self.represent_many([instance])[0]
+
+    def represent_many(self, recipes):
+        request = self.context.get('request')
+        shared = representation_cache.get_many(recipes, request)
+        missing = [recipe for recipe in recipes if recipe.pk not in shared]
+        if missing:
+            shared.update(self.represent_missing(missing))
+        return [
+            self.merge_viewer_fields(shared[recipe.pk], recipe)
+            for recipe in recipes
+        ]
+
+    async def arepresent_many(self, recipes):
+        """represent_many() for async views.
+
+        Only cache misses, which query related rows and may read image
+        files, are handed to a worker thread.
+        """
+        request = self.context.get('request')
+        shared = await representation_cache.aget_many(recipes, request)
+        missing = [recipe for recipe in recipes if recipe.pk not in shared]
+        if missing:
+            shared.update(await sync_to_async(self.represent_missing)(missing))
+        return [
+            self.merge_viewer_fields(shared[recipe.pk], recipe)
+            for recipe in recipes
         ]
 
+    def represent_missing(self, recipes):
+        """Build and cache the shared representations of ``recipes``."""
+        prefetch_related_objects(recipes, *Recipe.objects.read_prefetches())
+        fresh = {
+            recipe.pk: self.shared_representation(recipe)
+            for recipe in recipes
+        }
+        representation_cache.set_many(
+            fresh, recipes, self.context.get('request'))
+        return fresh
+
+    def shared_representation(self, instance):
+        data = {}
+        for field in self._readable_fields:
+            if field.field_name in self.viewer_fields + self.counter_fields:
+                continue
+            attribute = field.get_attribute(instance)
+            data[field.field_name] = (
+                None if attribute is None
+                else field.to_representation(attribute)
+            )
+        return data
+
+    def merge_viewer_fields(self, shared, instance):
+        data = dict(shared)
+        data['author'] = dict(
+            shared['author'],
+            is_subscribed=self.get_is_author_subscribed(instance),
+        )
+        for field_name in self.viewer_fields:
+            data[field_name] = self.fields[field_name].to_representation(
+                instance)
+        for field_name in self.counter_fields:
+            data[field_name] = getattr(instance, field_name)
+        return data
+
+    def get_is_author_subscribed(self, obj):
+        if hasattr(obj, 'is_author_subscribed'):
+            return obj.is_author_subscribed
+        request = self.context.get('request')
+        if not request or request.user.is_anonymous:
+            return False
+        return Subscription.objects.filter(
+            user=request.user, author_id=obj.author_id).exists()
+
     def get_ingredients(self, obj):
-        recipe_ingredients = obj.recipe_ingredients.select_related(
-            'ingredient').all()
-        return IngredientInRecipeSerializer(recipe_ingredients, many=True).data
+        return IngredientInRecipeSerializer(
+            obj.recipe_ingredients.all(), many=True).data
 
     def get_is_favorited(self, obj):
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         request = self.context.get('request')
         if not request or request.user.is_anonymous:
             return False
         return Favorite.objects.filter(user=request.user, recipe=obj).exists()
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         request = self.context.get('request')
         if not request or request.user.is_anonymous:
             return False
@@ -73,6 +184,15 @@ class RecipeSerializer(serializers.ModelSerializer):
             user=request.user, recipe=obj).exists()
 
 
+class RecipeIdsSerializer(serializers.Serializer):
+    """Body of the bulk favorite and shopping cart requests."""
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=MAX_BULK_RECIPES,
+    )
+
+
 class RecipeIngredientWriteSerializer(serializers.Serializer):
     id = serializers.IntegerField()
     amount = serializers.IntegerField(min_value=1)
@@ -84,7 +204,9 @@ class RecipeIngredientWriteSerializer(serializers.Serializer):
         return value
 
 
-class RecipeCreateSerializer(serializers.ModelSerializer):
+class RecipeCreateSerializer(
+    TimedSerializerMixin, serializers.ModelSerializer
+):
     """Serializer for creating recipes."""
     ingredients = RecipeIngredientWriteSerializer(many=True)
     tags = serializers.PrimaryKeyRelatedField(
@@ -117,38 +239,69 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
             if item['amount'] < 1:
                 raise serializers.ValidationError(
                     'Количество ингредиента должно быть больше 0.')
+        missing = seen - set(
+            Ingredient.objects.filter(id__in=seen).values_list(
+                'id', flat=True)
+        )
+        if missing:
+            raise serializers.ValidationError(
+                'Ингредиенты не найдены: '
+                f'{", ".join(map(str, sorted(missing)))}.')
         return value
 
     def to_representation(self, instance):
         """Convert instance to dictionary for response."""
+        user = self.context['request'].user
+        instance = Recipe.objects.with_user_flags(user).get(pk=instance.pk)
         return RecipeSerializer(instance, context=self.context).data
 
+    @staticmethod
+    def save_ingredients(recipe, ingredients_data):
+        """Write only the ingredient rows that actually changed."""
+        amounts = {item['id']: item['amount'] for item in ingredients_data}
+        to_update = []
+        to_delete = []
+        for recipe_ingredient in recipe.recipe_ingredients.all():
+            amount = amounts.pop(recipe_ingredient.ingredient_id, None)
+            if amount is None:
+                to_delete.append(recipe_ingredient.id)
+            elif amount != recipe_ingredient.amount:
+                recipe_ingredient.amount = amount
+                to_update.append(recipe_ingredient)
+        if to_delete:
+            RecipeIngredient.objects.filter(id__in=to_delete).delete()
+        if to_update:
+            RecipeIngredient.objects.bulk_update(to_update, ['amount'])
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(
+                recipe=recipe,
+                ingredient_id=ingredient_id,
+                amount=amount,
+            )
+            for ingredient_id, amount in amounts.items()
+        )
+
     @transaction.atomic
     def create(self, validated_data):
         ingredients_data = validated_data.pop('ingredients')
         tags_data = validated_data.pop('tags')
         recipe = Recipe.objects.create(**validated_data)
         recipe.tags.set(tags_data)
-
-        for ingredient_data in ingredients_data:
-            RecipeIngredient.objects.create(
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(
                 recipe=recipe,
                 ingredient_id=ingredient_data['id'],
                 amount=ingredient_data['amount'],
             )
+            for ingredient_data in ingredients_data
+        )
         return recipe
 
     @transaction.atomic
     def update(self, instance, validated_data):
         if 'ingredients' in validated_data:
-            ingredients_data = validated_data.pop('ingredients')
-            instance.ingredients.clear()
-            for ingredient_data in ingredients_data:
-                RecipeIngredient.objects.create(
-                    recipe=instance,
-                    ingredient_id=ingredient_data['id'],
-                    amount=ingredient_data['amount'],
-                )
+            self.save_ingredients(
+                instance, validated_data.pop('ingredients'))
         if 'tags' in validated_data:
             tags_data = validated_data.pop('tags')
             instance.tags.set(tags_data)
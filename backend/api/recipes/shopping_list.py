@@ -0,0 +1,151 @@
+import csv
+import json
+from io import BytesIO
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Sum
+from PIL import Image, ImageDraw, ImageFont
+
+from recipes.models import RecipeIngredient
+from recipes.versions import get_version, shopping_cart_version_name
+
+SHOPPING_LIST_TITLE = "Список покупок:"
+CACHE_PREFIX = "shopping_list"
+PDF_PAGE_SIZE = (1240, 1754)
+PDF_RESOLUTION = 150
+PDF_MARGIN = 100
+PDF_FONT_SIZE = 28
+PDF_LINE_HEIGHT = 42
+
+
+def shopping_list_rows(user):
+    """Aggregated ingredients of the user's cart, in a stable order."""
+    return (
+        RecipeIngredient.objects.filter(recipe__shopping_cart__user=user)
+        .values("ingredient__name", "ingredient__measurement_unit")
+        .annotate(amount=Sum("amount"))
+        .order_by("ingredient__name", "ingredient__measurement_unit")
+        .iterator()
+    )
+
+
+def format_row(row):
+    return (
+        f"{row['ingredient__name']} - {row['amount']} "
+        f"{row['ingredient__measurement_unit']}"
+    )
+
+
+def render_txt(rows):
+    yield f"{SHOPPING_LIST_TITLE}\n"
+    for row in rows:
+        yield f"{format_row(row)}\n"
+
+
+class _Echo:
+    """File-like object that hands back whatever csv.writer writes."""
+
+    def write(self, value):
+        return value
+
+
+def render_csv(rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(("name", "measurement_unit", "amount"))
+    for row in rows:
+        yield writer.writerow((
+            row["ingredient__name"],
+            row["ingredient__measurement_unit"],
+            row["amount"],
+        ))
+
+
+def render_json(rows):
+    separator = ""
+    yield "["
+    for row in rows:
+        yield separator + json.dumps(
+            {
+                "name": row["ingredient__name"],
+                "measurement_unit": row["ingredient__measurement_unit"],
+                "amount": row["amount"],
+            },
+            ensure_ascii=False,
+        )
+        separator = ","
+    yield "]"
+
+
+def _pdf_font():
+    try:
+        return ImageFont.truetype(
+            settings.SHOPPING_LIST_PDF_FONT, PDF_FONT_SIZE
+        )
+    except OSError:
+        return ImageFont.load_default(PDF_FONT_SIZE)
+
+
+def render_pdf(rows):
+    """Draw the list onto A4 pages; PDF can only be emitted as a whole."""
+    font = _pdf_font()
+    lines_per_page = (PDF_PAGE_SIZE[1] - 2 * PDF_MARGIN) // PDF_LINE_HEIGHT
+    pages = []
+    draw = None
+    lines = (SHOPPING_LIST_TITLE, *(format_row(row) for row in rows))
+    for number, line in enumerate(lines):
+        position = number % lines_per_page
+        if position == 0:
+            page = Image.new("RGB", PDF_PAGE_SIZE, "white")
+            draw = ImageDraw.Draw(page)
+            pages.append(page)
+        draw.text(
+            (PDF_MARGIN, PDF_MARGIN + position * PDF_LINE_HEIGHT),
+            line,
+            font=font,
+            fill="black",
+        )
+    buffer = BytesIO()
+    pages[0].save(
+        buffer,
+        "PDF",
+        save_all=True,
+        append_images=pages[1:],
+        resolution=PDF_RESOLUTION,
+    )
+    yield buffer.getvalue()
+
+
+RENDERERS = {
+    "txt": render_txt,
+    "csv": render_csv,
+    "json": render_json,
+    "pdf": render_pdf,
+}
+
+
+def cache_key(user, file_format):
+    version = get_version(shopping_cart_version_name(user.id))
+    return f"{CACHE_PREFIX}:{user.id}:{version}:{file_format}"
+
+
+def render_shopping_list(user, file_format):
+    """Encoded chunks of the user's shopping list in ``file_format``."""
+    for chunk in RENDERERS[file_format](shopping_list_rows(user)):
+        yield chunk if isinstance(chunk, bytes) else chunk.encode("utf-8")
+
+
+def caching_iterator(chunks, key):
+    """Pass ``chunks`` through and cache the whole body once it is sent."""
+    body = []
+    size = 0
+    for chunk in chunks:
+        if body is not None:
+            size += len(chunk)
+            if size > settings.SHOPPING_LIST_CACHE_MAX_SIZE:
+                body = None
+            else:
+                body.append(chunk)
+        yield chunk
+    if body is not None:
+        cache.set(key, b"".join(body), settings.SHOPPING_LIST_CACHE_TIMEOUT)
@@ -1,11 +1,17 @@
 from rest_framework import serializers
 from recipes.models import Recipe
-from recipes.fields import Base64ImageField
+from recipes.fields import Base64ImageField, ImageVariantField
+from api.middleware import TimedSerializerMixin
 
 
-class ShortRecipeSerializer(serializers.ModelSerializer):
+class ShortRecipeSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     image = Base64ImageField()
+    image_small = ImageVariantField(source='image', variant='small')
+    image_medium = ImageVariantField(source='image', variant='medium')
 
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = (
+            'id', 'name', 'image', 'image_small', 'image_medium',
+            'cooking_time'
+        )
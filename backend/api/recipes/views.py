@@ -1,39 +1,108 @@
-from django.db.models import Sum
-from django.http import HttpResponse
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import Page
+from django.http import HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 
+from api.recipes import shopping_list
 from api.recipes.filters import IngredientFilter, RecipeFilter
-from api.recipes.pagination import RecipePagination
+from api.recipes.mixins import ConditionalGetMixin
+from api.recipes.pagination import (
+    FeedPagination,
+    RecipeCursorPagination,
+    RecipePagination,
+)
 from api.recipes.permissions import IsAuthorOrReadOnly
+from api.recipes.renderers import (
+    CSVRenderer,
+    JSONFileRenderer,
+    PDFRenderer,
+    PlainTextRenderer,
+)
+from recipes.autocomplete import get_index
+from recipes.feed import feed_positions
+from recipes.lists import add_recipes, remove_recipes
+from recipes.pantry import search_pantry
+from recipes.short_links import get_code
 from recipes.models import (
     Favorite,
     Ingredient,
     Recipe,
-    RecipeIngredient,
     ShoppingCart,
     Tag,
 )
+from recipes.versions import (
+    INGREDIENTS_VERSION,
+    RECIPES_VERSION,
+    TAGS_VERSION,
+    get_version,
+)
+from api.recipes.short_serializers import ShortRecipeSerializer
 from api.recipes.serializers import (
     IngredientSerializer,
     RecipeCreateSerializer,
+    RecipeIdsSerializer,
     RecipeSerializer,
     TagSerializer,
 )
 
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+def version_rows(pk):
+    """updated_at and counters of the recipe ``pk``, at most one row."""
+    return Recipe.objects.filter(pk=pk).values_list(
+        "updated_at", "favorites_count", "in_carts_count"
+    )
+
+
+def page_version(version, paginator, page):
+    """Validator of a recipe ``page`` that ``paginator`` has fetched.
+
+    ``version`` is RECIPES_VERSION, bumped by every saved or deleted
+    recipe. Favorite and cart counters change without it, so those of
+    the recipes on the page are part of the validator: activity on other
+    recipes keeps the page's ETag. Everything else comes with the page,
+    so checking it costs no query.
+    """
+    # Cursor pagination keeps a list in ``page`` and counts nothing.
+    django_page = getattr(paginator, "page", None)
+    return (
+        version,
+        (
+            django_page.paginator.count
+            if isinstance(django_page, Page)
+            else None
+        ),
+        paginator.get_next_link(),
+        paginator.get_previous_link(),
+        [
+            (
+                recipe.pk,
+                recipe.updated_at,
+                recipe.favorites_count,
+                recipe.in_carts_count,
+            )
+            for recipe in page
+        ],
+    )
+
+
+class TagViewSet(ConditionalGetMixin, viewsets.ReadOnlyModelViewSet):
     """Tag viewset."""
 
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     pagination_class = None
 
+    def get_content_version(self):
+        return get_version(TAGS_VERSION)
+
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(ConditionalGetMixin, viewsets.ReadOnlyModelViewSet):
     """Ingredient viewset."""
 
     queryset = Ingredient.objects.all()
@@ -41,14 +110,80 @@ class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
     pagination_class = None
     filterset_class = IngredientFilter
 
+    def get_content_version(self):
+        return get_version(INGREDIENTS_VERSION)
 
-class RecipeViewSet(viewsets.ModelViewSet):
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get("name", "")
+        # A blank name filters nothing, like IngredientFilter does.
+        if not name.strip():
+            return super().list(request, *args, **kwargs)
+        return self.conditional_response(self.autocomplete, request, name)
+
+    def autocomplete(self, request, name):
+        return Response(
+            get_index().search(name, settings.INGREDIENT_AUTOCOMPLETE_LIMIT)
+        )
+
+
+class RecipeViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     """Recipe viewset."""
 
+    personalized = True
+
     queryset = Recipe.objects.all()
     permission_classes = (IsAuthorOrReadOnly,)
     pagination_class = RecipePagination
     filterset_class = RecipeFilter
+    # Lookups reach the database as integers before get_object() runs.
+    lookup_value_regex = r"\d+"
+
+    def get_queryset(self):
+        # Related rows are prefetched by RecipeSerializer, and only for
+        # recipes missing from the representation cache.
+        return Recipe.objects.with_user_flags(self.request.user)
+
+    @property
+    def paginator(self):
+        if not hasattr(self, "_paginator"):
+            if RecipeCursorPagination.is_requested(self.request):
+                self._paginator = RecipeCursorPagination()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
+
+    def list(self, request, *args, **kwargs):
+        # The page validates itself: a 304 is sent once the count and the
+        # page rows are read, before any prefetch or serialization.
+        self.page = self.paginate_queryset(
+            self.filter_queryset(self.get_queryset())
+        )
+        return self.conditional_response(self.render_page, request)
+
+    def render_page(self, request):
+        serializer = self.get_serializer(self.page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    def get_content_version(self):
+        if self.action == "retrieve":
+            return self.get_version_row()
+        return page_version(
+            get_version(RECIPES_VERSION), self.paginator, self.page
+        )
+
+    def get_last_modified(self):
+        if self.action != "retrieve":
+            # A deletion leaves the latest updated_at of a list unchanged,
+            # so lists are only validated by ETag.
+            return None
+        row = self.get_version_row()
+        return row[0] if row else None
+
+    def get_version_row(self):
+        """updated_at and counters of the requested recipe, or None."""
+        if not hasattr(self, "_version_row"):
+            self._version_row = version_rows(self.kwargs["pk"]).first()
+        return self._version_row
 
     def get_serializer_class(self):
         if self.action in ("create", "partial_update"):
@@ -64,24 +199,11 @@ class RecipeViewSet(viewsets.ModelViewSet):
         permission_classes=[IsAuthenticated],
     )
     def favorite(self, request, pk):
-        user = request.user
-        recipe = get_object_or_404(Recipe, id=pk)
-        if Favorite.objects.filter(user=user, recipe=recipe).exists():
-            return Response(
-                {"errors": "Рецепт уже в favorite"},
-                status=status.HTTP_400_BAD_REQUEST,
-            )
-        Favorite.objects.create(user=user, recipe=recipe)
-        serializer = RecipeSerializer(recipe)
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
+        return self.add_to_list(Favorite, pk, "Рецепт уже в favorite")
 
     @favorite.mapping.delete
     def delete_favorite(self, request, pk):
-        user = request.user
-        recipe = get_object_or_404(Recipe, id=pk)
-        obj = get_object_or_404(Favorite, user=user, recipe=recipe)
-        obj.delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
+        return self.remove_from_list(Favorite, pk)
 
     @action(
         detail=True,
@@ -89,49 +211,199 @@ class RecipeViewSet(viewsets.ModelViewSet):
         permission_classes=[IsAuthenticated],
     )
     def shopping_cart(self, request, pk):
-        user = request.user
+        return self.add_to_list(ShoppingCart, pk, "Рецепт уже в shopping_cart")
+
+    @shopping_cart.mapping.delete
+    def delete_shopping_cart(self, request, pk):
+        return self.remove_from_list(ShoppingCart, pk)
+
+    @action(
+        detail=False,
+        methods=["put"],
+        permission_classes=[IsAuthenticated],
+        url_path="favorite",
+    )
+    def favorites(self, request):
+        """Add many recipes to favorites; already added ones are kept."""
+        return Response({
+            "added": add_recipes(Favorite, request.user, self.get_ids())
+        })
+
+    @favorites.mapping.delete
+    def delete_favorites(self, request):
+        return Response({
+            "removed": remove_recipes(Favorite, request.user, self.get_ids())
+        })
+
+    @action(
+        detail=False,
+        methods=["put"],
+        permission_classes=[IsAuthenticated],
+        url_path="shopping_cart",
+    )
+    def shopping_carts(self, request):
+        """Add many recipes to the cart; already added ones are kept."""
+        return Response({
+            "added": add_recipes(ShoppingCart, request.user, self.get_ids())
+        })
+
+    @shopping_carts.mapping.delete
+    def delete_shopping_carts(self, request):
+        return Response({
+            "removed": remove_recipes(
+                ShoppingCart, request.user, self.get_ids()
+            )
+        })
+
+    def add_to_list(self, model, pk, error):
         recipe = get_object_or_404(Recipe, id=pk)
-        if ShoppingCart.objects.filter(user=user, recipe=recipe).exists():
+        # Concurrent requests of the same user are serialised in
+        # add_recipes(), so a double click gets this error, not a 500.
+        if not add_recipes(model, self.request.user, [recipe.pk]):
             return Response(
-                {"errors": "Рецепт уже в shopping_cart"},
-                status=status.HTTP_400_BAD_REQUEST,
+                {"errors": error}, status=status.HTTP_400_BAD_REQUEST
             )
-        ShoppingCart.objects.create(user=user, recipe=recipe)
-        serializer = RecipeSerializer(recipe)
+        serializer = ShortRecipeSerializer(
+            recipe, context=self.get_serializer_context()
+        )
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
-    @shopping_cart.mapping.delete
-    def delete_shopping_cart(self, request, pk):
-        user = request.user
+    def remove_from_list(self, model, pk):
         recipe = get_object_or_404(Recipe, id=pk)
-        obj = get_object_or_404(ShoppingCart, user=user, recipe=recipe)
-        obj.delete()
+        if not remove_recipes(model, self.request.user, [recipe.pk]):
+            raise NotFound("Рецепта нет в списке.")
         return Response(status=status.HTTP_204_NO_CONTENT)
 
-    @action(detail=False, permission_classes=[IsAuthenticated])
+    def get_ids(self):
+        serializer = RecipeIdsSerializer(data=self.request.data)
+        serializer.is_valid(raise_exception=True)
+        return serializer.validated_data["recipes"]
+
+    @action(
+        detail=False,
+        permission_classes=[IsAuthenticated],
+        renderer_classes=[
+            PlainTextRenderer,
+            CSVRenderer,
+            JSONFileRenderer,
+            PDFRenderer,
+        ],
+    )
     def download_shopping_cart(self, request):
-        user = request.user
-        ingredients = (
-            RecipeIngredient.objects.filter(recipe__shopping_cart__user=user)
-            .values("ingredient__name", "ingredient__measurement_unit")
-            .annotate(amount=Sum("amount"))
+        renderer = request.accepted_renderer
+        key = shopping_list.cache_key(request.user, renderer.format)
+        content = cache.get(key)
+        if content is not None:
+            response = HttpResponse(content)
+        else:
+            response = StreamingHttpResponse(
+                shopping_list.caching_iterator(
+                    shopping_list.render_shopping_list(
+                        request.user, renderer.format
+                    ),
+                    key,
+                )
+            )
+        response["Content-Type"] = request.accepted_media_type
+        if renderer.charset:
+            response["Content-Type"] += f"; charset={renderer.charset}"
+        response["Content-Disposition"] = (
+            f'attachment; filename="shopping_list.{renderer.format}"'
         )
+        return response
 
-        shopping_list = ["Список покупок:\n"]
-        for ingredient in ingredients:
-            shopping_list.append(
-                f"{ingredient['ingredient__name']} - "
-                f"{ingredient['amount']} "
-                f"{ingredient['ingredient__measurement_unit']}\n"
+    @action(detail=False, permission_classes=[IsAuthenticated])
+    def feed(self, request):
+        """Newest recipes of the authors the user follows."""
+        paginator = FeedPagination()
+        positions = paginator.paginate_positions(
+            lambda before, limit: feed_positions(
+                request.user, before, limit
+            ),
+            request,
+        )
+        recipes = self.get_queryset().in_bulk(
+            [recipe_id for _, recipe_id in positions]
+        )
+        serializer = RecipeSerializer(
+            [
+                recipes[recipe_id] for _, recipe_id in positions
+                if recipe_id in recipes
+            ],
+            many=True,
+            context=self.get_serializer_context(),
+        )
+        return paginator.get_paginated_response(serializer.data)
+
+    @action(detail=False)
+    def pantry(self, request):
+        """Recipes cookable from the given ingredients, best covered first."""
+        matches = search_pantry(
+            self.get_pantry(request), self.get_max_missing(request)
+        )
+        paginator = RecipePagination()
+        page = paginator.paginate_queryset(matches, request, view=self)
+        recipes = self.get_queryset().in_bulk(
+            [match.recipe_id for match in page]
+        )
+        # Recipes deleted since the index was refreshed are skipped.
+        page = [match for match in page if match.recipe_id in recipes]
+        data = RecipeSerializer(
+            [recipes[match.recipe_id] for match in page],
+            many=True,
+            context=self.get_serializer_context(),
+        ).data
+        for item, match in zip(data, page):
+            item["covered_count"] = match.covered
+            item["missing_count"] = match.missing
+        return paginator.get_paginated_response(data)
+
+    @staticmethod
+    def get_pantry(request):
+        try:
+            pantry = {
+                int(value)
+                for values in request.query_params.getlist("ingredients")
+                for value in values.split(",")
+                if value.strip()
+            }
+        except ValueError:
+            raise ValidationError(
+                {"ingredients": "Ингредиенты задаются списком id."}
             )
+        if not pantry:
+            raise ValidationError(
+                {"ingredients": "Укажите хотя бы один ингредиент."}
+            )
+        return pantry
+
+    @staticmethod
+    def get_max_missing(request):
+        try:
+            max_missing = int(request.query_params["max_missing"])
+        except (KeyError, ValueError):
+            return settings.PANTRY_MAX_MISSING
+        return max(max_missing, 0)
 
-        response = HttpResponse(
-            "".join(shopping_list), content_type="text/plain"
+    @action(detail=True)
+    def similar(self, request, pk=None):
+        """Recipes most similar to this one, from the precomputed table."""
+        try:
+            limit = int(request.query_params["limit"])
+        except (KeyError, ValueError):
+            limit = settings.SIMILAR_RECIPES_LIMIT
+        # One range scan of recipe_similarity_score_idx joined to recipes.
+        recipes = list(
+            self.get_queryset()
+            .filter(similar_to__recipe_id=pk)
+            .order_by("-similar_to__score")[:max(limit, 0)]
         )
-        response["Content-Disposition"] = (
-            'attachment; filename="shopping_list.txt"'
+        if not recipes:
+            get_object_or_404(Recipe, pk=pk)
+        serializer = RecipeSerializer(
+            recipes, many=True, context=self.get_serializer_context()
         )
-        return response
+        return Response(serializer.data)
 
     @action(detail=True,
             methods=['get'],
@@ -139,6 +411,8 @@ class RecipeViewSet(viewsets.ModelViewSet):
             url_path='get-link'
             )
     def get_link(self, request, pk=None):
-        recipe = self.get_object()
-        short_link = request.build_absolute_uri(f'/recipes/{recipe.id}/')
+        code = get_code(pk)
+        if code is None:
+            raise NotFound()
+        short_link = request.build_absolute_uri(f'/s/{code}')
         return Response({'short-link': short_link})
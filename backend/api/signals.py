@@ -0,0 +1,10 @@
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+from api.middleware import record_query
+
+
+@receiver(connection_created)
+def count_queries(sender, connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
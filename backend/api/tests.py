@@ -0,0 +1,1023 @@
+import base64
+import io
+import json
+import math
+import shutil
+import tempfile
+from datetime import timedelta
+from unittest import mock
+from urllib.parse import quote
+
+import numpy as np
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from api.recipes import async_views, filters
+from api.recipes.serializers import RecipeCreateSerializer
+from recipes import fake_data, pantry, similarity
+from recipes.autocomplete import IngredientIndex
+from recipes.management.commands.import_ingredients import iter_ingredients
+from recipes.models import (
+    Favorite,
+    FeedEntry,
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    RecipeSimilarity,
+    ShoppingCart,
+    Tag,
+)
+from recipes.versions import RECIPE_INGREDIENTS_VERSION, bump_version
+from users.authentication import token_cache
+from users.models import Subscription, User
+
+MEDIA_ROOT = tempfile.mkdtemp()
+RECIPES = 60
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, IMAGE_DERIVATIVES_ASYNC=False)
+class RecipeAPITestCase(TestCase):
+    """Recipes with ingredients, tags, favorites and cart entries."""
+
+    @classmethod
+    def setUpTestData(cls):
+        image = fake_data.placeholder_images()[0]
+        cls.author = User.objects.create_user(
+            username="author", email="author@example.com", password="pass"
+        )
+        cls.user = User.objects.create_user(
+            username="user", email="user@example.com", password="pass"
+        )
+        cls.tags = [
+            Tag.objects.create(name=name, color=color, slug=slug)
+            for name, color, slug in fake_data.TAGS[:3]
+        ]
+        ingredient = Ingredient.objects.create(
+            name="соль", measurement_unit="г"
+        )
+        cls.recipes = []
+        for number in range(RECIPES):
+            recipe = Recipe.objects.create(
+                author=cls.author,
+                name=f"Рецепт {number}",
+                text="Описание.",
+                image=image,
+                cooking_time=10,
+            )
+            RecipeIngredient.objects.create(
+                recipe=recipe, ingredient=ingredient, amount=5
+            )
+            recipe.tags.set(cls.tags[:number % 3 + 1])
+            cls.recipes.append(recipe)
+        for recipe in cls.recipes[::2]:
+            Favorite.objects.create(user=cls.user, recipe=recipe)
+        for recipe in cls.recipes[::3]:
+            ShoppingCart.objects.create(user=cls.user, recipe=recipe)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        token_cache.clear()
+        self.anonymous = APIClient()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def get(self, client, path):
+        """GET ``path`` with nothing cached."""
+        cache.clear()
+        response = client.get(path)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def assertSameQueries(self, client, *paths):
+        """GETs of all ``paths`` run as many queries as the first one."""
+        with CaptureQueriesContext(connection) as first:
+            self.get(client, paths[0])
+        for path in paths[1:]:
+            with self.subTest(path=path), self.assertNumQueries(len(first)):
+                self.get(client, path)
+
+
+class RecipeListQueriesTest(RecipeAPITestCase):
+
+    def test_queries_do_not_depend_on_page_size_for_user(self):
+        self.assertSameQueries(
+            self.client,
+            "/api/recipes/?limit=1",
+            "/api/recipes/?limit=50",
+            "/api/recipes/?limit=50&page=2",
+        )
+
+    def test_queries_do_not_depend_on_page_size_for_anonymous(self):
+        self.assertSameQueries(
+            self.anonymous, "/api/recipes/?limit=1", "/api/recipes/?limit=50"
+        )
+
+    def test_flags_of_user(self):
+        results = self.get(
+            self.client, f"/api/recipes/?limit={RECIPES}"
+        ).json()["results"]
+        favorited = {recipe.pk for recipe in self.recipes[::2]}
+        in_cart = {recipe.pk for recipe in self.recipes[::3]}
+        self.assertEqual(len(results), RECIPES)
+        for item in results:
+            self.assertEqual(item["is_favorited"], item["id"] in favorited)
+            self.assertEqual(
+                item["is_in_shopping_cart"], item["id"] in in_cart
+            )
+
+    def test_flags_of_anonymous(self):
+        results = self.get(
+            self.anonymous, f"/api/recipes/?limit={RECIPES}"
+        ).json()["results"]
+        self.assertFalse(any(item["is_favorited"] for item in results))
+        self.assertFalse(
+            any(item["is_in_shopping_cart"] for item in results)
+        )
+
+
+class RecipeTagFilterTest(RecipeAPITestCase):
+
+    def ids(self, path):
+        """Ids of the recipes on every page of ``path``, in order."""
+        ids = []
+        while path:
+            data = self.get(self.anonymous, path).json()
+            ids += [item["id"] for item in data["results"]]
+            path = data["next"]
+        return ids
+
+    def test_recipe_with_several_tags_is_listed_once(self):
+        first, second, third = (tag.slug for tag in self.tags)
+        ids = self.ids(
+            f"/api/recipes/?tags={first}&tags={second}&tags={third}&limit=7"
+        )
+        self.assertEqual(len(ids), len(set(ids)))
+        self.assertEqual(set(ids), {recipe.pk for recipe in self.recipes})
+
+    def test_only_tagged_recipes(self):
+        # Recipe number n carries the first n % 3 + 1 tags.
+        ids = self.ids(f"/api/recipes/?tags={self.tags[2].slug}&limit=7")
+        self.assertEqual(
+            sorted(ids),
+            [recipe.pk for recipe in self.recipes[2::3]],
+        )
+
+    def test_queries_do_not_depend_on_tags(self):
+        first, second, third = (tag.slug for tag in self.tags)
+        self.assertSameQueries(
+            self.anonymous,
+            f"/api/recipes/?tags={first}",
+            f"/api/recipes/?tags={first}&tags={second}&tags={third}",
+        )
+
+    def test_tag_deleted_after_validation(self):
+        tag = self.tags[2]
+        newer = {
+            slug: pk
+            for slug, pk in filters.tag_ids_by_slug().items()
+            if slug != tag.slug
+        }
+        validated_filter = filters.TagFilter.filter
+
+        def filter_after_deletion(*args):
+            # Validation saw the tag; filtering sees a newer map.
+            with mock.patch.object(
+                filters, "tag_ids_by_slug", return_value=newer
+            ):
+                return validated_filter(*args)
+
+        with mock.patch.object(
+            filters.TagFilter, "filter", filter_after_deletion
+        ):
+            response = self.anonymous.get(f"/api/recipes/?tags={tag.slug}")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["count"], 0)
+
+
+class RecipeListETagTest(RecipeAPITestCase):
+
+    def etag(self, path):
+        # Clearing the cache would reset the version counters in the ETag.
+        response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        return response["ETag"]
+
+    def favorite_by_author(self, recipe):
+        client = APIClient()
+        client.force_authenticate(self.author)
+        path = f"/api/recipes/{recipe.pk}/favorite/"
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(client.post(path).status_code, 201)
+
+    def assertFavoritesChangeETag(self, path):
+        etag = self.etag(path)
+        # The newest recipe comes first; the oldest is on another page.
+        self.favorite_by_author(self.recipes[0])
+        self.assertEqual(self.etag(path), etag)
+        self.favorite_by_author(self.recipes[-1])
+        self.assertNotEqual(self.etag(path), etag)
+
+    def test_favorites_of_others(self):
+        self.assertFavoritesChangeETag("/api/recipes/?limit=1")
+
+    def test_favorites_of_others_with_cursor(self):
+        self.assertFavoritesChangeETag(
+            "/api/recipes/?pagination=cursor&limit=1"
+        )
+
+    def test_own_favorite_changes_etag(self):
+        path = "/api/recipes/?limit=1"
+        etag = self.etag(path)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                f"/api/recipes/{self.recipes[1].pk}/favorite/"
+            )
+        self.assertEqual(response.status_code, 201)
+        self.assertNotEqual(self.etag(path), etag)
+
+    def test_saved_recipe_changes_etag(self):
+        path = "/api/recipes/?limit=1"
+        etag = self.etag(path)
+        recipe = self.recipes[-1]
+        recipe.name = "Другое название"
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.save()
+        self.assertNotEqual(self.etag(path), etag)
+
+    def test_cursor_validator_counts_nothing(self):
+        path = "/api/recipes/?pagination=cursor&limit=6"
+        cache.clear()
+        with self.assertNumQueries(4):
+            etag = self.anonymous.get(path)["ETag"]
+        with self.assertNumQueries(1):
+            response = self.anonymous.get(path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_search_rejects_cursor(self):
+        response = self.anonymous.get(
+            "/api/recipes/?pagination=cursor&search=соль"
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("search", response.json())
+
+    def test_list_paginates_once(self):
+        # The count and the page rows are the only queries a revalidation
+        # runs; a full response adds the prefetches of the serializer.
+        path = "/api/recipes/?limit=6"
+        cache.clear()
+        with self.assertNumQueries(5):
+            etag = self.anonymous.get(path)["ETag"]
+        with self.assertNumQueries(2):
+            response = self.anonymous.get(path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+
+class RecipeListActionsTest(RecipeAPITestCase):
+
+    def assertListAction(self, action, model, counter):
+        recipe = self.recipes[1]
+        path = f"/api/recipes/{recipe.pk}/{action}/"
+        before = getattr(recipe, counter)
+
+        response = self.client.post(path)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            set(response.json()),
+            {"id", "name", "image", "image_small", "image_medium",
+             "cooking_time"},
+        )
+        self.assertEqual(response.json()["id"], recipe.pk)
+        self.assertTrue(
+            model.objects.filter(user=self.user, recipe=recipe).exists()
+        )
+        recipe.refresh_from_db()
+        self.assertEqual(getattr(recipe, counter), before + 1)
+        self.assertEqual(self.client.post(path).status_code, 400)
+
+        self.assertEqual(self.client.delete(path).status_code, 204)
+        self.assertFalse(
+            model.objects.filter(user=self.user, recipe=recipe).exists()
+        )
+        recipe.refresh_from_db()
+        self.assertEqual(getattr(recipe, counter), before)
+        self.assertEqual(self.client.delete(path).status_code, 404)
+
+    def test_favorite(self):
+        self.assertListAction("favorite", Favorite, "favorites_count")
+
+    def test_shopping_cart(self):
+        self.assertListAction(
+            "shopping_cart", ShoppingCart, "in_carts_count"
+        )
+
+    def test_bulk_removal(self):
+        recipes = self.recipes[:7]
+        Favorite.objects.create(user=self.author, recipe=recipes[0])
+        ids = [recipe.pk for recipe in recipes]
+        path = "/api/recipes/?is_favorited=1&limit=1"
+        etag = self.client.get(path)["ETag"]
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.delete(
+                "/api/recipes/favorite/", {"recipes": ids}, format="json"
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["removed"], ids[::2])
+        self.assertFalse(
+            Favorite.objects.filter(user=self.user, recipe_id__in=ids)
+        )
+        self.assertTrue(
+            Favorite.objects.filter(user=self.author, recipe=recipes[0])
+        )
+        counts = dict(
+            Recipe.objects.filter(pk__in=ids)
+            .values_list("pk", "favorites_count")
+        )
+        self.assertEqual(counts, {pk: int(pk == ids[0]) for pk in ids})
+        self.assertNotEqual(self.client.get(path)["ETag"], etag)
+
+    def test_anonymous_is_rejected(self):
+        path = f"/api/recipes/{self.recipes[1].pk}/favorite/"
+        self.assertEqual(self.anonymous.post(path).status_code, 401)
+
+    def test_missing_recipe(self):
+        self.assertEqual(
+            self.client.post("/api/recipes/0/favorite/").status_code, 404
+        )
+
+    def test_flag_follows_action(self):
+        recipe = self.recipes[1]
+        path = f"/api/recipes/{recipe.pk}/"
+        self.assertFalse(self.get(self.client, path).json()["is_favorited"])
+        self.client.post(f"{path}favorite/")
+        self.assertTrue(self.get(self.client, path).json()["is_favorited"])
+
+
+class AsgiRecipeViewsTest(RecipeAPITestCase):
+
+    def asgi_get(self, path):
+        cache.clear()
+        response = async_to_sync(self.async_client.get)(path)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def assertSameResponse(self, path, view):
+        response = self.asgi_get(path)
+        self.assertIs(response.resolver_match.func, view)
+        # Clearing the cache again would reset the versions in the ETag.
+        expected = self.anonymous.get(path)
+        self.assertIsNot(expected.resolver_match.func, view)
+        self.assertEqual(response.json(), expected.json())
+        self.assertEqual(response["ETag"], expected["ETag"])
+
+    def test_recipe_list(self):
+        self.assertSameResponse(
+            f"/api/recipes/?tags={self.tags[1].slug}&limit=5&page=2",
+            async_views.recipe_list,
+        )
+
+    def test_recipe_detail(self):
+        self.assertSameResponse(
+            f"/api/recipes/{self.recipes[0].pk}/", async_views.recipe_detail
+        )
+
+    def test_tag_list(self):
+        self.assertSameResponse("/api/tags/", async_views.tag_list)
+
+    @override_settings(INGREDIENT_AUTOCOMPLETE_LIMIT=1)
+    def test_ingredient_list(self):
+        Ingredient.objects.create(name="перец", measurement_unit="г")
+        for path in (
+            "/api/ingredients/",
+            "/api/ingredients/?name=",
+            "/api/ingredients/?name=%20",
+            "/api/ingredients/?name=" + quote("СО"),
+        ):
+            with self.subTest(path=path):
+                self.assertSameResponse(path, async_views.ingredient_list)
+
+    def test_errors(self):
+        for path, status in (
+            ("/api/recipes/?page=100", 404),
+            ("/api/recipes/?tags=missing", 400),
+        ):
+            with self.subTest(path=path):
+                response = async_to_sync(self.async_client.get)(path)
+                expected = self.anonymous.get(path)
+                self.assertEqual(response.status_code, status)
+                self.assertEqual(expected.status_code, status)
+                self.assertEqual(response.json(), expected.json())
+
+
+class ServerTimingTest(RecipeAPITestCase):
+
+    def timing(self, **headers):
+        response = self.anonymous.get("/api/recipes/", headers=headers)
+        self.assertEqual(response.status_code, 200)
+        return response.get("Server-Timing")
+
+    def test_allowed_address(self):
+        timing = self.timing()
+        self.assertIn("serialize;dur=", timing)
+        self.assertNotIn("serialize;dur=0.0,", timing)
+
+    @override_settings(METRICS_ALLOWED_IPS=["10.0.0.0/8"])
+    def test_other_address(self):
+        self.assertIsNone(self.timing())
+
+    def test_client_behind_proxy(self):
+        self.assertIsNone(self.timing(x_real_ip="203.0.113.7"))
+        self.assertIsNotNone(self.timing(x_real_ip="10.1.2.3"))
+
+    @override_settings(DEBUG=True, METRICS_ALLOWED_IPS=["10.0.0.0/8"])
+    def test_debug(self):
+        self.assertIsNotNone(self.timing(x_real_ip="203.0.113.7"))
+
+
+class CounterSaveTest(RecipeAPITestCase):
+
+    def test_recipe_save_keeps_counters(self):
+        recipe = Recipe.objects.get(pk=self.recipes[1].pk)
+        Favorite.objects.create(user=self.author, recipe=recipe)
+        recipe.name = "Новое название"
+        recipe.save()
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.name, "Новое название")
+        self.assertEqual(recipe.favorites_count, 1)
+
+    def test_patch_keeps_counters(self):
+        client = APIClient()
+        client.force_authenticate(self.author)
+        recipe = self.recipes[1]
+        update = RecipeCreateSerializer.update
+
+        def favorite_then_update(serializer, instance, validated_data):
+            # The recipe has been loaded when a favorite comes in.
+            Favorite.objects.create(user=self.user, recipe=recipe)
+            return update(serializer, instance, validated_data)
+
+        with mock.patch.object(
+            RecipeCreateSerializer, "update", favorite_then_update
+        ):
+            response = client.patch(
+                f"/api/recipes/{recipe.pk}/",
+                {"name": "Новое название"},
+                format="json",
+            )
+        self.assertEqual(response.status_code, 200)
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.favorites_count, 1)
+
+    def test_user_save_keeps_counters(self):
+        user = User.objects.get(pk=self.author.pk)
+        Subscription.objects.create(user=self.user, author=self.author)
+        user.first_name = "Имя"
+        user.save()
+        user.refresh_from_db()
+        self.assertEqual(user.first_name, "Имя")
+        self.assertEqual(user.followers_count, 1)
+        self.assertEqual(user.recipes_count, RECIPES)
+
+
+class CurrentUserTest(RecipeAPITestCase):
+
+    def token_client(self, user):
+        """Client of ``user`` whose token is in the token cache."""
+        self.token = Token.objects.create(user=user)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f"Token {self.token.key}")
+        self.assertEqual(client.get("/api/users/me/").status_code, 200)
+        return client
+
+    def assertFollowersKept(self, user):
+        user.refresh_from_db()
+        self.assertEqual(user.followers_count, 1)
+
+    def follow(self, author):
+        Subscription.objects.create(user=self.user, author=author)
+
+    def test_counters_are_fresh_with_cached_token(self):
+        client = self.token_client(self.author)
+        Recipe.objects.filter(pk=self.recipes[0].pk).delete()
+        # The token is cached now: one query re-reads the user.
+        with self.assertNumQueries(1):
+            response = client.get("/api/users/me/")
+        self.assertEqual(response.json()["recipes_count"], RECIPES - 1)
+
+    def test_set_password_keeps_counters(self):
+        client = self.token_client(self.author)
+        self.follow(self.author)
+        response = client.post(
+            "/api/users/set_password/",
+            {"current_password": "pass", "new_password": "new-pass-123"},
+        )
+        self.assertEqual(response.status_code, 204)
+        self.assertFollowersKept(self.author)
+        self.author.refresh_from_db()
+        self.assertTrue(self.author.check_password("new-pass-123"))
+        self.assertIsNone(token_cache.get(self.token.key))
+
+    def test_set_password_checks_current_password(self):
+        client = self.token_client(self.author)
+        response = client.post(
+            "/api/users/set_password/",
+            {"current_password": "wrong", "new_password": "new-pass-123"},
+        )
+        self.assertEqual(response.status_code, 400)
+        self.author.refresh_from_db()
+        self.assertTrue(self.author.check_password("pass"))
+
+    def test_avatar_keeps_counters(self):
+        client = self.token_client(self.author)
+        self.follow(self.author)
+        image = io.BytesIO()
+        Image.new("RGB", (8, 8), "red").save(image, "PNG")
+        response = client.put(
+            "/api/users/me/avatar/",
+            {
+                "avatar": "data:image/png;base64,"
+                + base64.b64encode(image.getvalue()).decode()
+            },
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertFollowersKept(self.author)
+        self.assertTrue(self.author.avatar)
+
+        response = client.delete("/api/users/me/avatar/")
+        self.assertEqual(response.status_code, 204)
+        self.assertFollowersKept(self.author)
+        self.assertFalse(self.author.avatar)
+
+
+class PantryIndexTest(SimpleTestCase):
+    """Incremental updates give the results of an index built afresh."""
+
+    RECIPES = {1: [1, 2], 2: [1, 2, 3], 3: [3, 4], 4: [5]}
+
+    def index(self, recipes):
+        pairs = [
+            (recipe_id, ingredient_id)
+            for recipe_id, ingredient_ids in recipes.items()
+            for ingredient_id in ingredient_ids
+        ]
+        return pantry.PantryIndex(np.array(pairs, dtype=np.int64), None)
+
+    def search(self, index, ingredient_ids, max_missing):
+        return index.search(ingredient_ids, max_missing)[:]
+
+    def assertSameResults(self, index, recipes):
+        fresh = self.index(recipes)
+        for ingredient_ids in ([1], [1, 2], [1, 2, 3], [3, 4, 5], [6]):
+            for max_missing in (0, 1, 2):
+                with self.subTest(
+                    ingredients=ingredient_ids, max_missing=max_missing
+                ):
+                    self.assertEqual(
+                        self.search(index, ingredient_ids, max_missing),
+                        self.search(fresh, ingredient_ids, max_missing),
+                    )
+
+    def test_ranking(self):
+        # Full coverage first, newest first among equals; recipe 4 shares
+        # no ingredient with the pantry.
+        self.assertEqual(
+            self.search(self.index(self.RECIPES), [1, 2, 3], 1),
+            [
+                pantry.PantryMatch(2, 3, 0),
+                pantry.PantryMatch(1, 2, 0),
+                pantry.PantryMatch(3, 1, 1),
+            ],
+        )
+
+    def test_max_missing(self):
+        index = self.index(self.RECIPES)
+        self.assertEqual(
+            [match.recipe_id for match in self.search(index, [1, 3], 0)],
+            [],
+        )
+        self.assertEqual(
+            [match.recipe_id for match in self.search(index, [1, 3], 1)],
+            [2, 3, 1],
+        )
+
+    def assertUpdates(self):
+        index = self.index(self.RECIPES)
+        recipes = dict(self.RECIPES)
+        for changes in (
+            {1: [4, 5]},
+            {5: [1]},
+            {1: [1], 3: []},
+            {1: [2, 3]},
+        ):
+            index.update(changes)
+            recipes.update(changes)
+            self.assertSameResults(index, recipes)
+        return index
+
+    def test_updates_with_tombstones(self):
+        with mock.patch.object(pantry, "COMPACT_RATIO", 100):
+            index = self.assertUpdates()
+        self.assertFalse(index.alive.all())
+        # Recipe 1, edited three times, has only its last postings left.
+        extra = index.extra_recipes == index.positions[1]
+        self.assertEqual(
+            sorted(index.extra_ingredients[extra].tolist()), [2, 3]
+        )
+
+    def test_updates_with_compaction(self):
+        with mock.patch.object(pantry, "COMPACT_RATIO", 0):
+            index = self.assertUpdates()
+        self.assertTrue(index.alive.all())
+        self.assertEqual(len(index.extra_recipes), 0)
+
+
+class PantrySearchTest(RecipeAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        pantry._index = None
+        self.flour, self.milk, self.eggs = [
+            Ingredient.objects.create(name=name, measurement_unit="г")
+            for name in ("мука", "молоко", "яйца")
+        ]
+        self.pancakes = self.create_recipe(self.flour, self.milk, self.eggs)
+        self.porridge = self.create_recipe(self.milk)
+
+    def create_recipe(self, *ingredients):
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe = Recipe.objects.create(
+                author=self.author,
+                name="Рецепт",
+                text="Описание.",
+                image=self.recipes[0].image,
+                cooking_time=10,
+            )
+            self.set_ingredients(recipe, *ingredients)
+        return recipe
+
+    def set_ingredients(self, recipe, *ingredients):
+        # As the API does: ingredient rows in bulk, then the recipe saved.
+        with self.captureOnCommitCallbacks(execute=True):
+            RecipeIngredient.objects.filter(recipe=recipe).delete()
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(
+                    recipe=recipe, ingredient=ingredient, amount=1
+                )
+                for ingredient in ingredients
+            )
+            recipe.save()
+
+    def matches(self, *ingredients, max_missing=2):
+        response = self.anonymous.get(
+            "/api/recipes/pantry/",
+            {
+                "ingredients": ",".join(
+                    str(ingredient.pk) for ingredient in ingredients
+                ),
+                "max_missing": max_missing,
+                "limit": RECIPES,
+            },
+        )
+        self.assertEqual(response.status_code, 200)
+        return [
+            (item["id"], item["covered_count"], item["missing_count"])
+            for item in response.json()["results"]
+        ]
+
+    def test_ranking(self):
+        self.assertEqual(
+            self.matches(self.milk),
+            [(self.porridge.pk, 1, 0), (self.pancakes.pk, 1, 2)],
+        )
+        self.assertEqual(
+            self.matches(self.milk, max_missing=1), [(self.porridge.pk, 1, 0)]
+        )
+
+    def test_edited_ingredients(self):
+        self.matches(self.milk)
+        self.set_ingredients(self.porridge, self.flour)
+        self.assertEqual(
+            self.matches(self.milk), [(self.pancakes.pk, 1, 2)]
+        )
+        self.assertEqual(
+            self.matches(self.flour),
+            [(self.porridge.pk, 1, 0), (self.pancakes.pk, 1, 2)],
+        )
+
+    def test_added_recipe(self):
+        self.matches(self.milk)
+        omelette = self.create_recipe(self.milk, self.eggs)
+        self.assertEqual(
+            self.matches(self.milk, self.eggs),
+            [
+                (omelette.pk, 2, 0),
+                (self.porridge.pk, 1, 0),
+                (self.pancakes.pk, 2, 1),
+            ],
+        )
+
+    def test_deleted_recipe(self):
+        self.matches(self.milk)
+        index = pantry._index
+        with self.captureOnCommitCallbacks(execute=True):
+            self.porridge.delete()
+        self.assertEqual(
+            self.matches(self.milk), [(self.pancakes.pk, 1, 2)]
+        )
+        self.assertIsNot(pantry._index, index)
+
+    def test_late_commit_within_overlap(self):
+        self.matches(self.milk)
+        # A transaction that saved the recipe before the last refresh but
+        # committed after it.
+        RecipeIngredient.objects.create(
+            recipe=self.porridge, ingredient=self.eggs, amount=1
+        )
+        Recipe.objects.filter(pk=self.porridge.pk).update(
+            updated_at=pantry._index.watermark - timedelta(seconds=30)
+        )
+        bump_version(RECIPE_INGREDIENTS_VERSION)
+        self.assertEqual(
+            self.matches(self.milk, self.eggs),
+            [(self.porridge.pk, 2, 0), (self.pancakes.pk, 2, 1)],
+        )
+
+
+class FeatureMatrixTest(SimpleTestCase):
+
+    def test_scores(self):
+        # Ingredients only: recipes 1 and 2 use 10 and 11, recipe 3 uses
+        # 11 and 12, recipe 4 uses 12.
+        ingredients = np.array(
+            [(1, 10), (1, 11), (2, 10), (2, 11), (3, 11), (3, 12), (4, 12)],
+            dtype=np.int64,
+        )
+        none = np.empty((0, 2), dtype=np.int64)
+        matrix = similarity.FeatureMatrix(
+            np.array([1, 2, 3, 4], dtype=np.int64), [ingredients, none, none]
+        )
+        sources, targets, scores = matrix.scores(np.arange(4))
+        # Idf of an ingredient used by two of four recipes, and by three.
+        rare, common = math.log(4 / 2), math.log(4 / 3)
+        norm = rare ** 2 + common ** 2
+        expected = {
+            (1, 2): 1,
+            (1, 3): common ** 2 / norm,
+            (2, 1): 1,
+            (2, 3): common ** 2 / norm,
+            (3, 4): rare / math.sqrt(norm),
+            (3, 1): common ** 2 / norm,
+            (3, 2): common ** 2 / norm,
+            (4, 3): rare / math.sqrt(norm),
+        }
+        recipe_ids = matrix.recipe_ids
+        pairs = list(
+            zip(recipe_ids[sources].tolist(), recipe_ids[targets].tolist())
+        )
+        # Grouped by source, best first.
+        self.assertEqual(pairs, list(expected))
+        for pair, score in zip(pairs, scores.tolist()):
+            with self.subTest(pair=pair):
+                self.assertAlmostEqual(score, expected[pair])
+
+
+class RefreshSimilaritiesTest(RecipeAPITestCase):
+
+    def similarities(self):
+        return {
+            (recipe_id, similar_recipe_id, round(score, 9))
+            for recipe_id, similar_recipe_id, score in (
+                RecipeSimilarity.objects.values_list(
+                    "recipe_id", "similar_recipe_id", "score"
+                )
+            )
+        }
+
+    def create_recipe(self, ingredient):
+        recipe = Recipe.objects.create(
+            author=self.author,
+            name="Рецепт",
+            text="Описание.",
+            image=self.recipes[0].image,
+            cooking_time=10,
+        )
+        RecipeIngredient.objects.create(
+            recipe=recipe, ingredient=ingredient, amount=1
+        )
+        return recipe
+
+    def test_incremental_matches_full(self):
+        pepper, onion, garlic = [
+            Ingredient.objects.create(name=name, measurement_unit="г")
+            for name in ("перец", "лук", "чеснок")
+        ]
+        # Neighbours through pepper alone.
+        self.create_recipe(pepper)
+        lost_neighbour = self.create_recipe(pepper)
+        # Every neighbour is kept, so ties at the cut cannot differ.
+        similarity.refresh_similarities(k=RECIPES)
+        self.assertEqual(similarity.refresh_similarities(k=RECIPES), (0, 0))
+        # Changes that keep the number of recipes: their count enters
+        # every weight, and only --full recomputes all of them.
+        # Its former neighbour is only found through the stored rows.
+        lost_neighbour.recipe_ingredients.update(ingredient=onion)
+        for recipe in self.recipes[5:8:2]:
+            RecipeIngredient.objects.create(
+                recipe=recipe, ingredient=garlic, amount=1
+            )
+        for recipe in self.recipes[1:5:3]:
+            Favorite.objects.create(user=self.author, recipe=recipe)
+        ShoppingCart.objects.filter(
+            user=self.user, recipe=self.recipes[3]
+        ).delete()
+        RecipeIngredient.objects.filter(recipe=self.recipes[9]).delete()
+
+        similarity.refresh_similarities(k=RECIPES)
+        incremental = self.similarities()
+        similarity.refresh_similarities(k=RECIPES, full=True)
+        self.assertEqual(incremental, self.similarities())
+
+
+class FeedTest(RecipeAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.reader = User.objects.create_user(
+            username="reader", email="reader@example.com", password="pass"
+        )
+
+    def feed(self):
+        response = self.client.get("/api/recipes/feed/", {"limit": 100})
+        self.assertEqual(response.status_code, 200)
+        return [item["id"] for item in response.json()["results"]]
+
+    def timeline(self):
+        return set(
+            FeedEntry.objects.filter(user=self.user).values_list(
+                "recipe_id", flat=True
+            )
+        )
+
+    def publish(self):
+        return Recipe.objects.create(
+            author=self.author,
+            name="Новый рецепт",
+            text="Описание.",
+            image=self.recipes[0].image,
+            cooking_time=10,
+        )
+
+    def newest_first(self, recipes):
+        return [recipe.pk for recipe in reversed(recipes)]
+
+    def test_fan_out(self):
+        Subscription.objects.create(user=self.user, author=self.author)
+        # Following an author copies their recipes into the timeline.
+        self.assertEqual(
+            self.timeline(), {recipe.pk for recipe in self.recipes}
+        )
+        recipe = self.publish()
+        self.assertIn(recipe.pk, self.timeline())
+        self.assertEqual(
+            self.feed(), self.newest_first([*self.recipes, recipe])
+        )
+
+    def test_clean_up(self):
+        Subscription.objects.create(user=self.user, author=self.author)
+        Subscription.objects.get(user=self.user, author=self.author).delete()
+        self.assertEqual(self.timeline(), set())
+        self.assertEqual(self.feed(), [])
+
+    @override_settings(FEED_FANOUT_MAX_FOLLOWERS=2)
+    def test_popular_author(self):
+        Subscription.objects.create(user=self.reader, author=self.author)
+        Subscription.objects.create(user=self.user, author=self.author)
+        # Recipes of popular authors are read directly.
+        recipe = self.publish()
+        self.assertNotIn(recipe.pk, self.timeline())
+        expected = self.newest_first([*self.recipes, recipe])
+        self.assertEqual(self.feed(), expected)
+        # Back below the threshold, the timeline has to hold them all.
+        Subscription.objects.get(
+            user=self.reader, author=self.author
+        ).delete()
+        self.assertEqual(set(expected), self.timeline())
+        self.assertEqual(self.feed(), expected)
+
+
+class IngredientIndexTest(SimpleTestCase):
+
+    def setUp(self):
+        self.index = IngredientIndex(
+            {"id": pk, "name": name, "measurement_unit": "г"}
+            for pk, name in enumerate(
+                (
+                    "Морская соль",
+                    "Соль",
+                    "Свёкла",
+                    "Соль крупная",
+                    "Сахар",
+                    "Перец",
+                ),
+                start=1,
+            )
+        )
+
+    def names(self, query, limit=10):
+        return [item["name"] for item in self.index.search(query, limit)]
+
+    def test_prefix_matches_first(self):
+        self.assertEqual(
+            self.names("соль"), ["Соль", "Соль крупная", "Морская соль"]
+        )
+
+    def test_folding(self):
+        for query in ("свекла", "СВЁК", " Свек "):
+            with self.subTest(query=query):
+                self.assertEqual(self.names(query), ["Свёкла"])
+
+    def test_limit(self):
+        self.assertEqual(self.names("соль", 2), ["Соль", "Соль крупная"])
+        self.assertEqual(self.names("с", 1), ["Сахар"])
+        self.assertEqual(len(self.names("", 4)), 4)
+
+
+class IngredientListTest(RecipeAPITestCase):
+
+    @override_settings(INGREDIENT_AUTOCOMPLETE_LIMIT=1)
+    def test_blank_name_lists_everything(self):
+        Ingredient.objects.create(name="перец", measurement_unit="г")
+        expected = self.get(self.anonymous, "/api/ingredients/").json()
+        self.assertEqual(len(expected), 2)
+        for name in ("", " "):
+            with self.subTest(name=name):
+                response = self.get(
+                    self.anonymous, f"/api/ingredients/?name={name}"
+                )
+                self.assertEqual(response.json(), expected)
+
+
+class IngredientParserTest(SimpleTestCase):
+
+    ITEMS = [
+        {"name": "Соль морская", "measurement_unit": "г"},
+        {"name": "Ёрш", "measurement_unit": "шт."},
+        {"name": "Молоко", "measurement_unit": "мл"},
+    ]
+
+    def parse(self, text, file_format):
+        return [
+            {
+                "name": ingredient.name,
+                "measurement_unit": ingredient.measurement_unit,
+            }
+            for ingredient in iter_ingredients(io.StringIO(text), file_format)
+        ]
+
+    def test_json_across_chunks(self):
+        text = json.dumps(self.ITEMS, ensure_ascii=False, indent=1)
+        # Every size splits some string, key or separator in two.
+        for size in (1, 2, 3, 5, 8, 13, len(text)):
+            with self.subTest(size=size), mock.patch(
+                "recipes.management.commands.import_ingredients"
+                ".READ_CHUNK_SIZE",
+                size,
+            ):
+                self.assertEqual(self.parse(text, "json"), self.ITEMS)
+
+    def test_truncated_json(self):
+        text = json.dumps(self.ITEMS, ensure_ascii=False)[:-5]
+        with self.assertRaises(CommandError):
+            self.parse(text, "json")
+
+    def test_non_object_item(self):
+        text = json.dumps([self.ITEMS[0], ["Соль", "г"]], ensure_ascii=False)
+        with self.assertRaisesMessage(CommandError, "Item 2"):
+            self.parse(text, "json")
+
+    def test_json_lines(self):
+        text = "\n".join(
+            json.dumps(item, ensure_ascii=False) for item in self.ITEMS
+        )
+        self.assertEqual(self.parse(text + "\n\n", "jsonl"), self.ITEMS)
+
+    def test_csv_header(self):
+        rows = "".join(
+            f"{item['name']},{item['measurement_unit']}\n"
+            for item in self.ITEMS
+        )
+        for header in ("", "name,measurement_unit\n"):
+            with self.subTest(header=header):
+                self.assertEqual(self.parse(header + rows, "csv"), self.ITEMS)
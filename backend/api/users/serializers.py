@@ -3,8 +3,14 @@ from djoser.serializers import UserCreateSerializer, UserSerializer
 from rest_framework import serializers
 from rest_framework.validators import UniqueTogetherValidator
 
+from users.authentication import token_cache
 from users.models import Subscription
-from recipes.fields import Base64ImageField
+from recipes.fields import (
+    Base64ImageField,
+    ImageVariantField,
+    content_hash_name,
+)
+from api.middleware import TimedSerializerMixin
 from api.recipes.short_serializers import ShortRecipeSerializer
 
 User = get_user_model()
@@ -40,12 +46,13 @@ class HybridImageField(Base64ImageField):
     def to_internal_value(self, data):
         # Если это файл (InMemoryUploadedFile), обрабатываем как ImageField
         if hasattr(data, 'read'):
+            data.name = content_hash_name(data, data.name.split('.')[-1])
             return super(serializers.ImageField, self).to_internal_value(data)
         # Если это base64-строка, обрабатываем как Base64ImageField
         return super().to_internal_value(data)
 
 
-class UserRegistrationSerializer(UserCreateSerializer):
+class UserRegistrationSerializer(TimedSerializerMixin, UserCreateSerializer):
     """Serializer for user registration."""
 
     avatar = HybridImageField(required=False)
@@ -63,11 +70,13 @@ class UserRegistrationSerializer(UserCreateSerializer):
         )
 
 
-class UserProfileSerializer(UserSerializer):
+class UserProfileSerializer(TimedSerializerMixin, UserSerializer):
     """Serializer for user profile."""
 
     is_subscribed = serializers.SerializerMethodField()
     avatar = HybridImageField(required=False)
+    avatar_small = ImageVariantField(source="avatar", variant="small")
+    avatar_medium = ImageVariantField(source="avatar", variant="medium")
 
     class Meta:
         model = User
@@ -79,19 +88,48 @@ class UserProfileSerializer(UserSerializer):
             "last_name",
             "is_subscribed",
             "avatar",
+            "avatar_small",
+            "avatar_medium",
+            "recipes_count",
+            "followers_count",
         )
-        read_only_fields = ("id",)
+        read_only_fields = ("id", "recipes_count", "followers_count")
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, "is_subscribed"):
+            return obj.is_subscribed
         request = self.context.get("request")
         if not request or request.user.is_anonymous:
             return False
+        if obj.pk == request.user.pk:
+            # Nobody can follow themselves.
+            return False
         return Subscription.objects.filter(
             user=request.user, author=obj
         ).exists()
 
 
-class SubscriptionSerializer(serializers.ModelSerializer):
+class AuthorSerializer(UserProfileSerializer):
+    """Author profile embedded in cached recipe representations.
+
+    Leaves out the viewer-specific is_subscribed flag and the counters,
+    which change without touching the author's recipes.
+    """
+
+    is_subscribed = None
+
+    class Meta(UserProfileSerializer.Meta):
+        fields = tuple(
+            field for field in UserProfileSerializer.Meta.fields
+            if field not in (
+                "is_subscribed", "recipes_count", "followers_count"
+            )
+        )
+
+
+class SubscriptionSerializer(
+    TimedSerializerMixin, serializers.ModelSerializer
+):
     """Subscription serializer."""
 
     class Meta:
@@ -113,7 +151,7 @@ class SubscriptionSerializer(serializers.ModelSerializer):
         return data
 
 
-class AvatarSerializer(serializers.ModelSerializer):
+class AvatarSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     avatar = HybridImageField(required=False)
 
     class Meta:
@@ -121,7 +159,9 @@ class AvatarSerializer(serializers.ModelSerializer):
         fields = ("avatar",)
 
 
-class SubscriptionListSerializer(serializers.ModelSerializer):
+class SubscriptionListSerializer(
+    TimedSerializerMixin, serializers.ModelSerializer
+):
     id = serializers.IntegerField(
         source='author.id',
         read_only=True
@@ -148,34 +188,43 @@ class SubscriptionListSerializer(serializers.ModelSerializer):
     )
     is_subscribed = serializers.SerializerMethodField()
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.SerializerMethodField()
+    recipes_count = serializers.IntegerField(
+        source='author.recipes_count',
+        read_only=True
+    )
+    followers_count = serializers.IntegerField(
+        source='author.followers_count',
+        read_only=True
+    )
 
     class Meta:
         model = Subscription
         fields = (
             'id', 'email', 'username', 'first_name', 'last_name', 'avatar',
-            'is_subscribed', 'recipes', 'recipes_count'
+            'is_subscribed', 'recipes', 'recipes_count', 'followers_count'
         )
 
     def get_is_subscribed(self, obj):
         request = self.context.get('request')
         if not request or request.user.is_anonymous:
             return False
+        if obj.user_id == request.user.id:
+            return True
         return Subscription.objects.filter(
             user=request.user,
             author=obj.author
         ).exists()
 
     def get_recipes(self, obj):
-        recipes_qs = obj.author.recipes.all()[:3]
+        if hasattr(obj.author, 'limited_recipes'):
+            recipes_qs = obj.author.limited_recipes
+        else:
+            recipes_qs = obj.author.recipes.all()[:3]
         return ShortRecipeSerializer(
             recipes_qs, many=True,
             context=self.context
         ).data
 
-    def get_recipes_count(self, obj):
-        return obj.author.recipes.count()
-
 
 class SetPasswordSerializer(serializers.Serializer):
     current_password = serializers.CharField(required=True)
@@ -194,5 +243,7 @@ class SetPasswordSerializer(serializers.Serializer):
     def save(self, **kwargs):
         user = self.context['request'].user
         user.set_password(self.validated_data['new_password'])
-        user.save()
+        # request.user may come from the token cache.
+        user.save(update_fields=['password'])
+        token_cache.invalidate_user(user.pk)
         return user
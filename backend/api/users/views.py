@@ -3,6 +3,8 @@ from rest_framework.response import Response
 from djoser.views import UserViewSet
 from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated
+from django.db import transaction
+from django.db.models import Prefetch
 from django.shortcuts import get_object_or_404
 from rest_framework.pagination import PageNumberPagination
 from .serializers import (
@@ -10,8 +12,11 @@ from .serializers import (
     SubscriptionListSerializer,
     UserRegistrationSerializer
 )
+from recipes.models import Recipe
 from users.models import Subscription, User
 
+DEFAULT_RECIPES_LIMIT = 3
+
 
 class CreateUserViewSet(UserViewSet):
     """UserViewSet that restricts user creation."""
@@ -21,6 +26,21 @@ class CreateUserViewSet(UserViewSet):
             return UserRegistrationSerializer
         return super().get_serializer_class()
 
+    def get_instance(self):
+        # The authenticated user may come from the token cache, with
+        # counters up to TOKEN_CACHE_TTL seconds old; one fresh row
+        # replaces it.
+        return User.objects.get(pk=self.request.user.pk)
+
+    @action(['post'], detail=False)
+    def set_password(self, request, *args, **kwargs):
+        # djoser saves the whole request.user, which may be a cached copy
+        # with old counters; the serializer writes the password only.
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
     @action(detail=False,
             methods=['put', 'delete', 'get'],
             url_path='me/avatar',
@@ -28,11 +48,15 @@ class CreateUserViewSet(UserViewSet):
             )
     def avatar(self, request):
         user = request.user
+        if request.method != 'GET':
+            # Saves write every column, so they start from a fresh row.
+            user = self.get_instance()
         if request.method == 'PUT':
             serializer = AvatarSerializer(
                 user,
                 data=request.data,
-                partial=True
+                partial=True,
+                context={'request': request}
             )
             serializer.is_valid(raise_exception=True)
             serializer.save()
@@ -41,7 +65,9 @@ class CreateUserViewSet(UserViewSet):
             user.avatar.delete(save=True)
             return Response(status=status.HTTP_204_NO_CONTENT)
         elif request.method == 'GET':
-            serializer = AvatarSerializer(user)
+            serializer = AvatarSerializer(
+                user, context={'request': request}
+            )
             return Response(serializer.data)
 
     @action(detail=True,
@@ -49,6 +75,7 @@ class CreateUserViewSet(UserViewSet):
             url_path='subscribe',
             permission_classes=[IsAuthenticated]
             )
+    @transaction.atomic
     def subscribe(self, request, id=None, **kwargs):
         author = get_object_or_404(User, pk=id)
         user = request.user
@@ -82,8 +109,20 @@ class CreateUserViewSet(UserViewSet):
             )
     def subscriptions(self, request):
         user = request.user
-        subscriptions = Subscription.objects.filter(user=user
-                                                    ).select_related('author')
+        recipes_limit = self.get_recipes_limit(request)
+        # Django turns the sliced prefetch into a single ROW_NUMBER()
+        # window query that fetches the latest recipes of every author
+        # on the page at once.
+        subscriptions = (
+            Subscription.objects.filter(user=user)
+            .select_related('author')
+            .prefetch_related(Prefetch(
+                'author__recipes',
+                queryset=Recipe.objects.order_by('-pub_date')[:recipes_limit],
+                to_attr='limited_recipes',
+            ))
+            .order_by('id')
+        )
         paginator = PageNumberPagination()
         paginator.page_size_query_param = 'limit'
         page = paginator.paginate_queryset(subscriptions, request)
@@ -93,3 +132,11 @@ class CreateUserViewSet(UserViewSet):
             context={'request': request}
         )
         return paginator.get_paginated_response(serializer.data)
+
+    @staticmethod
+    def get_recipes_limit(request):
+        try:
+            recipes_limit = int(request.query_params['recipes_limit'])
+        except (KeyError, ValueError):
+            return DEFAULT_RECIPES_LIMIT
+        return max(recipes_limit, 0)
@@ -0,0 +1,25 @@
+"""
+URL configuration used under ASGI.
+
+Reads of tags, ingredients and recipes are served by async views;
+every other URL, and every write, is routed as in project_root.urls.
+The names match the router's, so metrics report the same routes.
+"""
+
+from django.urls import path
+
+from api.recipes import async_views
+from project_root.urls import urlpatterns as sync_urlpatterns
+
+urlpatterns = [
+    path('api/tags/', async_views.tag_list, name='tags-list'),
+    path('api/tags/<int:pk>/', async_views.tag_detail, name='tags-detail'),
+    path('api/ingredients/', async_views.ingredient_list,
+         name='ingredients-list'),
+    path('api/ingredients/<int:pk>/', async_views.ingredient_detail,
+         name='ingredients-detail'),
+    path('api/recipes/', async_views.recipe_list, name='recipes-list'),
+    path('api/recipes/<int:pk>/', async_views.recipe_detail,
+         name='recipes-detail'),
+    *sync_urlpatterns,
+]
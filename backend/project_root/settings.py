@@ -36,6 +36,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.AsgiUrlconfMiddleware',
+    'api.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -46,6 +48,9 @@ MIDDLEWARE = [
 ]
 
 ROOT_URLCONF = 'project_root.urls'
+# Requests served under ASGI are routed here, by AsgiUrlconfMiddleware;
+# it serves the read endpoints with async views.
+ASGI_URLCONF = 'project_root.asgi_urls'
 
 TEMPLATES = [
     {
@@ -74,6 +79,9 @@ DATABASES = {
         'PASSWORD': os.getenv('DB_PASSWORD', 'postgres'),
         'HOST': os.getenv('DB_HOST', 'localhost'),
         'PORT': os.getenv('DB_PORT', '5432'),
+        # Test database of benchmark_endpoints; SQLite keeps it in memory
+        # unless a file is named, which --keepdb needs
+        'TEST': {'NAME': os.getenv('DB_TEST_NAME') or None},
     }
 }
 
@@ -106,6 +114,61 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Thumbnails and WebP variants of uploaded images
+IMAGE_DERIVATIVES_ASYNC = os.getenv('IMAGE_DERIVATIVES_ASYNC', 'True') == 'True'
+IMAGE_DERIVATIVE_WORKERS = int(os.getenv('IMAGE_DERIVATIVE_WORKERS', '2'))
+
+# Cache. Version counters, shopping lists and ETags must be shared by
+# all workers: production needs a shared backend such as Redis (system
+# check recipes.W001); the per-process default is for development
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND') or 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': os.getenv('CACHE_LOCATION') or '',
+    }
+}
+
+# Shopping list export
+SHOPPING_LIST_CACHE_TIMEOUT = int(os.getenv('SHOPPING_LIST_CACHE_TIMEOUT', '3600'))
+SHOPPING_LIST_CACHE_MAX_SIZE = int(os.getenv('SHOPPING_LIST_CACHE_MAX_SIZE', str(1024 * 1024)))
+SHOPPING_LIST_PDF_FONT = os.getenv('SHOPPING_LIST_PDF_FONT', 'DejaVuSans.ttf')
+
+# Viewer-independent part of recipe representations
+RECIPE_CACHE_TIMEOUT = int(os.getenv('RECIPE_CACHE_TIMEOUT', str(24 * 60 * 60)))
+
+# Seconds a recipe list COUNT(*) may be reused; 0 keeps counts exact
+RECIPE_COUNT_CACHE_TIMEOUT = int(os.getenv('RECIPE_COUNT_CACHE_TIMEOUT', '0'))
+
+# Text search configuration of the PostgreSQL recipe search index
+RECIPE_SEARCH_CONFIG = os.getenv('RECIPE_SEARCH_CONFIG', 'russian')
+
+# Ingredient autocomplete
+INGREDIENT_AUTOCOMPLETE_LIMIT = int(os.getenv('INGREDIENT_AUTOCOMPLETE_LIMIT', '50'))
+
+# "Cook with what I have": missing ingredients allowed by default
+PANTRY_MAX_MISSING = int(os.getenv('PANTRY_MAX_MISSING', '2'))
+
+# Recipes returned by /api/recipes/{id}/similar/ unless ?limit= is given;
+# at most the --top-k of compute_recipe_similarity are stored
+SIMILAR_RECIPES_LIMIT = int(os.getenv('SIMILAR_RECIPES_LIMIT', '6'))
+
+# Short links: code length and codes resolved per worker without a query
+SHORT_LINK_LENGTH = int(os.getenv('SHORT_LINK_LENGTH', '6'))
+SHORT_LINK_CACHE_SIZE = int(os.getenv('SHORT_LINK_CACHE_SIZE', '100000'))
+
+# Authors with this many followers are not fanned out to their timelines;
+# their recipes are merged into the feed on read instead
+FEED_FANOUT_MAX_FOLLOWERS = int(os.getenv('FEED_FANOUT_MAX_FOLLOWERS', '10000'))
+
+# Request metrics served at /metrics. Workers of one server must share
+# METRICS_DIR (empty: every process reports only its own requests)
+METRICS_DIR = os.getenv('METRICS_DIR', '')
+METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', '5'))
+METRICS_ALLOWED_IPS = os.getenv(
+    'METRICS_ALLOWED_IPS',
+    '127.0.0.1,::1,10.0.0.0/8,172.16.0.0/12,192.168.0.0/16',
+).split(',')
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
@@ -118,7 +181,7 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'users.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 10,
@@ -127,6 +190,10 @@ REST_FRAMEWORK = {
     ],
 }
 
+# In-process cache of authenticated tokens
+TOKEN_CACHE_SIZE = int(os.getenv('TOKEN_CACHE_SIZE', '10000'))
+TOKEN_CACHE_TTL = int(os.getenv('TOKEN_CACHE_TTL', '60'))
+
 DJOSER = {
     "LOGIN_FIELD": "email",
     "HIDE_USERS": False,
@@ -16,13 +16,18 @@ Including another URLconf
 """
 
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
 from django.conf import settings
 from django.conf.urls.static import static
 
+from api.metrics import metrics
+from recipes.views import short_link
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('api.urls')),
+    re_path(r'^s/(?P<code>[0-9A-Za-z]+)/?$', short_link, name='short-link'),
+    path('metrics', metrics, name='metrics'),
 ]
 
 if settings.DEBUG:
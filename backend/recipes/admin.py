@@ -42,17 +42,14 @@ class RecipeAdmin(admin.ModelAdmin):
         "author",
         "cooking_time",
         "favorites_count",
+        "in_carts_count",
     )
+    readonly_fields = ("favorites_count", "in_carts_count")
     search_fields = ("name", "author__username", "tags__name")
     list_filter = ("author", "tags")
     inlines = (RecipeIngredientInline,)
     empty_value_display = "<пусто>"
 
-    def favorites_count(self, obj):
-        return obj.favorites.count()
-
-    favorites_count.short_description = "Favorites count"
-
 
 @admin.register(Favorite)
 class FavoriteAdmin(admin.ModelAdmin):
@@ -0,0 +1,74 @@
+import threading
+from bisect import bisect_left, bisect_right
+
+from recipes.models import Ingredient
+from recipes.versions import INGREDIENTS_VERSION, get_version
+
+_SEPARATOR = "\n"
+
+
+def normalize(value):
+    """Case-fold ``value`` and treat "ё" as "е", as Russian users type it."""
+    return value.casefold().replace("ё", "е")
+
+
+class IngredientIndex:
+    """Sorted, case-folded prefix index over ingredient names."""
+
+    def __init__(self, ingredients):
+        entries = sorted(
+            (normalize(item["name"]), item["name"], item["id"], item)
+            for item in ingredients
+        )
+        self.keys = [entry[0] for entry in entries]
+        self.items = [entry[3] for entry in entries]
+        # All keys joined together let substring search run in str.find.
+        self.offsets = []
+        offset = 0
+        for key in self.keys:
+            self.offsets.append(offset)
+            offset += len(key) + len(_SEPARATOR)
+        self.haystack = _SEPARATOR.join(self.keys)
+
+    def search(self, query, limit):
+        """Prefix matches first, then names containing ``query``."""
+        query = normalize(query.strip())
+        if not query:
+            return self.items[:limit]
+        start = bisect_left(self.keys, query)
+        end = start
+        while end < len(self.keys) and end - start < limit:
+            if not self.keys[end].startswith(query):
+                break
+            end += 1
+        results = self.items[start:end]
+        position = self.haystack.find(query)
+        while position != -1 and len(results) < limit:
+            index = bisect_right(self.offsets, position) - 1
+            if position != self.offsets[index]:
+                results.append(self.items[index])
+            position = self.haystack.find(
+                query, self.offsets[index] + len(self.keys[index])
+            )
+        return results
+
+
+_index = None
+_index_version = None
+_lock = threading.Lock()
+
+
+def get_index():
+    """This worker's index, rebuilt when the ingredient version changes."""
+    global _index, _index_version
+    version = get_version(INGREDIENTS_VERSION)
+    if _index is None or _index_version != version:
+        with _lock:
+            if _index is None or _index_version != version:
+                _index = IngredientIndex(
+                    Ingredient.objects.values(
+                        "id", "name", "measurement_unit"
+                    ).iterator()
+                )
+                _index_version = version
+    return _index
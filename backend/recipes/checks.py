@@ -0,0 +1,32 @@
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+# Backends whose entries live in a single process.
+PROCESS_LOCAL_CACHES = (
+    "django.core.cache.backends.locmem.LocMemCache",
+    "django.core.cache.backends.dummy.DummyCache",
+)
+
+
+@register(Tags.caches)
+def check_shared_cache(app_configs, **kwargs):
+    """Version counters, cached shopping lists and ETags need one cache.
+
+    With a per-process cache every worker keeps its own versions, so
+    the others keep serving stale shopping lists, indexes and 304s.
+    """
+    backend = settings.CACHES["default"]["BACKEND"]
+    if settings.DEBUG or backend not in PROCESS_LOCAL_CACHES:
+        return []
+    return [
+        Warning(
+            f"The default cache ({backend}) is not shared between worker "
+            "processes.",
+            hint=(
+                "Set CACHE_BACKEND and CACHE_LOCATION to a shared cache, "
+                "e.g. django.core.cache.backends.redis.RedisCache and "
+                "redis://redis:6379/0."
+            ),
+            id="recipes.W001",
+        )
+    ]
@@ -0,0 +1,84 @@
+from collections import Counter, defaultdict
+
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+
+from recipes.models import Favorite, Recipe, ShoppingCart
+from users.models import Subscription, User
+
+# Counter column -> (model whose rows are counted, its foreign key to the
+# owner of the column).
+RECIPE_COUNTERS = {
+    "favorites_count": (Favorite, "recipe"),
+    "in_carts_count": (ShoppingCart, "recipe"),
+}
+USER_COUNTERS = {
+    "recipes_count": (Recipe, "author"),
+    "followers_count": (Subscription, "author"),
+}
+
+
+def adjust_counter(queryset, field, delta):
+    """Add ``delta`` to the counter ``field`` of every row in ``queryset``.
+
+    The addition happens in the UPDATE itself, so concurrent changes are
+    never lost; the result is clamped at zero until recount repairs it.
+    """
+    if not delta:
+        return 0
+    return queryset.update(**{field: Greatest(F(field) + delta, Value(0))})
+
+
+def adjust_counters(model, field, pks, sign=1):
+    """Count every occurrence of a primary key in ``pks`` once.
+
+    Used by bulk paths that create or delete many rows at once; issues
+    one UPDATE per distinct number of occurrences.
+    """
+    pks_by_delta = defaultdict(list)
+    for pk, occurrences in Counter(pks).items():
+        pks_by_delta[occurrences * sign].append(pk)
+    for delta, pk_list in pks_by_delta.items():
+        adjust_counter(model.objects.filter(pk__in=pk_list), field, delta)
+
+
+def actual_count(model, foreign_key):
+    """Subquery counting the rows of ``model`` pointing at the outer row."""
+    return Coalesce(
+        Subquery(
+            model.objects.filter(**{foreign_key: OuterRef("pk")})
+            .order_by()
+            .values(foreign_key)
+            .annotate(total=Count("pk"))
+            .values("total")
+        ),
+        Value(0),
+    )
+
+
+def recount(queryset, counters):
+    """Fix drifted counters of ``queryset``; return rows fixed per field."""
+    fixed = {}
+    for field, (model, foreign_key) in counters.items():
+        actual = actual_count(model, foreign_key)
+        drifted = (
+            queryset.annotate(actual=actual)
+            .exclude(**{field: F("actual")})
+            .values("pk")
+        )
+        fixed[field] = queryset.model.objects.filter(
+            pk__in=drifted
+        ).update(**{field: actual})
+    return fixed
+
+
+def recount_recipes(queryset=None):
+    if queryset is None:
+        queryset = Recipe.objects.all()
+    return recount(queryset, RECIPE_COUNTERS)
+
+
+def recount_users(queryset=None):
+    if queryset is None:
+        queryset = User.objects.all()
+    return recount(queryset, USER_COUNTERS)
@@ -0,0 +1,382 @@
+"""Seeded synthetic users, recipes and activity for benchmarks.
+
+Columns are drawn with numpy and written straight to the tables, with
+COPY on PostgreSQL and batched executemany elsewhere: no model instance
+is built and no signal fires, so the counters are computed up front and
+the timelines and the search index are rebuilt once everything is
+written.
+"""
+import time
+from datetime import datetime, timedelta, timezone
+from io import BytesIO, StringIO
+from itertools import islice
+
+import numpy as np
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from PIL import Image
+
+from recipes.feed import rebuild_timelines
+from recipes.images import generate_derivatives
+from recipes.models import (
+    Favorite,
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    ShoppingCart,
+    Tag,
+)
+from recipes.search import rebuild_index
+from recipes.versions import (
+    INGREDIENTS_VERSION,
+    RECIPE_DELETIONS_VERSION,
+    RECIPE_INGREDIENTS_VERSION,
+    RECIPES_VERSION,
+    TAGS_VERSION,
+    bump_version_on_commit,
+)
+from users.models import Subscription, User
+
+DEFAULT_SEED = 1
+BATCH_SIZE = 10_000
+PASSWORD = "fake-password"
+PLACEHOLDER_COLORS = (
+    (226, 108, 45),
+    (73, 182, 78),
+    (135, 117, 210),
+    (245, 197, 24),
+    (30, 144, 255),
+    (46, 139, 87),
+    (210, 105, 30),
+    (0, 206, 209),
+)
+# Publication dates end here, so a seed always gives the same rows.
+LAST_PUB_DATE = datetime(2025, 1, 1, tzinfo=timezone.utc)
+PUB_DATE_SPAN = timedelta(days=365)
+# The n-th most popular author, followed user, recipe or ingredient and
+# the n-th most active user are picked with a weight of n ** -exponent.
+AUTHOR_EXPONENT = 0.8
+FOLLOWED_EXPONENT = 0.8
+RECIPE_EXPONENT = 0.8
+INGREDIENT_EXPONENT = 1.0
+ACTIVITY_EXPONENT = 0.5
+TAGS = (
+    ("Завтрак", "#E26C2D", "breakfast"),
+    ("Обед", "#49B64E", "lunch"),
+    ("Ужин", "#8775D2", "dinner"),
+    ("Десерт", "#F5C518", "dessert"),
+    ("Суп", "#1E90FF", "soup"),
+    ("Салат", "#2E8B57", "salad"),
+    ("Выпечка", "#D2691E", "baking"),
+    ("Напитки", "#00CED1", "drinks"),
+)
+UNITS = ("г", "кг", "мл", "л", "шт.", "ст. л.", "ч. л.", "по вкусу")
+
+
+def _next_pk(model):
+    return (model.objects.aggregate(last=Max("pk"))["last"] or 0) + 1
+
+
+def _copy_text(value):
+    """``value`` in the text format of COPY."""
+    if value is None:
+        return r"\N"
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+class TableWriter:
+    """Batched inserts of raw rows into the table of ``model``.
+
+    Rows hold the values of ``fields`` in database form; the other
+    columns, but for an automatic primary key, get the model defaults.
+    """
+
+    def __init__(self, model, fields, batch_size=BATCH_SIZE):
+        given = [model._meta.get_field(name) for name in fields]
+        rest = [
+            field for field in model._meta.concrete_fields
+            if field not in given and not field.primary_key
+        ]
+        self.defaults = tuple(
+            field.get_db_prep_save(field.get_default(), connection)
+            for field in rest
+        )
+        quote = connection.ops.quote_name
+        self.table = quote(model._meta.db_table)
+        self.columns = ", ".join(quote(field.column) for field in given + rest)
+        self.batch_size = batch_size
+
+    def write(self, rows):
+        """Insert the tuples of ``rows``; return how many there were."""
+        rows = iter(rows)
+        total = 0
+        while batch := list(islice(rows, self.batch_size)):
+            if self.defaults:
+                batch = [row + self.defaults for row in batch]
+            if connection.vendor == "postgresql":
+                self._copy(batch)
+            else:
+                self._insert(batch)
+            total += len(batch)
+        return total
+
+    def _copy(self, batch):
+        data = StringIO("".join(
+            "\t".join(map(_copy_text, row)) + "\n" for row in batch
+        ))
+        with connection.cursor() as cursor:
+            cursor.copy_expert(
+                f"COPY {self.table} ({self.columns}) FROM STDIN", data
+            )
+
+    def _insert(self, batch):
+        placeholders = ", ".join(["%s"] * len(batch[0]))
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"INSERT INTO {self.table} ({self.columns}) "
+                f"VALUES ({placeholders})",
+                batch,
+            )
+
+
+def _weights(rng, size, exponent):
+    """Power-law weights of ``size`` items, shuffled over the items."""
+    weights = np.arange(1, size + 1, dtype=float) ** -exponent
+    rng.shuffle(weights)
+    return weights / weights.sum()
+
+
+def _pairs(rng, count, left, right, exclude_same=False):
+    """Distinct (left, right) positions drawn by the two weights.
+
+    Sorted by left, then right position; at most half of all pairs.
+    """
+    size = len(right)
+    count = min(count, len(left) * size // 2)
+    codes = np.empty(0, dtype=np.int64)
+    while len(codes) < count:
+        wanted = count - len(codes)
+        first = rng.choice(len(left), wanted, p=left)
+        second = rng.choice(size, wanted, p=right)
+        if exclude_same:
+            keep = first != second
+            first, second = first[keep], second[keep]
+        codes = np.union1d(codes, first.astype(np.int64) * size + second)
+    return np.divmod(codes, size)
+
+
+def _recipe_ingredients(rng, recipes, weights, per_recipe):
+    """(recipe, ingredient) positions, per_recipe ± 2 draws per recipe.
+
+    Popular ingredients drawn twice for a recipe are kept once.
+    """
+    size = len(weights)
+    counts = np.clip(
+        per_recipe + rng.integers(-2, 3, recipes), 1, size
+    )
+    codes = np.unique(
+        np.repeat(np.arange(recipes, dtype=np.int64), counts) * size
+        + rng.choice(size, counts.sum(), p=weights)
+    )
+    return np.divmod(codes, size)
+
+
+def _recipe_tags(rng, recipes, tags):
+    """(recipe, tag) positions, one to three distinct tags per recipe."""
+    counts = rng.integers(1, min(3, tags) + 1, recipes)
+    order = np.argsort(rng.random((recipes, tags)), axis=1)
+    chosen = np.arange(tags) < counts[:, None]
+    return np.nonzero(chosen)[0], order[chosen]
+
+
+def placeholder_images():
+    """Store a few small recipe images and their derivatives once."""
+    names = []
+    for number, color in enumerate(PLACEHOLDER_COLORS):
+        name = f"recipes/fake-{number}.png"
+        if not default_storage.exists(name):
+            buffer = BytesIO()
+            Image.new("RGB", (64, 64), color).save(buffer, "PNG")
+            name = default_storage.save(name, ContentFile(buffer.getvalue()))
+        generate_derivatives(name)
+        names.append(name)
+    return names
+
+
+def ensure_tags():
+    for name, color, slug in TAGS:
+        Tag.objects.get_or_create(
+            slug=slug, defaults={"name": name, "color": color}
+        )
+    return list(Tag.objects.values_list("pk", flat=True))
+
+
+class _Timer:
+    """Rows and seconds of every step of generate()."""
+
+    def __init__(self):
+        self.steps = {}
+        self.started = time.perf_counter()
+
+    def record(self, step, rows):
+        now = time.perf_counter()
+        self.steps[step] = (rows, now - self.started)
+        self.started = now
+
+
+@transaction.atomic
+def generate(
+    users=1000,
+    recipes=10_000,
+    ingredients=2000,
+    ingredients_per_recipe=8,
+    favorites=50_000,
+    carts=10_000,
+    subscriptions=10_000,
+    seed=DEFAULT_SEED,
+    batch_size=BATCH_SIZE,
+):
+    """Add a seeded dataset to the database.
+
+    Authors, followed users, ingredients and the recipes users add to
+    favorites and carts are picked with power-law popularity, so a few
+    of them carry most of the activity. Needs two users and an
+    ingredient at least. Returns ``{step: (rows, seconds)}``, the
+    seconds including the drawing of the rows.
+    """
+    rng = np.random.default_rng(seed)
+    images = placeholder_images()
+    tag_ids = np.array(ensure_tags())
+    password = make_password(PASSWORD)
+    timer = _Timer()
+    as_datetime = connection.ops.adapt_datetimefield_value
+
+    user_ids = np.arange(users) + _next_pk(User)
+    ingredient_ids = np.arange(ingredients) + _next_pk(Ingredient)
+    recipe_ids = np.arange(recipes) + _next_pk(Recipe)
+
+    # Popular authors are not the most followed users, otherwise a few
+    # of them would fan out most recipes to most timelines.
+    authors = rng.choice(
+        users, recipes, p=_weights(rng, users, AUTHOR_EXPONENT)
+    )
+    activity = _weights(rng, users, ACTIVITY_EXPONENT)
+    recipe_weights = _weights(rng, recipes, RECIPE_EXPONENT)
+    favorite_users, favorite_recipes = _pairs(
+        rng, favorites, activity, recipe_weights
+    )
+    cart_users, cart_recipes = _pairs(rng, carts, activity, recipe_weights)
+    followers, followed = _pairs(
+        rng, subscriptions, activity,
+        _weights(rng, users, FOLLOWED_EXPONENT),
+        exclude_same=True,
+    )
+
+    joined = as_datetime(LAST_PUB_DATE - PUB_DATE_SPAN)
+    timer.record("users", TableWriter(User, (
+        "id", "username", "email", "first_name", "last_name", "password",
+        "date_joined", "recipes_count", "followers_count",
+    ), batch_size).write(
+        (pk, f"fake{pk}", f"fake{pk}@example.com", f"Имя{pk}",
+         f"Фамилия{pk}", password, joined, recipes_count, followers_count)
+        for pk, recipes_count, followers_count in zip(
+            user_ids.tolist(),
+            np.bincount(authors, minlength=users).tolist(),
+            np.bincount(followed, minlength=users).tolist(),
+        )
+    ))
+    timer.record("ingredients", TableWriter(
+        Ingredient, ("id", "name", "measurement_unit"), batch_size
+    ).write(
+        (pk, f"ингредиент {pk}", UNITS[unit])
+        for pk, unit in zip(
+            ingredient_ids.tolist(),
+            rng.integers(len(UNITS), size=ingredients).tolist(),
+        )
+    ))
+
+    interval = PUB_DATE_SPAN / max(recipes, 1)
+    start = LAST_PUB_DATE - PUB_DATE_SPAN
+    dates = [
+        as_datetime(start + interval * number) for number in range(recipes)
+    ]
+    timer.record("recipes", TableWriter(Recipe, (
+        "id", "author", "name", "text", "image", "image_derivatives_ready",
+        "cooking_time", "pub_date", "updated_at", "favorites_count",
+        "in_carts_count",
+    ), batch_size).write(
+        # placeholder_images() generated the derivatives.
+        (pk, author, f"Рецепт {pk}", f"Описание рецепта {pk}.",
+         images[image], True, cooking_time, date, date, favorites_count,
+         in_carts_count)
+        for pk, author, image, cooking_time, date, favorites_count,
+        in_carts_count in zip(
+            recipe_ids.tolist(),
+            user_ids[authors].tolist(),
+            rng.integers(len(images), size=recipes).tolist(),
+            rng.integers(5, 181, recipes).tolist(),
+            dates,
+            np.bincount(favorite_recipes, minlength=recipes).tolist(),
+            np.bincount(cart_recipes, minlength=recipes).tolist(),
+        )
+    ))
+
+    recipe, ingredient = _recipe_ingredients(
+        rng, recipes, _weights(rng, ingredients, INGREDIENT_EXPONENT),
+        ingredients_per_recipe,
+    )
+    timer.record("recipe ingredients", TableWriter(
+        RecipeIngredient, ("recipe", "ingredient", "amount"), batch_size
+    ).write(zip(
+        recipe_ids[recipe].tolist(),
+        ingredient_ids[ingredient].tolist(),
+        rng.integers(1, 501, len(recipe)).tolist(),
+    )))
+    RecipeTag = Recipe.tags.through
+    recipe, tag = _recipe_tags(rng, recipes, len(tag_ids))
+    timer.record("recipe tags", TableWriter(
+        RecipeTag, ("recipe", "tag"), batch_size
+    ).write(zip(recipe_ids[recipe].tolist(), tag_ids[tag].tolist())))
+    for step, model, user, target in (
+        ("favorites", Favorite, favorite_users, favorite_recipes),
+        ("shopping carts", ShoppingCart, cart_users, cart_recipes),
+    ):
+        timer.record(step, TableWriter(
+            model, ("user", "recipe"), batch_size
+        ).write(zip(user_ids[user].tolist(), recipe_ids[target].tolist())))
+    timer.record("subscriptions", TableWriter(
+        Subscription, ("user", "author"), batch_size
+    ).write(zip(user_ids[followers].tolist(), user_ids[followed].tolist())))
+
+    # Explicit keys leave PostgreSQL sequences behind.
+    with connection.cursor() as cursor:
+        for sql in connection.ops.sequence_reset_sql(
+            no_style(), [User, Ingredient, Recipe]
+        ):
+            cursor.execute(sql)
+    timer.record("feed entries", rebuild_timelines())
+    timer.record("search index", rebuild_index())
+    # The recipes carry past dates, which incremental refreshes keyed by
+    # updated_at skip; the deletions version rebuilds the pantry index.
+    bump_version_on_commit(
+        INGREDIENTS_VERSION,
+        TAGS_VERSION,
+        RECIPE_INGREDIENTS_VERSION,
+        RECIPE_DELETIONS_VERSION,
+        RECIPES_VERSION,
+    )
+    return timer.steps
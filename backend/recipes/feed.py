@@ -0,0 +1,162 @@
+from itertools import islice
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.db.models.constants import OnConflict
+
+from recipes.models import FeedEntry, Recipe
+from users.models import Subscription, User
+
+FAN_OUT_BATCH_SIZE = 1000
+
+
+def is_fanned_out(author_id):
+    """Whether recipes of the author are written to follower timelines."""
+    return User.objects.filter(
+        pk=author_id,
+        followers_count__lt=settings.FEED_FANOUT_MAX_FOLLOWERS,
+    ).exists()
+
+
+def _write_entries(entries):
+    entries = iter(entries)
+    while batch := list(islice(entries, FAN_OUT_BATCH_SIZE)):
+        FeedEntry.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def fan_out(recipe):
+    """Add a newly published recipe to the timelines of its followers."""
+    if not is_fanned_out(recipe.author_id):
+        return
+    followers = (
+        Subscription.objects.filter(author_id=recipe.author_id)
+        .values_list("user_id", flat=True)
+        .iterator(chunk_size=FAN_OUT_BATCH_SIZE)
+    )
+    _write_entries(
+        FeedEntry(user_id=user_id, recipe=recipe, pub_date=recipe.pub_date)
+        for user_id in followers
+    )
+
+
+def backfill(user_id, author_id):
+    """Copy the recipes of a newly followed author into the timeline."""
+    if not is_fanned_out(author_id):
+        return
+    recipes = (
+        Recipe.objects.filter(author_id=author_id)
+        .values_list("id", "pub_date")
+        .iterator(chunk_size=FAN_OUT_BATCH_SIZE)
+    )
+    _write_entries(
+        FeedEntry(user_id=user_id, recipe_id=recipe_id, pub_date=pub_date)
+        for recipe_id, pub_date in recipes
+    )
+
+
+def clean_up(user_id, author_id):
+    """Drop the recipes of an unfollowed author from the timeline."""
+    FeedEntry.objects.filter(
+        user_id=user_id, recipe__author_id=author_id
+    ).delete()
+
+
+def _insert_entries(rows):
+    """INSERT ... SELECT the (user, recipe, pub_date) ``rows``.
+
+    Entries already in a timeline are skipped; returns the number added.
+    """
+    select, params = rows.query.sql_with_params()
+    ops = connection.ops
+    table = ops.quote_name(FeedEntry._meta.db_table)
+    fields = [
+        FeedEntry._meta.get_field(name)
+        for name in ("user", "recipe", "pub_date")
+    ]
+    columns = ", ".join(ops.quote_name(field.column) for field in fields)
+    insert = ops.insert_statement(on_conflict=OnConflict.IGNORE)
+    suffix = ops.on_conflict_suffix_sql(
+        fields, OnConflict.IGNORE, None, None
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"{insert} {table} ({columns}) {select} {suffix}", params
+        )
+        return cursor.rowcount
+
+
+def _follower_rows(recipes):
+    return recipes.filter(author__following__isnull=False).order_by(
+    ).values_list("author__following__user", "id", "pub_date")
+
+
+def catch_up(author_id):
+    """Fan out every recipe of an author who just lost a follower.
+
+    Recipes published while the author had FEED_FANOUT_MAX_FOLLOWERS
+    followers or more are read from the recipes table and are in no
+    timeline; once the author drops below that, they are copied in.
+    Returns the number of entries added.
+    """
+    if not User.objects.filter(
+        pk=author_id,
+        followers_count=settings.FEED_FANOUT_MAX_FOLLOWERS - 1,
+    ).exists():
+        return 0
+    return _insert_entries(
+        _follower_rows(Recipe.objects.filter(author_id=author_id))
+    )
+
+
+def rebuild_timelines():
+    """Rewrite every timeline from the subscriptions; return entries.
+
+    For rows inserted in bulk, which skip the signals that fan recipes
+    out; one INSERT ... SELECT instead of a query per follower.
+    """
+    FeedEntry.objects.all().delete()
+    return _insert_entries(
+        _follower_rows(
+            Recipe.objects.filter(
+                author__followers_count__lt=(
+                    settings.FEED_FANOUT_MAX_FOLLOWERS
+                ),
+            )
+        )
+    )
+
+
+def _before(queryset, position, id_field):
+    if position is None:
+        return queryset
+    pub_date, recipe_id = position
+    return queryset.filter(
+        Q(pub_date__lt=pub_date)
+        | Q(pub_date=pub_date, **{f"{id_field}__lt": recipe_id}),
+        pub_date__lte=pub_date,
+    )
+
+
+def feed_positions(user, before=None, limit=10):
+    """(pub_date, recipe id) of the newest feed recipes after ``before``.
+
+    Reads the user's timeline and, for followed authors too popular to
+    fan out, their recipes directly; returns up to ``limit`` positions,
+    newest first.
+    """
+    timeline = _before(
+        FeedEntry.objects.filter(user=user), before, "recipe_id"
+    ).order_by("-pub_date", "-recipe_id").values_list(
+        "pub_date", "recipe_id"
+    )[:limit]
+    popular = _before(
+        Recipe.objects.filter(
+            author__following__user=user,
+            author__followers_count__gte=settings.FEED_FANOUT_MAX_FOLLOWERS,
+        ),
+        before,
+        "id",
+    ).order_by("-pub_date", "-id").values_list("pub_date", "id")[:limit]
+    # Recipes published before their author became popular are in both.
+    return sorted({*timeline, *popular}, reverse=True)[:limit]
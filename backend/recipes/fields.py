@@ -1,25 +1,76 @@
 import base64
-import uuid
+import hashlib
 
 from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
 from rest_framework import serializers
 
+from recipes.images import derivative_name
+
+IMAGE_FORMAT_PARAM = "image_format"
+IMAGE_FORMAT_HEADER = "HTTP_X_IMAGE_FORMAT"
+IMAGE_FORMAT_URL = "url"
+IMAGE_FORMAT_BASE64 = "base64"
+HASH_LENGTH = 32
+
+
+def content_hash_name(file, ext):
+    """Build a file name from the sha256 of the file contents."""
+    digest = hashlib.sha256()
+    if hasattr(file, "chunks"):
+        for chunk in file.chunks():
+            digest.update(chunk)
+        file.seek(0)
+    else:
+        digest.update(file)
+    return f"{digest.hexdigest()[:HASH_LENGTH]}.{ext.lower()}"
+
+
+def requested_image_format(request):
+    """Return the image representation negotiated by the client."""
+    if request is None:
+        return IMAGE_FORMAT_URL
+    value = (
+        request.GET.get(IMAGE_FORMAT_PARAM)
+        or request.META.get(IMAGE_FORMAT_HEADER)
+        or IMAGE_FORMAT_URL
+    )
+    if value.lower() == IMAGE_FORMAT_BASE64:
+        return IMAGE_FORMAT_BASE64
+    return IMAGE_FORMAT_URL
+
 
 class Base64ImageField(serializers.ImageField):
-    """Field for working with base64 encoded images."""
+    """Field for working with base64 encoded images.
+
+    Uploaded files are named after a hash of their contents, so the media
+    URL of an image is stable and changes whenever the image does. Reads
+    return that URL; clients that still need the inline data URI can ask
+    for it with ``?image_format=base64`` or ``X-Image-Format: base64``.
+    """
 
     def to_internal_value(self, data):
         if isinstance(data, str) and data.startswith("data:image"):
             format, imgstr = data.split(";base64,")
             ext = format.split("/")[-1]
-            data = ContentFile(
-                base64.b64decode(imgstr), name=f"{uuid.uuid4()}.{ext}"
-            )
+            content = base64.b64decode(imgstr)
+            data = ContentFile(content, name=content_hash_name(content, ext))
+        elif hasattr(data, "chunks"):
+            data.name = content_hash_name(data, data.name.split(".")[-1])
         return super().to_internal_value(data)
 
     def to_representation(self, value):
         if not value:
             return None
+        request = self.context.get("request")
+        if requested_image_format(request) == IMAGE_FORMAT_BASE64:
+            return self.to_data_uri(value)
+        url = value.url
+        if request is not None:
+            return request.build_absolute_uri(url)
+        return url
+
+    def to_data_uri(self, value):
         try:
             with value.open("rb") as image_file:
                 encoded_string = base64.b64encode(image_file.read()).decode(
@@ -29,3 +80,37 @@ class Base64ImageField(serializers.ImageField):
                 return f"data:image/{file_type};base64,{encoded_string}"
         except Exception:
             return None
+
+
+class ImageVariantField(serializers.ReadOnlyField):
+    """URL of a resized WebP derivative of an image.
+
+    Falls back to the original image until the model's
+    ``<source>_derivatives_ready`` flag says the derivative exists, so
+    serializing never touches the storage.
+    """
+
+    def __init__(self, variant, **kwargs):
+        self.variant = variant
+        super().__init__(**kwargs)
+
+    def get_attribute(self, instance):
+        return (
+            super().get_attribute(instance),
+            getattr(instance, f"{self.source}_derivatives_ready", False),
+        )
+
+    def to_representation(self, value):
+        image, ready = value
+        if not image:
+            return None
+        if ready:
+            url = default_storage.url(
+                derivative_name(image.name, self.variant)
+            )
+        else:
+            url = image.url
+        request = self.context.get("request")
+        if request is not None:
+            return request.build_absolute_uri(url)
+        return url
@@ -0,0 +1,141 @@
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+import django
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+IMAGE_VARIANTS = {
+    "small": (160, 160),
+    "medium": (480, 480),
+}
+DERIVATIVES_DIR = "derivatives"
+DERIVATIVE_FORMAT = "WEBP"
+DERIVATIVE_QUALITY = 80
+
+_executor = None
+
+
+def derivative_name(name, variant):
+    """Storage name of the ``variant`` derivative of the image ``name``."""
+    stem = os.path.splitext(name)[0]
+    return f"{DERIVATIVES_DIR}/{stem}_{variant}.webp"
+
+
+def missing_variants(name):
+    """Variants of the image ``name`` that have not been generated yet."""
+    return [
+        variant for variant in IMAGE_VARIANTS
+        if not default_storage.exists(derivative_name(name, variant))
+    ]
+
+
+def generate_derivatives(name, force=False):
+    """Render and store the WebP derivatives of the stored image ``name``."""
+    variants = list(IMAGE_VARIANTS) if force else missing_variants(name)
+    if not variants:
+        mark_ready(name)
+        return []
+    with default_storage.open(name, "rb") as image_file:
+        image = ImageOps.exif_transpose(Image.open(image_file))
+        image.load()
+    if image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+
+    created = []
+    for variant in variants:
+        derivative = image.copy()
+        derivative.thumbnail(IMAGE_VARIANTS[variant], Image.LANCZOS)
+        buffer = BytesIO()
+        derivative.save(
+            buffer, DERIVATIVE_FORMAT, quality=DERIVATIVE_QUALITY, method=4
+        )
+        target = derivative_name(name, variant)
+        if default_storage.exists(target):
+            default_storage.delete(target)
+        created.append(
+            default_storage.save(target, ContentFile(buffer.getvalue()))
+        )
+    mark_ready(name)
+    return created
+
+
+def mark_ready(name):
+    """Record that the derivatives of ``name`` exist.
+
+    Recipes whose cached output embeds them are refreshed as well; rows
+    already marked are left alone.
+    """
+    # Pool processes import this module before Django is set up.
+    from recipes.models import Recipe
+    from users.models import User
+
+    Recipe.objects.filter(image=name, image_derivatives_ready=False).update(
+        image_derivatives_ready=True, updated_at=timezone.now()
+    )
+    authors = User.objects.filter(avatar=name, avatar_derivatives_ready=False)
+    Recipe.objects.filter(author__in=authors).touch()
+    authors.update(avatar_derivatives_ready=True)
+
+
+def init_worker():
+    """Configure Django in a freshly started pool process."""
+    if not apps.ready:
+        django.setup()
+
+
+def get_executor():
+    """Process pool used for resizing, created lazily in each worker."""
+    global _executor
+    if _executor is None:
+        # Spawned processes open their own database connections instead
+        # of sharing the ones inherited from the parent.
+        _executor = ProcessPoolExecutor(
+            max_workers=settings.IMAGE_DERIVATIVE_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_worker,
+        )
+    return _executor
+
+
+def _log_failure(future):
+    if future.exception() is not None:
+        logger.error(
+            "Image derivative generation failed", exc_info=future.exception()
+        )
+
+
+def _submit(name):
+    try:
+        future = get_executor().submit(generate_derivatives, name)
+    except Exception:
+        # Derivatives can be backfilled later; never fail the request.
+        logger.exception("Could not schedule derivatives of %s", name)
+        return
+    future.add_done_callback(_log_failure)
+
+
+def schedule_derivatives(name):
+    """Generate missing derivatives of ``name`` after the current commit.
+
+    Marks the owners of ``name`` ready once the derivatives exist.
+    """
+    if not name:
+        return
+    if not missing_variants(name):
+        # Another upload of the same image may have generated them.
+        transaction.on_commit(lambda: mark_ready(name))
+    elif settings.IMAGE_DERIVATIVES_ASYNC:
+        transaction.on_commit(lambda: _submit(name))
+    else:
+        transaction.on_commit(lambda: generate_derivatives(name))
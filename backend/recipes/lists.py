@@ -0,0 +1,70 @@
+from django.db import connection, transaction
+
+from recipes.counters import RECIPE_COUNTERS, adjust_counters
+from recipes.models import Recipe
+from recipes.versions import bump_recipe_list_versions
+from users.models import User
+
+# Favorite or ShoppingCart -> counter column of the recipe.
+COUNTER_FIELDS = {
+    model: field for field, (model, _) in RECIPE_COUNTERS.items()
+}
+
+
+def _lock(user):
+    # Changes of one user's lists are serialised, so the rows read below
+    # are exactly the ones written: no IntegrityError on double clicks and
+    # no counter counted twice.
+    list(User.objects.select_for_update().filter(pk=user.pk).values("pk"))
+
+
+@transaction.atomic
+def add_recipes(model, user, recipe_ids):
+    """Add recipes to a user's favorites or cart; return the ids added.
+
+    Recipes already in the list are left alone, ids of missing recipes
+    are ignored. bulk_create() sends no signals, so the recipe counters
+    and the versions are updated here, with the receivers' helpers.
+    """
+    _lock(user)
+    present = model.objects.filter(user=user, recipe_id__in=recipe_ids)
+    added = list(
+        Recipe.objects.filter(pk__in=recipe_ids)
+        .exclude(pk__in=present.values("recipe_id"))
+        .order_by("pk")
+        .values_list("pk", flat=True)
+    )
+    if added:
+        model.objects.bulk_create(
+            [model(user=user, recipe_id=recipe_id) for recipe_id in added],
+            ignore_conflicts=True,
+        )
+        adjust_counters(Recipe, COUNTER_FIELDS[model], added)
+        bump_recipe_list_versions(model, user.pk)
+    return added
+
+
+@transaction.atomic
+def remove_recipes(model, user, recipe_ids):
+    """Remove recipes from a user's favorites or cart; return the ids."""
+    _lock(user)
+    rows = model.objects.filter(user=user, recipe_id__in=recipe_ids)
+    removed = list(
+        rows.order_by("recipe_id").values_list("recipe_id", flat=True)
+    )
+    if removed:
+        # A single DELETE ... IN; delete() would load every row to send
+        # post_delete, whose receivers update a counter each.
+        quote = connection.ops.quote_name
+        opts = model._meta
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"DELETE FROM {quote(opts.db_table)} "
+                f"WHERE {quote(opts.get_field('user').column)} = %s "
+                f"AND {quote(opts.get_field('recipe').column)} "
+                f"IN ({', '.join(['%s'] * len(removed))})",
+                [user.pk, *removed],
+            )
+        adjust_counters(Recipe, COUNTER_FIELDS[model], removed, sign=-1)
+        bump_recipe_list_versions(model, user.pk)
+    return removed
@@ -0,0 +1,440 @@
+import base64
+import json
+import statistics
+import tempfile
+import time
+from collections import namedtuple
+from pathlib import Path
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import (
+    CaptureQueriesContext,
+    override_settings,
+    setup_databases,
+    teardown_databases,
+)
+from rest_framework.authtoken.models import Token
+
+from recipes import fake_data
+from recipes.models import Favorite, Ingredient, Recipe, ShoppingCart, Tag
+from users.authentication import token_cache
+from users.models import Subscription, User
+
+# ``before`` and ``after`` are untimed requests that set up and undo the
+# timed one, so every iteration sees the same data. Paths are formatted
+# with the ids in Command.context(); ``after`` also gets the response.
+Scenario = namedtuple(
+    "Scenario",
+    "name method path data before after anonymous",
+    defaults=(None, None, None, False),
+)
+
+SCENARIOS = (
+    Scenario("users-list", "GET", "/api/users/"),
+    Scenario("users-detail", "GET", "/api/users/{author}/"),
+    Scenario("users-me", "GET", "/api/users/me/"),
+    Scenario(
+        "users-subscriptions", "GET",
+        "/api/users/subscriptions/?recipes_limit=3",
+    ),
+    Scenario(
+        "users-subscribe", "POST", "/api/users/{fresh_author}/subscribe/",
+        after=("DELETE", "/api/users/{fresh_author}/subscribe/"),
+    ),
+    Scenario(
+        "users-unsubscribe", "DELETE",
+        "/api/users/{fresh_author}/subscribe/",
+        before=("POST", "/api/users/{fresh_author}/subscribe/"),
+    ),
+    Scenario("tags-list", "GET", "/api/tags/"),
+    Scenario("tags-detail", "GET", "/api/tags/{tag}/"),
+    Scenario("ingredients-list", "GET", "/api/ingredients/"),
+    Scenario("ingredients-search", "GET", "/api/ingredients/?name={prefix}"),
+    Scenario("ingredients-detail", "GET", "/api/ingredients/{ingredient}/"),
+    Scenario("recipes-list", "GET", "/api/recipes/"),
+    Scenario("recipes-list-anonymous", "GET", "/api/recipes/",
+             anonymous=True),
+    Scenario("recipes-list-author", "GET", "/api/recipes/?author={author}"),
+    Scenario(
+        "recipes-list-tags", "GET",
+        "/api/recipes/?tags={tag_slug}&tags={other_tag_slug}",
+    ),
+    Scenario("recipes-list-favorited", "GET", "/api/recipes/?is_favorited=1"),
+    Scenario(
+        "recipes-list-in-cart", "GET", "/api/recipes/?is_in_shopping_cart=1"
+    ),
+    Scenario("recipes-detail", "GET", "/api/recipes/{recipe}/"),
+    Scenario("recipes-get-link", "GET", "/api/recipes/{recipe}/get-link/"),
+    Scenario("recipes-feed", "GET", "/api/recipes/feed/"),
+    Scenario(
+        "recipes-download-shopping-cart", "GET",
+        "/api/recipes/download_shopping_cart/",
+    ),
+    Scenario(
+        "recipes-create", "POST", "/api/recipes/", data="new_recipe",
+        after=("DELETE", "/api/recipes/{response[id]}/"),
+    ),
+    Scenario(
+        "recipes-update", "PATCH", "/api/recipes/{own_recipe}/",
+        data="recipe_update",
+    ),
+    Scenario(
+        "recipes-favorite", "POST", "/api/recipes/{fresh_recipe}/favorite/",
+        after=("DELETE", "/api/recipes/{fresh_recipe}/favorite/"),
+    ),
+    Scenario(
+        "recipes-unfavorite", "DELETE",
+        "/api/recipes/{fresh_recipe}/favorite/",
+        before=("POST", "/api/recipes/{fresh_recipe}/favorite/"),
+    ),
+    Scenario(
+        "recipes-shopping-cart", "POST",
+        "/api/recipes/{fresh_recipe}/shopping_cart/",
+        after=("DELETE", "/api/recipes/{fresh_recipe}/shopping_cart/"),
+    ),
+    Scenario(
+        "recipes-remove-from-cart", "DELETE",
+        "/api/recipes/{fresh_recipe}/shopping_cart/",
+        before=("POST", "/api/recipes/{fresh_recipe}/shopping_cart/"),
+    ),
+)
+DATASET_OPTIONS = (
+    "users",
+    "recipes",
+    "ingredients",
+    "ingredients_per_recipe",
+    "favorites",
+    "carts",
+    "subscriptions",
+    "seed",
+)
+COMPARED = ("p50", "p90")
+# Queries with every cache empty, and once the warmup filled them.
+QUERY_COUNTS = ("queries", "cached_queries")
+# Latency changes below this many milliseconds are noise, whatever the
+# relative threshold says.
+MIN_REGRESSION_MS = 1.0
+# The latency of a scenario stays put while every iteration rotates
+# through this many fresh recipes and authors.
+ROTATION = 20
+
+
+def percentiles(latencies):
+    cuts = statistics.quantiles(latencies, n=100, method="inclusive")
+    return {"p50": cuts[49], "p90": cuts[89], "p99": cuts[98]}
+
+
+def regressions(results, baseline, threshold):
+    """Messages about scenarios slower or chattier than the baseline."""
+    found = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        for key in QUERY_COUNTS:
+            if key in base and result[key] > base[key]:
+                found.append(
+                    f"{name}: {result[key]} {key.replace('_', ' ')}, "
+                    f"baseline {base[key]}"
+                )
+        for key in COMPARED:
+            limit = max(base[key] * (1 + threshold),
+                        base[key] + MIN_REGRESSION_MS)
+            if result[key] > limit:
+                found.append(
+                    f"{name}: {key} {result[key]:.1f} ms, "
+                    f"baseline {base[key]:.1f} ms"
+                )
+    return found
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a throwaway test database with a synthetic dataset, time "
+        "the API endpoints with the Django test client and compare "
+        "latency percentiles and query counts with a stored baseline"
+    )
+
+    def add_arguments(self, parser):
+        dataset = parser.add_argument_group("dataset")
+        dataset.add_argument("--users", type=int, default=1000)
+        dataset.add_argument("--recipes", type=int, default=10_000)
+        dataset.add_argument("--ingredients", type=int, default=2000)
+        dataset.add_argument("--ingredients-per-recipe", type=int, default=8)
+        dataset.add_argument("--favorites", type=int, default=50_000)
+        dataset.add_argument("--carts", type=int, default=10_000)
+        dataset.add_argument("--subscriptions", type=int, default=10_000)
+        dataset.add_argument(
+            "--seed", type=int, default=fake_data.DEFAULT_SEED
+        )
+        parser.add_argument("--iterations", type=int, default=50)
+        parser.add_argument("--warmup", type=int, default=3)
+        parser.add_argument(
+            "--scenario",
+            action="append",
+            dest="scenarios",
+            choices=[scenario.name for scenario in SCENARIOS],
+            help="Run only this scenario, repeatable",
+        )
+        parser.add_argument(
+            "--baseline",
+            type=Path,
+            help="Fail when a scenario regressed against this file",
+        )
+        parser.add_argument(
+            "--save-baseline",
+            type=Path,
+            help="Store the results for this database backend in this file",
+        )
+        parser.add_argument(
+            "--threshold",
+            type=float,
+            default=0.25,
+            help="Allowed relative p50/p90 slowdown, 0.25 = 25%%",
+        )
+        parser.add_argument(
+            "--keepdb",
+            action="store_true",
+            help="Keep the test database and reuse its dataset next time",
+        )
+
+    def handle(self, *args, **options):
+        if options["iterations"] < 2:
+            raise CommandError("--iterations must be at least 2")
+        dataset = {name: options[name] for name in DATASET_OPTIONS}
+        baseline = None
+        if options["baseline"]:
+            baseline = self.load_baseline(options["baseline"], dataset)
+        only = options["scenarios"]
+        scenarios = [
+            scenario for scenario in SCENARIOS
+            if not only or scenario.name in only
+        ]
+        old_config = setup_databases(
+            verbosity=0,
+            interactive=False,
+            keepdb=options["keepdb"],
+            serialized_aliases=set(),
+        )
+        try:
+            with tempfile.TemporaryDirectory() as media, override_settings(
+                DEBUG=False,
+                ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"],
+                # Never touch the caches or the media of a real deployment.
+                CACHES={
+                    "default": {
+                        "BACKEND": "django.core.cache.backends.locmem."
+                                   "LocMemCache",
+                        "LOCATION": "benchmark",
+                    }
+                },
+                MEDIA_ROOT=media,
+                IMAGE_DERIVATIVES_ASYNC=False,
+                METRICS_DIR="",
+            ):
+                self.seed(dataset, options["keepdb"])
+                results = self.run(scenarios, options)
+        finally:
+            teardown_databases(
+                old_config, verbosity=0, keepdb=options["keepdb"]
+            )
+        self.report(results, dataset, baseline, options)
+
+    def seed(self, dataset, keepdb):
+        if keepdb and User.objects.filter(
+            username__startswith="fake"
+        ).exists():
+            self.stdout.write("Reusing the dataset of the kept database")
+            return
+        started = time.perf_counter()
+        steps = fake_data.generate(**dataset)
+        self.stdout.write(
+            f"Seeded {sum(rows for rows, _ in steps.values())} rows in "
+            f"{time.perf_counter() - started:.1f}s"
+        )
+
+    def context(self, user):
+        """Ids the scenario paths and bodies are formatted with."""
+        recipe = (
+            Recipe.objects.order_by("-favorites_count", "pk").first()
+        )
+        tags = list(Tag.objects.order_by("pk")[:2])
+        ingredients = list(
+            Ingredient.objects.order_by("pk").values_list("pk", flat=True)[:3]
+        )
+        listed = Favorite.objects.filter(user=user).values("recipe")
+        carted = ShoppingCart.objects.filter(user=user).values("recipe")
+        followed = Subscription.objects.filter(user=user).values("author")
+        image = fake_data.placeholder_images()[0]
+        with open(Path(settings.MEDIA_ROOT) / image, "rb") as file:
+            encoded = base64.b64encode(file.read()).decode()
+        recipe_data = {
+            "ingredients": [
+                {"id": ingredient, "amount": 10} for ingredient in ingredients
+            ],
+            "tags": [tag.pk for tag in tags],
+            "name": "Рецепт для замера",
+            "text": "Описание рецепта для замера.",
+            "cooking_time": 30,
+        }
+        return {
+            "author": recipe.author_id,
+            "recipe": recipe.pk,
+            "own_recipe": Recipe.objects.filter(author=user)
+            .values_list("pk", flat=True).first(),
+            "tag": tags[0].pk,
+            "tag_slug": tags[0].slug,
+            "other_tag_slug": tags[-1].slug,
+            "ingredient": ingredients[0],
+            "prefix": Ingredient.objects.get(pk=ingredients[0]).name[:3],
+            "fresh_recipes": list(
+                Recipe.objects.exclude(pk__in=listed)
+                .exclude(pk__in=carted)
+                .order_by("pk")
+                .values_list("pk", flat=True)[:ROTATION]
+            ),
+            "fresh_authors": list(
+                User.objects.exclude(pk__in=followed)
+                .exclude(pk=user.pk)
+                .order_by("pk")
+                .values_list("pk", flat=True)[:ROTATION]
+            ),
+            "new_recipe": {
+                **recipe_data, "image": f"data:image/png;base64,{encoded}"
+            },
+            "recipe_update": recipe_data,
+        }
+
+    def request(self, client, method, path, data=None):
+        kwargs = {}
+        if data is not None:
+            kwargs = {
+                "data": json.dumps(data),
+                "content_type": "application/json",
+            }
+        response = client.generic(method, path, **kwargs)
+        if response.streaming:
+            # Streamed bodies are rendered, and queried, while read.
+            b"".join(response.streaming_content)
+        if response.status_code >= 400:
+            raise CommandError(
+                f"{method} {path} returned {response.status_code}: "
+                f"{response.content[:200]!r}"
+            )
+        return response
+
+    def iterate(self, client, scenario, context, number, queries=None):
+        """Run one iteration; return the latency of the timed request."""
+        values = {
+            **context,
+            "fresh_recipe": context["fresh_recipes"][
+                number % len(context["fresh_recipes"])
+            ],
+            "fresh_author": context["fresh_authors"][
+                number % len(context["fresh_authors"])
+            ],
+        }
+        if scenario.before:
+            method, path = scenario.before
+            self.request(client, method, path.format(**values))
+        data = context[scenario.data] if scenario.data else None
+        path = scenario.path.format(**values)
+        if queries is not None:
+            with CaptureQueriesContext(connection) as captured:
+                response = self.request(client, scenario.method, path, data)
+            queries.append(len(captured))
+            elapsed = None
+        else:
+            started = time.perf_counter()
+            response = self.request(client, scenario.method, path, data)
+            elapsed = (time.perf_counter() - started) * 1000
+        if scenario.after:
+            method, path = scenario.after
+            body = json.loads(response.content) if response.content else {}
+            self.request(
+                client, method, path.format(**values, response=body)
+            )
+        return elapsed
+
+    def run(self, scenarios, options):
+        user = User.objects.filter(username__startswith="fake").earliest("pk")
+        token, _ = Token.objects.get_or_create(user=user)
+        context = self.context(user)
+        if context["own_recipe"] is None:
+            raise CommandError(f"{user} has no recipes, try another --seed")
+        clients = {
+            False: Client(HTTP_AUTHORIZATION=f"Token {token.key}"),
+            True: Client(),
+        }
+        self.stdout.write(
+            f"{'scenario':<32} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} "
+            f"{'queries':>7} {'cached':>7}"
+        )
+        results = {}
+        for scenario in scenarios:
+            client = clients[scenario.anonymous]
+            for number in range(options["warmup"]):
+                self.iterate(client, scenario, context, number)
+            queries = []
+            self.iterate(client, scenario, context, 0, queries)
+            # Cached paths would report no queries at all otherwise.
+            cache.clear()
+            token_cache.clear()
+            self.iterate(client, scenario, context, 0, queries)
+            latencies = [
+                self.iterate(client, scenario, context, number)
+                for number in range(options["iterations"])
+            ]
+            result = {
+                **percentiles(latencies),
+                "cached_queries": queries[0],
+                "queries": queries[1],
+            }
+            results[scenario.name] = result
+            self.stdout.write(
+                f"{scenario.name:<32} {result['p50']:>8.1f} "
+                f"{result['p90']:>8.1f} {result['p99']:>8.1f} "
+                f"{result['queries']:>7} {result['cached_queries']:>7}"
+            )
+        return results
+
+    def load_baseline(self, path, dataset):
+        """The baseline of this backend; checked before seeding."""
+        vendor = connection.vendor
+        try:
+            baseline = json.loads(path.read_text())[vendor]
+        except (OSError, ValueError, KeyError):
+            raise CommandError(f"{path} has no {vendor} baseline")
+        if baseline["dataset"] != dataset:
+            raise CommandError(
+                "The baseline was recorded with another dataset: "
+                f"{baseline['dataset']}"
+            )
+        return baseline
+
+    def report(self, results, dataset, baseline, options):
+        vendor = connection.vendor
+        if options["save_baseline"]:
+            path = options["save_baseline"]
+            stored = json.loads(path.read_text()) if path.exists() else {}
+            stored[vendor] = {"dataset": dataset, "scenarios": results}
+            path.write_text(
+                json.dumps(stored, indent=2, sort_keys=True) + "\n"
+            )
+            self.stdout.write(f"Saved the {vendor} baseline to {path}")
+        if baseline is None:
+            return
+        found = regressions(
+            results, baseline["scenarios"], options["threshold"]
+        )
+        if found:
+            raise CommandError(
+                "Regressed against the baseline:\n" + "\n".join(found)
+            )
+        self.stdout.write(
+            self.style.SUCCESS("No regressions against the baseline")
+        )
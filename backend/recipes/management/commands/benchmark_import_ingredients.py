@@ -0,0 +1,102 @@
+import csv
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.management.commands.import_ingredients import (
+    DEFAULT_BATCH_SIZE,
+    import_ingredients,
+    iter_csv,
+)
+from recipes.models import Ingredient
+
+UNITS = ("г", "кг", "мл", "л", "шт.", "ст. л.", "ч. л.", "по вкусу")
+
+
+class Rollback(Exception):
+    """Raised to undo a benchmark run."""
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the per-row get_or_create import with the batched one. "
+        "Every run is rolled back, the database is left untouched."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--rows",
+            type=int,
+            default=100_000,
+            help="Number of synthetic ingredients to import",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=DEFAULT_BATCH_SIZE,
+        )
+        parser.add_argument(
+            "--skip-legacy",
+            action="store_true",
+            help="Only time the batched import",
+        )
+
+    def handle(self, *args, **options):
+        rows = options["rows"]
+        with tempfile.NamedTemporaryFile(
+            "w+", suffix=".csv", encoding="utf-8", newline=""
+        ) as file:
+            writer = csv.writer(file)
+            for number in range(rows):
+                writer.writerow(
+                    (f"ингредиент {number}", UNITS[number % len(UNITS)])
+                )
+            file.flush()
+
+            results = {}
+            if not options["skip_legacy"]:
+                results["get_or_create"] = self.run(
+                    file, self.legacy_import
+                )
+            results["bulk_create"] = self.run(
+                file,
+                lambda file: import_ingredients(
+                    file, "csv", options["batch_size"]
+                ),
+            )
+
+        for name, elapsed in results.items():
+            self.stdout.write(
+                f"{name:>14}: {elapsed:8.2f}s "
+                f"{rows / elapsed:10.0f} rows/sec"
+            )
+        if len(results) == 2:
+            self.stdout.write(
+                self.style.SUCCESS(
+                    "Speed-up: "
+                    f"{results['get_or_create'] / results['bulk_create']:.1f}x"
+                )
+            )
+
+    @staticmethod
+    def legacy_import(file):
+        for row in iter_csv(file):
+            Ingredient.objects.get_or_create(
+                name=row["name"],
+                measurement_unit=row["measurement_unit"],
+            )
+
+    @staticmethod
+    def run(file, importer):
+        file.seek(0)
+        started = time.perf_counter()
+        try:
+            with transaction.atomic():
+                importer(file)
+                elapsed = time.perf_counter() - started
+                raise Rollback
+        except Rollback:
+            pass
+        return elapsed
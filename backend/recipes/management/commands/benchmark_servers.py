@@ -0,0 +1,214 @@
+import asyncio
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.models import Ingredient, Recipe
+
+HOST = "127.0.0.1"
+DEFAULT_PATHS = (
+    "/api/recipes/",
+    "/api/recipes/{recipe}/",
+    "/api/tags/",
+    "/api/ingredients/?name={prefix}",
+)
+STARTUP_TIMEOUT = 30
+
+
+async def fetch(port, path, headers):
+    # One connection per request: sync gunicorn workers close it anyway.
+    reader, writer = await asyncio.open_connection(HOST, port)
+    try:
+        writer.write(
+            (
+                f"GET {path} HTTP/1.1\r\nHost: {HOST}:{port}\r\n"
+                f"Accept: application/json\r\n{headers}"
+                "Connection: close\r\n\r\n"
+            ).encode()
+        )
+        await writer.drain()
+        status = int((await reader.readline()).split()[1])
+        await reader.read()
+        return status
+    finally:
+        writer.close()
+
+
+async def run_load(port, paths, total, concurrency, headers):
+    """Latencies in seconds, errors and elapsed time of ``total`` GETs."""
+    latencies = []
+    errors = 0
+    sent = 0
+
+    async def client():
+        nonlocal errors, sent
+        while sent < total:
+            path = paths[sent % len(paths)]
+            sent += 1
+            started = time.perf_counter()
+            try:
+                status = await fetch(port, path, headers)
+            except (OSError, ValueError, IndexError):
+                status = 0
+            latencies.append(time.perf_counter() - started)
+            if not 200 <= status < 400:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return latencies, errors, time.perf_counter() - started
+
+
+def wait_for_port(port, process):
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise CommandError(f"Server exited with code {process.returncode}")
+        try:
+            socket.create_connection((HOST, port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise CommandError(f"Server did not listen on port {port}")
+
+
+def tree_rss(pid):
+    """Resident memory of a process and its children in MiB, if known."""
+    proc = Path("/proc")
+    if not proc.is_dir():
+        return None
+    children = {}
+    for stat in proc.glob("[0-9]*/stat"):
+        try:
+            fields = stat.read_text().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+        children.setdefault(int(fields[1]), []).append(int(stat.parent.name))
+    total = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        pending.extend(children.get(current, ()))
+        try:
+            status = (proc / str(current) / "status").read_text()
+        except OSError:
+            continue
+        for line in status.splitlines():
+            if line.startswith("VmRSS:"):
+                total += int(line.split()[1])
+    return total / 1024
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare requests/sec and latency of the read endpoints under "
+        "sync gunicorn (WSGI) and uvicorn (ASGI) workers. Pick worker "
+        "counts that give both servers the same resident memory"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=2000)
+        parser.add_argument("--concurrency", type=int, default=32)
+        parser.add_argument("--warmup", type=int, default=200)
+        parser.add_argument("--wsgi-workers", type=int, default=4)
+        parser.add_argument("--asgi-workers", type=int, default=4)
+        parser.add_argument("--port", type=int, default=8765)
+        parser.add_argument(
+            "--path",
+            action="append",
+            dest="paths",
+            help="Path to request, repeatable; {recipe} and {prefix} are "
+            "replaced with an existing recipe id and ingredient prefix",
+        )
+        parser.add_argument(
+            "--token", help="Send requests as the owner of this auth token"
+        )
+
+    def handle(self, *args, **options):
+        recipe = Recipe.objects.values_list("pk", flat=True).first()
+        ingredient = Ingredient.objects.values_list("name", flat=True).first()
+        if recipe is None or ingredient is None:
+            raise CommandError("Benchmark needs recipes and ingredients")
+        paths = [
+            path.format(recipe=recipe, prefix=quote(ingredient[:2]))
+            for path in options["paths"] or DEFAULT_PATHS
+        ]
+        headers = ""
+        if options["token"]:
+            headers = f"Authorization: Token {options['token']}\r\n"
+        port = options["port"]
+        servers = (
+            (
+                "gunicorn (WSGI)",
+                options["wsgi_workers"],
+                [
+                    "gunicorn",
+                    f"--workers={options['wsgi_workers']}",
+                    f"--bind={HOST}:{port}",
+                    "project_root.wsgi",
+                ],
+            ),
+            (
+                "uvicorn (ASGI)",
+                options["asgi_workers"],
+                [
+                    "uvicorn",
+                    f"--workers={options['asgi_workers']}",
+                    f"--host={HOST}",
+                    f"--port={port}",
+                    "--no-access-log",
+                    "project_root.asgi:application",
+                ],
+            ),
+        )
+        self.stdout.write(
+            f"{'server':<16} {'workers':>7} {'req/s':>8} {'p50 ms':>8} "
+            f"{'p99 ms':>8} {'errors':>6} {'RSS MiB':>8}"
+        )
+        for name, workers, command in servers:
+            process = subprocess.Popen(
+                [sys.executable, "-m", *command],
+                cwd=settings.BASE_DIR,
+                env=os.environ.copy(),
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            )
+            try:
+                wait_for_port(port, process)
+                asyncio.run(
+                    run_load(
+                        port,
+                        paths,
+                        options["warmup"],
+                        options["concurrency"],
+                        headers,
+                    )
+                )
+                latencies, errors, elapsed = asyncio.run(
+                    run_load(
+                        port,
+                        paths,
+                        options["requests"],
+                        options["concurrency"],
+                        headers,
+                    )
+                )
+                rss = tree_rss(process.pid)
+            finally:
+                process.terminate()
+                process.wait()
+            cuts = statistics.quantiles(latencies, n=100)
+            self.stdout.write(
+                f"{name:<16} {workers:>7} {len(latencies) / elapsed:>8.1f} "
+                f"{cuts[49] * 1000:>8.1f} {cuts[98] * 1000:>8.1f} "
+                f"{errors:>6} "
+                + (f"{rss:>8.0f}" if rss is not None else f"{'n/a':>8}")
+            )
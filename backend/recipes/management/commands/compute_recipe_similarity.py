@@ -0,0 +1,58 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from recipes.similarity import (
+    BLOCK_SIZE,
+    DEFAULT_MAX_DF,
+    DEFAULT_TOP_K,
+    refresh_similarities,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute similar recipes from ingredients, favorites and carts; "
+        "only recipes changed since the last run unless --full is given"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--top-k",
+            type=int,
+            default=DEFAULT_TOP_K,
+            help="Neighbours stored per recipe",
+        )
+        parser.add_argument(
+            "--max-df",
+            type=int,
+            default=DEFAULT_MAX_DF,
+            help="Skip features shared by more recipes than this",
+        )
+        parser.add_argument(
+            "--block-size",
+            type=int,
+            default=BLOCK_SIZE,
+            help="Recipes computed and written at once",
+        )
+        parser.add_argument(
+            "--full",
+            action="store_true",
+            help="Recompute every recipe",
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        recipes, rows = refresh_similarities(
+            k=options["top_k"],
+            max_df=options["max_df"],
+            full=options["full"],
+            block_size=options["block_size"],
+        )
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Recomputed {recipes} recipes ({rows} neighbours) "
+                f"in {elapsed:.2f}s"
+            )
+        )
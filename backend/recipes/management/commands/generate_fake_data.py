@@ -0,0 +1,69 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes import fake_data
+
+DATASET_OPTIONS = (
+    "users",
+    "recipes",
+    "ingredients",
+    "ingredients_per_recipe",
+    "favorites",
+    "carts",
+    "subscriptions",
+    "seed",
+    "batch_size",
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Add a deterministic synthetic dataset with power-law popularity "
+        "to the database and report the insert rate of every table"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=100_000)
+        parser.add_argument("--recipes", type=int, default=1_000_000)
+        parser.add_argument("--ingredients", type=int, default=2000)
+        parser.add_argument("--ingredients-per-recipe", type=int, default=8)
+        parser.add_argument("--favorites", type=int, default=5_000_000)
+        parser.add_argument("--carts", type=int, default=500_000)
+        parser.add_argument("--subscriptions", type=int, default=1_000_000)
+        parser.add_argument(
+            "--seed",
+            type=int,
+            default=fake_data.DEFAULT_SEED,
+            help="The same seed and sizes give the same rows",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=fake_data.BATCH_SIZE,
+            help="Rows per INSERT or COPY",
+        )
+
+    def handle(self, *args, **options):
+        dataset = {name: options[name] for name in DATASET_OPTIONS}
+        if dataset["users"] < 2 or dataset["ingredients"] < 1:
+            raise CommandError(
+                "At least 2 users and 1 ingredient are needed"
+            )
+        if min(dataset.values()) < 0 or dataset["batch_size"] < 1:
+            raise CommandError("Sizes must not be negative")
+        started = time.perf_counter()
+        steps = fake_data.generate(**dataset)
+        elapsed = time.perf_counter() - started
+        for step, (rows, seconds) in steps.items():
+            self.stdout.write(
+                f"{step:>18}: {rows:>10} rows in {seconds:7.2f}s "
+                f"({rows / max(seconds, 1e-9):,.0f} rows/s)"
+            )
+        total = sum(rows for rows, _ in steps.values())
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Generated {total} rows in {elapsed:.2f}s "
+                f"({total / elapsed:,.0f} rows/s)"
+            )
+        )
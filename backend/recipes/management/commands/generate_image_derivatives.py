@@ -0,0 +1,64 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from recipes.images import init_worker, generate_derivatives
+from recipes.models import Recipe
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = "Generate thumbnails and WebP variants for existing images"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=settings.IMAGE_DERIVATIVE_WORKERS,
+            help="Number of worker processes",
+        )
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Regenerate derivatives that already exist",
+        )
+
+    def handle(self, *args, **options):
+        names = set(
+            Recipe.objects.exclude(image="").values_list("image", flat=True)
+        )
+        names.update(
+            User.objects.exclude(avatar="").exclude(avatar__isnull=True)
+            .values_list("avatar", flat=True)
+        )
+        created = failed = 0
+        generate = partial(_safe_generate, force=options["force"])
+        with ProcessPoolExecutor(
+            max_workers=options["workers"],
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_worker,
+        ) as executor:
+            for name, result in zip(
+                names, executor.map(generate, names, chunksize=8)
+            ):
+                if result is None:
+                    failed += 1
+                    self.stderr.write(f"Could not process {name}")
+                else:
+                    created += len(result)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Processed {len(names)} images: {created} derivatives "
+                f"created, {failed} failed"
+            )
+        )
+
+
+def _safe_generate(name, force=False):
+    try:
+        return generate_derivatives(name, force=force)
+    except Exception:
+        return None
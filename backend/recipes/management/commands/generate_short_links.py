@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from recipes.short_links import GENERATE_BATCH_SIZE, create_missing_links
+
+
+class Command(BaseCommand):
+    help = "Allocate short link codes for recipes that have none"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=GENERATE_BATCH_SIZE,
+            help="Codes inserted per statement",
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        created = create_missing_links(options["batch_size"])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Created {created} short links in {elapsed:.2f}s"
+            )
+        )
@@ -1,21 +1,134 @@
+import csv
 import json
+import time
+from itertools import islice
+from pathlib import Path
 
-from django.core.management.base import BaseCommand
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
 
 from recipes.models import Ingredient
+from recipes.versions import INGREDIENTS_VERSION, bump_version_on_commit
+
+FORMATS = ("json", "jsonl", "csv")
+EXTENSIONS = {".json": "json", ".jsonl": "jsonl", ".ndjson": "jsonl",
+              ".csv": "csv"}
+DEFAULT_BATCH_SIZE = 1000
+READ_CHUNK_SIZE = 64 * 1024
+
+
+def iter_json_array(file):
+    """Yield the items of a top-level JSON array without loading it all."""
+    decoder = json.JSONDecoder()
+    buffer = file.read(READ_CHUNK_SIZE).lstrip()
+    if not buffer.startswith("["):
+        raise CommandError("JSON input must be an array of objects")
+    buffer = buffer[1:]
+    eof = False
+    while True:
+        buffer = buffer.lstrip().lstrip(",").lstrip()
+        if buffer.startswith("]"):
+            return
+        try:
+            item, end = decoder.raw_decode(buffer)
+        except json.JSONDecodeError:
+            if eof:
+                raise CommandError("Malformed or truncated JSON input")
+            chunk = file.read(READ_CHUNK_SIZE)
+            eof = not chunk
+            buffer += chunk
+            continue
+        yield item
+        buffer = buffer[end:]
+
+
+def iter_json_lines(file):
+    for line in file:
+        if line.strip():
+            yield json.loads(line)
+
+
+def iter_csv(file):
+    for row in csv.reader(file):
+        if len(row) < 2 or row[:2] == ["name", "measurement_unit"]:
+            continue
+        yield {"name": row[0], "measurement_unit": row[1]}
+
+
+READERS = {
+    "json": iter_json_array,
+    "jsonl": iter_json_lines,
+    "csv": iter_csv,
+}
+
+
+def iter_ingredients(file, file_format):
+    """Yield ``Ingredient`` instances parsed from ``file``."""
+    for position, item in enumerate(READERS[file_format](file), start=1):
+        if not isinstance(item, dict):
+            raise CommandError(f"Item {position} is not an object")
+        name = (item.get("name") or "").strip()
+        unit = (item.get("measurement_unit") or "").strip()
+        if name and unit:
+            yield Ingredient(name=name, measurement_unit=unit)
+
+
+def import_ingredients(file, file_format, batch_size=DEFAULT_BATCH_SIZE):
+    """Upsert ingredients from ``file`` in batches; return rows read."""
+    ingredients = iter_ingredients(file, file_format)
+    total = 0
+    while batch := list(islice(ingredients, batch_size)):
+        # Both columns are part of the unique_ingredient constraint, so
+        # an existing row has nothing to update and conflicts are skipped.
+        Ingredient.objects.bulk_create(batch, ignore_conflicts=True)
+        total += len(batch)
+    bump_version_on_commit(INGREDIENTS_VERSION)
+    return total
 
 
 class Command(BaseCommand):
-    help = "Import ingredients from JSON file"
+    help = "Import ingredients from a JSON, JSON Lines or CSV file"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "path",
+            nargs="?",
+            default=Path(settings.BASE_DIR) / "data" / "ingredients.csv",
+            help="File to import (default: data/ingredients.csv)",
+        )
+        parser.add_argument(
+            "--format",
+            choices=FORMATS,
+            help="Input format; guessed from the file extension by default",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=DEFAULT_BATCH_SIZE,
+            help="Rows per INSERT statement",
+        )
 
     def handle(self, *args, **options):
-        with open("/app/data/ingredients.json", encoding="utf-8") as file:
-            ingredients = json.load(file)
-            for ingredient in ingredients:
-                Ingredient.objects.get_or_create(
-                    name=ingredient["name"],
-                    measurement_unit=ingredient["measurement_unit"],
+        path = Path(options["path"])
+        file_format = options["format"] or EXTENSIONS.get(path.suffix.lower())
+        if file_format is None:
+            raise CommandError(
+                f"Cannot guess the format of {path}, pass --format"
+            )
+        before = Ingredient.objects.count()
+        started = time.perf_counter()
+        try:
+            with open(path, encoding="utf-8", newline="") as file:
+                total = import_ingredients(
+                    file, file_format, options["batch_size"]
                 )
+        except OSError as error:
+            raise CommandError(f"Cannot read {path}: {error}")
+        elapsed = time.perf_counter() - started
+        created = Ingredient.objects.count() - before
         self.stdout.write(
-            self.style.SUCCESS("Successfully imported ingredients")
+            self.style.SUCCESS(
+                f"Imported {total} rows ({created} new) in {elapsed:.2f}s, "
+                f"{total / elapsed if elapsed else total:.0f} rows/sec"
+            )
         )
@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.search import REBUILD_BATCH_SIZE, rebuild_index
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text recipe search index from scratch"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=REBUILD_BATCH_SIZE,
+            help="Recipes indexed per statement",
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        with transaction.atomic():
+            total = rebuild_index(options["batch_size"])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            self.style.SUCCESS(f"Indexed {total} recipes in {elapsed:.2f}s")
+        )
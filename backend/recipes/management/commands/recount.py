@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.counters import recount_recipes, recount_users
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the denormalised favorite, shopping cart, recipe and "
+        "follower counters and fix the rows that drifted"
+    )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        with transaction.atomic():
+            fixed = {**recount_recipes(), **recount_users()}
+        elapsed = time.perf_counter() - started
+        for field, rows in fixed.items():
+            self.stdout.write(f"{field:>16}: {rows} rows fixed")
+        self.stdout.write(
+            self.style.SUCCESS(f"Recounted in {elapsed:.2f}s")
+        )
@@ -0,0 +1,79 @@
+# Generated by Django 5.2 on 2026-10-18 20:31
+
+from django.conf import settings
+from django.db import migrations
+
+POSTGRES_TABLE = 'recipes_recipe_search'
+SQLITE_TABLE = 'recipes_recipe_fts'
+
+
+def normalized(column):
+    return f"replace(replace({column}, 'ё', 'е'), 'Ё', 'Е')"
+
+
+def documents(aggregate):
+    return (
+        f"SELECT r.id, {normalized('r.name')}, "
+        f"coalesce({aggregate}, ''), {normalized('r.text')} "
+        'FROM recipes_recipe r '
+        'LEFT JOIN recipes_recipeingredient ri ON ri.recipe_id = r.id '
+        'LEFT JOIN recipes_ingredient i ON i.id = ri.ingredient_id '
+        'GROUP BY r.id'
+    )
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        config = settings.RECIPE_SEARCH_CONFIG
+        schema_editor.execute(
+            f'CREATE TABLE {POSTGRES_TABLE} ('
+            'recipe_id bigint PRIMARY KEY '
+            'REFERENCES recipes_recipe (id) ON DELETE CASCADE, '
+            'document tsvector NOT NULL)'
+        )
+        schema_editor.execute(
+            f'CREATE INDEX {POSTGRES_TABLE}_document_idx '
+            f'ON {POSTGRES_TABLE} USING GIN (document)'
+        )
+        source = documents(f"string_agg({normalized('i.name')}, ' ')")
+        schema_editor.execute(
+            f'INSERT INTO {POSTGRES_TABLE} (recipe_id, document) '
+            'SELECT id, '
+            "setweight(to_tsvector(%s::regconfig, name), 'A') || "
+            "setweight(to_tsvector(%s::regconfig, ingredients), 'B') || "
+            "setweight(to_tsvector(%s::regconfig, text), 'C') "
+            f'FROM ({source}) AS source (id, name, ingredients, text)',
+            (config, config, config),
+        )
+    elif vendor == 'sqlite':
+        schema_editor.execute(
+            f'CREATE VIRTUAL TABLE {SQLITE_TABLE} USING fts5('
+            'name, ingredients, text, '
+            "tokenize = 'unicode61 remove_diacritics 2', "
+            "prefix = '2 3')"
+        )
+        source = documents(f"group_concat({normalized('i.name')}, ' ')")
+        schema_editor.execute(
+            f'INSERT INTO {SQLITE_TABLE} (rowid, name, ingredients, text) '
+            f'{source}'
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(f'DROP TABLE {POSTGRES_TABLE}')
+    elif vendor == 'sqlite':
+        schema_editor.execute(f'DROP TABLE {SQLITE_TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0004_recipe_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2 on 2026-10-18 20:02
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def fill_feeds(apps, schema_editor):
+    Subscription = apps.get_model('users', 'Subscription')
+    Recipe = apps.get_model('recipes', 'Recipe')
+    FeedEntry = apps.get_model('recipes', 'FeedEntry')
+    subscriptions = Subscription.objects.filter(
+        author__followers_count__lt=settings.FEED_FANOUT_MAX_FOLLOWERS
+    ).values_list('user_id', 'author_id')
+    for user_id, author_id in subscriptions.iterator():
+        FeedEntry.objects.bulk_create(
+            (
+                FeedEntry(user_id=user_id, recipe_id=recipe_id,
+                          pub_date=pub_date)
+                for recipe_id, pub_date in Recipe.objects.filter(
+                    author_id=author_id
+                ).values_list('id', 'pub_date')
+            ),
+            batch_size=1000,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0005_recipe_search_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('users', '0003_user_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pub_date', models.DateTimeField(verbose_name='Дата публикации')),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed_entries', to='recipes.recipe', verbose_name='Рецепт')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed_entries', to=settings.AUTH_USER_MODEL, verbose_name='Подписчик')),
+            ],
+            options={
+                'verbose_name': 'Запись ленты',
+                'verbose_name_plural': 'Записи ленты',
+                'indexes': [models.Index(fields=['user', '-pub_date', '-recipe'], name='feed_entry_user_pub_date_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user', 'recipe'), name='unique_feed_entry')],
+            },
+        ),
+        migrations.RunPython(fill_feeds, migrations.RunPython.noop),
+    ]
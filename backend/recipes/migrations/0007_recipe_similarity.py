@@ -0,0 +1,40 @@
+# Generated by Django 5.2 on 2026-10-18 20:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0006_feedentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeSimilarityState',
+            fields=[
+                ('recipe', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='similarity_state', serialize=False, to='recipes.recipe', verbose_name='Рецепт')),
+                ('fingerprint', models.BigIntegerField(verbose_name='Отпечаток признаков')),
+            ],
+            options={
+                'verbose_name': 'Состояние похожих рецептов',
+                'verbose_name_plural': 'Состояния похожих рецептов',
+            },
+        ),
+        migrations.CreateModel(
+            name='RecipeSimilarity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField(verbose_name='Сходство')),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similarities', to='recipes.recipe', verbose_name='Рецепт')),
+                ('similar_recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similar_to', to='recipes.recipe', verbose_name='Похожий рецепт')),
+            ],
+            options={
+                'verbose_name': 'Похожий рецепт',
+                'verbose_name_plural': 'Похожие рецепты',
+                'indexes': [models.Index(fields=['recipe', '-score'], name='recipe_similarity_score_idx')],
+                'constraints': [models.UniqueConstraint(fields=('recipe', 'similar_recipe'), name='unique_recipe_similarity')],
+            },
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 5.2 on 2026-10-18 21:09
+
+import os
+from itertools import islice
+
+from django.core.files.storage import default_storage
+from django.db import migrations, models
+
+BATCH_SIZE = 500
+# Frozen copies of recipes.images.DERIVATIVES_DIR and IMAGE_VARIANTS as of
+# this migration, so later changes to that module cannot alter it.
+DERIVATIVES_DIR = 'derivatives'
+VARIANTS = ('small', 'medium')
+
+
+def has_derivatives(name):
+    stem = os.path.splitext(name)[0]
+    return all(
+        default_storage.exists(f'{DERIVATIVES_DIR}/{stem}_{variant}.webp')
+        for variant in VARIANTS
+    )
+
+
+def mark_ready(model, field):
+    """Flag the rows whose stored image has all its derivatives."""
+    names = (
+        model.objects.exclude(**{field: ''})
+        .exclude(**{f'{field}__isnull': True})
+        .order_by()
+        .values_list(field, flat=True)
+        .distinct()
+        .iterator()
+    )
+    while batch := list(islice(names, BATCH_SIZE)):
+        model.objects.filter(**{
+            f'{field}__in': [
+                name for name in batch if has_derivatives(name)
+            ]
+        }).update(**{f'{field}_derivatives_ready': True})
+
+
+def fill_ready(apps, schema_editor):
+    mark_ready(apps.get_model('recipes', 'Recipe'), 'image')
+    mark_ready(apps.get_model('users', 'User'), 'avatar')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0008_shortlink'),
+        ('users', '0004_user_avatar_derivatives_ready'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='image_derivatives_ready',
+            field=models.BooleanField(default=False, editable=False, verbose_name='Превью картинки готовы'),
+        ),
+        migrations.RunPython(fill_ready, migrations.RunPython.noop),
+    ]
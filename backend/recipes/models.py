@@ -1,13 +1,21 @@
 from django.core.validators import MinValueValidator
 from django.db import models
-from django.db.models import UniqueConstraint
+from django.utils import timezone
+from django.db.models import (
+    Exists,
+    OuterRef,
+    Prefetch,
+    UniqueConstraint,
+    Value,
+)
 
-from users.models import User
+from users.models import CountersMixin, Subscription, User
 
 MAX_NAME_LENGTH = 200
 MAX_COLOR_LENGTH = 7
 MIN_COOKING_TIME = 1
 MIN_INGREDIENT_AMOUNT = 1
+MAX_SHORT_CODE_LENGTH = 16
 
 
 class Tag(models.Model):
@@ -64,7 +72,54 @@ class Ingredient(models.Model):
         return f"{self.name}, {self.measurement_unit}"
 
 
-class Recipe(models.Model):
+class RecipeQuerySet(models.QuerySet):
+    """Recipe queryset."""
+
+    def with_user_flags(self, user):
+        """Annotate the viewer-specific flags of ``user`` on each recipe.
+
+        Adds is_favorited, is_in_shopping_cart and is_author_subscribed.
+        """
+        if not user.is_authenticated:
+            return self.annotate(
+                is_favorited=Value(False),
+                is_in_shopping_cart=Value(False),
+                is_author_subscribed=Value(False),
+            )
+        return self.annotate(
+            is_favorited=Exists(
+                Favorite.objects.filter(user=user, recipe=OuterRef("pk"))
+            ),
+            is_in_shopping_cart=Exists(
+                ShoppingCart.objects.filter(user=user, recipe=OuterRef("pk"))
+            ),
+            is_author_subscribed=Exists(
+                Subscription.objects.filter(
+                    user=user, author=OuterRef("author")
+                )
+            ),
+        )
+
+    def touch(self):
+        """Mark the recipes as modified without loading them."""
+        return self.update(updated_at=timezone.now())
+
+    @staticmethod
+    def read_prefetches():
+        """Lookups that load everything RecipeSerializer reads."""
+        return (
+            "author",
+            "tags",
+            Prefetch(
+                "recipe_ingredients",
+                queryset=RecipeIngredient.objects.select_related(
+                    "ingredient"
+                ),
+            ),
+        )
+
+
+class Recipe(CountersMixin, models.Model):
     """Recipe model."""
 
     author = models.ForeignKey(
@@ -91,6 +146,11 @@ class Recipe(models.Model):
         "Картинка",
         upload_to="recipes/",
     )
+    image_derivatives_ready = models.BooleanField(
+        "Превью картинки готовы",
+        default=False,
+        editable=False,
+    )
     text = models.TextField(
         "Описание",
     )
@@ -107,11 +167,35 @@ class Recipe(models.Model):
         "Дата публикации",
         auto_now_add=True,
     )
+    updated_at = models.DateTimeField(
+        "Дата изменения",
+        auto_now=True,
+        db_index=True,
+    )
+    favorites_count = models.PositiveIntegerField(
+        "В избранном",
+        default=0,
+        editable=False,
+    )
+    in_carts_count = models.PositiveIntegerField(
+        "В списках покупок",
+        default=0,
+        editable=False,
+    )
+
+    objects = RecipeQuerySet.as_manager()
+
+    counter_fields = ("favorites_count", "in_carts_count")
 
     class Meta:
         verbose_name = "Рецепт"
         verbose_name_plural = "Рецепты"
         ordering = ["-pub_date"]
+        indexes = [
+            models.Index(
+                fields=["-pub_date", "-id"], name="recipe_pub_date_id_idx"
+            ),
+        ]
 
     def __str__(self):
         return self.name
@@ -200,3 +284,120 @@ class ShoppingCart(models.Model):
                 fields=["user", "recipe"], name="unique_shopping_cart"
             )
         ]
+
+
+class FeedEntry(models.Model):
+    """Recipe in the timeline of a follower of its author.
+
+    Written when a recipe is published or its author is followed, so a
+    page of the feed is one range scan over (user, pub_date).
+    """
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="feed_entries",
+        verbose_name="Подписчик",
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name="feed_entries",
+        verbose_name="Рецепт",
+    )
+    pub_date = models.DateTimeField(
+        "Дата публикации",
+    )
+
+    class Meta:
+        verbose_name = "Запись ленты"
+        verbose_name_plural = "Записи ленты"
+        constraints = [
+            UniqueConstraint(
+                fields=["user", "recipe"], name="unique_feed_entry"
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=["user", "-pub_date", "-recipe"],
+                name="feed_entry_user_pub_date_idx",
+            ),
+        ]
+
+
+class RecipeSimilarity(models.Model):
+    """Precomputed neighbour of a recipe, see compute_recipe_similarity."""
+
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name="similarities",
+        verbose_name="Рецепт",
+    )
+    similar_recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name="similar_to",
+        verbose_name="Похожий рецепт",
+    )
+    score = models.FloatField(
+        "Сходство",
+    )
+
+    class Meta:
+        verbose_name = "Похожий рецепт"
+        verbose_name_plural = "Похожие рецепты"
+        constraints = [
+            UniqueConstraint(
+                fields=["recipe", "similar_recipe"],
+                name="unique_recipe_similarity",
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=["recipe", "-score"],
+                name="recipe_similarity_score_idx",
+            ),
+        ]
+
+
+class RecipeSimilarityState(models.Model):
+    """Fingerprint of the features a recipe's neighbours were computed from."""
+
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="similarity_state",
+        verbose_name="Рецепт",
+    )
+    fingerprint = models.BigIntegerField(
+        "Отпечаток признаков",
+    )
+
+    class Meta:
+        verbose_name = "Состояние похожих рецептов"
+        verbose_name_plural = "Состояния похожих рецептов"
+
+
+class ShortLink(models.Model):
+    """Short code of a recipe, resolved by the /s/<code> redirect."""
+
+    code = models.CharField(
+        "Код",
+        max_length=MAX_SHORT_CODE_LENGTH,
+        unique=True,
+    )
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name="short_link",
+        verbose_name="Рецепт",
+    )
+
+    class Meta:
+        verbose_name = "Короткая ссылка"
+        verbose_name_plural = "Короткие ссылки"
+
+    def __str__(self):
+        return self.code
@@ -0,0 +1,207 @@
+import threading
+from collections import namedtuple
+from datetime import timedelta
+from itertools import chain
+
+import numpy as np
+from django.db.models import Max
+
+from recipes.models import Recipe, RecipeIngredient
+from recipes.versions import (
+    RECIPE_DELETIONS_VERSION,
+    RECIPE_INGREDIENTS_VERSION,
+    get_version,
+)
+
+# Recipes saved this long before the newest updated_at already indexed
+# are read again, for transactions that committed late.
+WATERMARK_OVERLAP = timedelta(minutes=1)
+# Postings appended since the last compaction, relative to the sorted ones.
+COMPACT_RATIO = 0.1
+LOAD_CHUNK_SIZE = 10_000
+
+PantryMatch = namedtuple("PantryMatch", "recipe_id covered missing")
+
+
+class PantryMatches:
+    """Ranked matches that only become PantryMatch objects when sliced."""
+
+    def __init__(self, recipe_ids, covered, missing):
+        self.recipe_ids = recipe_ids
+        self.covered = covered
+        self.missing = missing
+
+    def __len__(self):
+        return len(self.recipe_ids)
+
+    def __getitem__(self, item):
+        return [
+            PantryMatch(*match) for match in zip(
+                self.recipe_ids[item].tolist(),
+                self.covered[item].tolist(),
+                self.missing[item].tolist(),
+            )
+        ]
+
+
+class PantryIndex:
+    """Inverted index from ingredients to the recipes that use them.
+
+    Postings are sorted by ingredient id, so a pantry lookup slices them
+    with searchsorted and counts the covered ingredients of every recipe
+    in one bincount. Changed recipes mark their old postings dead and
+    append new ones, which are merged back in on compaction.
+    """
+
+    def __init__(self, pairs, watermark):
+        self.recipe_ids = np.unique(pairs[:, 0])
+        self.positions = {
+            recipe_id: position
+            for position, recipe_id in enumerate(self.recipe_ids.tolist())
+        }
+        recipe_positions = np.searchsorted(self.recipe_ids, pairs[:, 0])
+        self.sizes = np.bincount(
+            recipe_positions, minlength=len(self.recipe_ids)
+        )
+        self.set_postings(recipe_positions, pairs[:, 1])
+        self.watermark = watermark
+
+    def set_postings(self, recipe_positions, ingredient_ids):
+        by_ingredient = np.argsort(ingredient_ids, kind="stable")
+        self.ingredients = ingredient_ids[by_ingredient]
+        self.recipes = recipe_positions[by_ingredient]
+        self.alive = np.ones(len(self.recipes), dtype=bool)
+        # Lets update() find the postings of a recipe without a full scan.
+        self.by_recipe = np.argsort(self.recipes, kind="stable")
+        self.sorted_recipes = self.recipes[self.by_recipe]
+        self.extra_ingredients = np.empty(0, dtype=np.int64)
+        self.extra_recipes = np.empty(0, dtype=np.int64)
+
+    def search(self, pantry, max_missing):
+        """Recipes missing at most ``max_missing`` ingredients, best first.
+
+        Ranked by the share of the recipe covered by ``pantry``, then by
+        the number of missing ingredients, newest first on ties.
+        """
+        pantry = np.unique(np.fromiter(pantry, dtype=np.int64))
+        starts = np.searchsorted(self.ingredients, pantry, side="left")
+        ends = np.searchsorted(self.ingredients, pantry, side="right")
+        hits = [
+            self.recipes[start:end][self.alive[start:end]]
+            for start, end in zip(starts.tolist(), ends.tolist())
+            if end > start
+        ]
+        hits.append(
+            self.extra_recipes[np.isin(self.extra_ingredients, pantry)]
+        )
+        covered = np.bincount(
+            np.concatenate(hits), minlength=len(self.recipe_ids)
+        )
+        missing = self.sizes - covered
+        candidates = np.flatnonzero((covered > 0) & (missing <= max_missing))
+        coverage = covered[candidates] / self.sizes[candidates]
+        recipe_ids = self.recipe_ids[candidates]
+        order = np.lexsort((-recipe_ids, missing[candidates], -coverage))
+        candidates = candidates[order]
+        return PantryMatches(
+            recipe_ids[order], covered[candidates], missing[candidates]
+        )
+
+    def update(self, recipes):
+        """Replace the ingredients of ``recipes``, a recipe id to ids map."""
+        positions = []
+        for recipe_id in recipes:
+            position = self.positions.get(recipe_id)
+            if position is None:
+                position = len(self.recipe_ids)
+                self.positions[recipe_id] = position
+                self.recipe_ids = np.append(self.recipe_ids, recipe_id)
+                self.sizes = np.append(self.sizes, 0)
+            positions.append(position)
+        positions = np.asarray(positions, dtype=np.int64)
+        starts = np.searchsorted(self.sorted_recipes, positions, "left")
+        ends = np.searchsorted(self.sorted_recipes, positions, "right")
+        for start, end in zip(starts.tolist(), ends.tolist()):
+            self.alive[self.by_recipe[start:end]] = False
+        keep = ~np.isin(self.extra_recipes, positions)
+        ingredient_ids = [list(recipes[recipe_id]) for recipe_id in recipes]
+        self.extra_ingredients = np.concatenate((
+            self.extra_ingredients[keep],
+            np.fromiter(chain.from_iterable(ingredient_ids), np.int64),
+        ))
+        self.extra_recipes = np.concatenate((
+            self.extra_recipes[keep],
+            np.repeat(positions, [len(ids) for ids in ingredient_ids]),
+        ))
+        self.sizes[positions] = [len(ids) for ids in ingredient_ids]
+        if len(self.extra_recipes) > COMPACT_RATIO * len(self.recipes):
+            self.compact()
+
+    def compact(self):
+        self.set_postings(
+            np.concatenate(
+                (self.recipes[self.alive], self.extra_recipes)
+            ),
+            np.concatenate(
+                (self.ingredients[self.alive], self.extra_ingredients)
+            ),
+        )
+
+    def refresh(self):
+        """Apply the recipes saved since the index was last refreshed."""
+        recipes = Recipe.objects.all()
+        if self.watermark is not None:
+            recipes = recipes.filter(
+                updated_at__gte=self.watermark - WATERMARK_OVERLAP
+            )
+        changed = dict(recipes.values_list("id", "updated_at"))
+        if not changed:
+            return
+        ingredients = {recipe_id: [] for recipe_id in changed}
+        for recipe_id, ingredient_id in RecipeIngredient.objects.filter(
+            recipe_id__in=list(changed)
+        ).values_list("recipe_id", "ingredient_id"):
+            ingredients[recipe_id].append(ingredient_id)
+        self.update(ingredients)
+        self.watermark = max(
+            filter(None, (self.watermark, *changed.values()))
+        )
+
+
+def build_index():
+    """Load every recipe-ingredient pair into a fresh index."""
+    watermark = Recipe.objects.aggregate(Max("updated_at"))[
+        "updated_at__max"
+    ]
+    rows = (
+        RecipeIngredient.objects.order_by()
+        .values_list("recipe_id", "ingredient_id")
+        .iterator(chunk_size=LOAD_CHUNK_SIZE)
+    )
+    pairs = np.fromiter(chain.from_iterable(rows), dtype=np.int64)
+    return PantryIndex(pairs.reshape(-1, 2), watermark)
+
+
+_index = None
+_versions = None
+_lock = threading.Lock()
+
+
+def search_pantry(pantry, max_missing):
+    """Search this worker's index, bringing it up to date first.
+
+    Recipe saves are applied incrementally; a deleted recipe rebuilds
+    the index.
+    """
+    global _index, _versions
+    versions = (
+        get_version(RECIPE_DELETIONS_VERSION),
+        get_version(RECIPE_INGREDIENTS_VERSION),
+    )
+    with _lock:
+        if _index is None or _versions[0] != versions[0]:
+            _index = build_index()
+        elif _versions != versions:
+            _index.refresh()
+        _versions = versions
+        return _index.search(pantry, max_missing)
@@ -0,0 +1,251 @@
+import re
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+from recipes.autocomplete import normalize
+from recipes.models import Ingredient, Recipe, RecipeIngredient
+
+POSTGRES_TABLE = "recipes_recipe_search"
+SQLITE_TABLE = "recipes_recipe_fts"
+REBUILD_BATCH_SIZE = 10_000
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def _normalized(column):
+    # Lower-casing is left to the full-text engines; "ё" is not folded
+    # by either of them.
+    return f"replace(replace({column}, 'ё', 'е'), 'Ё', 'Е')"
+
+
+def _document_source(aggregate):
+    """SELECT of (id, name, ingredient names, text) for a set of recipes."""
+    return (
+        f"SELECT r.id, {_normalized('r.name')}, "
+        f"coalesce({aggregate}, ''), {_normalized('r.text')} "
+        f"FROM {Recipe._meta.db_table} r "
+        f"LEFT JOIN {RecipeIngredient._meta.db_table} ri "
+        "ON ri.recipe_id = r.id "
+        f"LEFT JOIN {Ingredient._meta.db_table} i "
+        "ON i.id = ri.ingredient_id "
+        "WHERE r.id IN ({ids}) GROUP BY r.id"
+    )
+
+
+def _pk_subquery(queryset):
+    return queryset.order_by().values("pk").query.sql_with_params()
+
+
+class SearchBackend:
+    """Matching and ranking of recipes against a full-text query."""
+
+    def search(self, queryset, query):
+        raise NotImplementedError
+
+    def index(self, queryset):
+        """(Re)index the recipes of ``queryset`` with their ingredients."""
+
+    def unindex(self, pks):
+        """Drop deleted recipes from the index."""
+
+    def clear(self):
+        """Empty the index before a full rebuild."""
+
+    def optimize(self):
+        """Compact the index after a full rebuild."""
+
+
+class PostgresSearch(SearchBackend):
+    """tsvector documents in a GIN-indexed side table.
+
+    Names weigh more than ingredients, which weigh more than the text.
+    """
+
+    table = POSTGRES_TABLE
+
+    def search(self, queryset, query):
+        query = normalize(query)
+        config = settings.RECIPE_SEARCH_CONFIG
+        tsquery = "websearch_to_tsquery(%s::regconfig, %s)"
+        return queryset.filter(
+            pk__in=RawSQL(
+                f"SELECT recipe_id FROM {self.table} "
+                f"WHERE document @@ {tsquery}",
+                (config, query),
+            )
+        ).annotate(
+            search_rank=RawSQL(
+                f"SELECT ts_rank(document, {tsquery}) FROM {self.table} "
+                f'WHERE recipe_id = "{Recipe._meta.db_table}"."id"',
+                (config, query),
+                output_field=FloatField(),
+            )
+        )
+
+    def index(self, queryset):
+        ids, params = _pk_subquery(queryset)
+        config = settings.RECIPE_SEARCH_CONFIG
+        source = _document_source(
+            f"string_agg({_normalized('i.name')}, ' ')"
+        ).format(ids=ids)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {self.table} (recipe_id, document) "
+                "SELECT id, "
+                "setweight(to_tsvector(%s::regconfig, name), 'A') || "
+                "setweight(to_tsvector(%s::regconfig, ingredients), 'B') || "
+                "setweight(to_tsvector(%s::regconfig, text), 'C') "
+                f"FROM ({source}) AS source (id, name, ingredients, text) "
+                "ON CONFLICT (recipe_id) "
+                "DO UPDATE SET document = EXCLUDED.document",
+                (config, config, config, *params),
+            )
+
+    # Rows of deleted recipes go away with ON DELETE CASCADE.
+
+    def clear(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"TRUNCATE {self.table}")
+
+
+class SqliteSearch(SearchBackend):
+    """FTS5 virtual table whose rowid is the recipe id."""
+
+    table = SQLITE_TABLE
+    # bm25() weights of the name, ingredients and text columns.
+    weights = (10.0, 4.0, 1.0)
+
+    @staticmethod
+    def match_expression(query):
+        # Every word becomes a quoted prefix term, so user input can never
+        # be parsed as FTS5 query syntax.
+        return " ".join(
+            f'"{word}"*' for word in _WORD_RE.findall(normalize(query))
+        )
+
+    def search(self, queryset, query):
+        match = self.match_expression(query)
+        if not match:
+            return queryset.none().annotate(
+                search_rank=Value(0.0, output_field=FloatField())
+            )
+        weights = ", ".join(map(str, self.weights))
+        return queryset.filter(
+            pk__in=RawSQL(
+                f"SELECT rowid FROM {self.table} WHERE {self.table} MATCH %s",
+                (match,),
+            )
+        ).annotate(
+            # bm25() is lower for better matches.
+            search_rank=RawSQL(
+                f"SELECT -bm25({self.table}, {weights}) FROM {self.table} "
+                f"WHERE {self.table} MATCH %s "
+                f'AND rowid = "{Recipe._meta.db_table}"."id"',
+                (match,),
+                output_field=FloatField(),
+            )
+        )
+
+    def index(self, queryset):
+        ids, params = _pk_subquery(queryset)
+        source = _document_source(
+            f"group_concat({_normalized('i.name')}, ' ')"
+        ).format(ids=ids)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"DELETE FROM {self.table} WHERE rowid IN ({ids})", params
+            )
+            cursor.execute(
+                f"INSERT INTO {self.table} (rowid, name, ingredients, text) "
+                f"{source}",
+                params,
+            )
+
+    def unindex(self, pks):
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"DELETE FROM {self.table} WHERE rowid = %s",
+                [(pk,) for pk in pks],
+            )
+
+    def clear(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table}")
+
+    def optimize(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {self.table} ({self.table}) VALUES ('optimize')"
+            )
+
+
+class LikeSearch(SearchBackend):
+    """Unindexed substring search for databases without a backend above."""
+
+    def search(self, queryset, query):
+        matches = Recipe.objects.none()
+        for word in _WORD_RE.findall(query):
+            matches = matches | Recipe.objects.filter(
+                Q(name__icontains=word)
+                | Q(text__icontains=word)
+                | Q(recipe_ingredients__ingredient__name__icontains=word)
+            )
+        return queryset.filter(pk__in=matches.values("pk")).annotate(
+            search_rank=Value(0.0, output_field=FloatField())
+        )
+
+
+BACKENDS = {
+    "postgresql": PostgresSearch,
+    "sqlite": SqliteSearch,
+}
+
+
+def get_backend():
+    return BACKENDS.get(connection.vendor, LikeSearch)()
+
+
+def search_recipes(queryset, query):
+    """Recipes of ``queryset`` matching ``query``, most relevant first."""
+    return get_backend().search(queryset, query).order_by(
+        "-search_rank", "-pub_date", "-id"
+    )
+
+
+def index_recipes(queryset):
+    get_backend().index(queryset)
+
+
+def index_recipes_on_commit(queryset):
+    """Reindex ``queryset`` once its ingredient rows are final."""
+    transaction.on_commit(lambda: index_recipes(queryset))
+
+
+def unindex_recipes(pks):
+    get_backend().unindex(pks)
+
+
+def rebuild_index(batch_size=REBUILD_BATCH_SIZE):
+    """Reindex every recipe in primary key ranges; return recipes indexed."""
+    backend = get_backend()
+    backend.clear()
+    total = 0
+    last_pk = 0
+    while True:
+        pks = list(
+            Recipe.objects.filter(pk__gt=last_pk)
+            .order_by("pk")
+            .values_list("pk", flat=True)[:batch_size]
+        )
+        if not pks:
+            break
+        backend.index(
+            Recipe.objects.filter(pk__gt=last_pk, pk__lte=pks[-1])
+        )
+        total += len(pks)
+        last_pk = pks[-1]
+    backend.optimize()
+    return total
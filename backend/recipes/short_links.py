@@ -0,0 +1,113 @@
+import re
+import secrets
+import string
+import threading
+from collections import OrderedDict
+from itertools import islice
+
+from django.conf import settings
+
+from recipes.models import MAX_SHORT_CODE_LENGTH, Recipe, ShortLink
+from recipes.versions import RECIPE_DELETIONS_VERSION, get_version
+
+ALPHABET = string.digits + string.ascii_letters
+CODE_RE = re.compile(rf"[0-9A-Za-z]{{1,{MAX_SHORT_CODE_LENGTH}}}")
+GENERATE_BATCH_SIZE = 1000
+
+
+def new_code():
+    return "".join(
+        secrets.choice(ALPHABET) for _ in range(settings.SHORT_LINK_LENGTH)
+    )
+
+
+def create_links(recipe_ids, batch_size=GENERATE_BATCH_SIZE):
+    """Allocate codes for recipes without one; return the number created.
+
+    Codes are random, so a batch is inserted ignoring conflicts and the
+    recipes whose code happened to be taken are retried with new ones.
+    """
+    created = 0
+    recipe_ids = map(int, recipe_ids)
+    while pending := list(islice(recipe_ids, batch_size)):
+        while pending:
+            links = [
+                ShortLink(code=new_code(), recipe_id=recipe_id)
+                for recipe_id in pending
+            ]
+            ShortLink.objects.bulk_create(links, ignore_conflicts=True)
+            stored = dict(
+                ShortLink.objects.filter(recipe_id__in=pending).values_list(
+                    "recipe_id", "code"
+                )
+            )
+            created += sum(
+                stored.get(link.recipe_id) == link.code for link in links
+            )
+            pending = [
+                recipe_id for recipe_id in pending if recipe_id not in stored
+            ]
+    return created
+
+
+def create_missing_links(batch_size=GENERATE_BATCH_SIZE):
+    """Allocate codes for every recipe without one, in primary key order."""
+    created = 0
+    last_pk = 0
+    while True:
+        pks = list(
+            Recipe.objects.filter(pk__gt=last_pk, short_link__isnull=True)
+            .order_by("pk")
+            .values_list("pk", flat=True)[:batch_size]
+        )
+        if not pks:
+            return created
+        created += create_links(pks, batch_size)
+        last_pk = pks[-1]
+
+
+def get_code(recipe_id):
+    """Code of the recipe, allocated on first use; None if it is missing."""
+    links = ShortLink.objects.filter(recipe_id=recipe_id)
+    code = links.values_list("code", flat=True).first()
+    if code is None and Recipe.objects.filter(pk=recipe_id).exists():
+        create_links([recipe_id])
+        code = links.values_list("code", flat=True).first()
+    return code
+
+
+_cache = OrderedDict()
+_cache_version = None
+_lock = threading.Lock()
+
+
+def resolve(code):
+    """Recipe id of ``code``, or None.
+
+    Codes never move to another recipe, so resolved ones are kept in
+    this worker's LRU cache, which a recipe deletion clears.
+    """
+    global _cache_version
+    if not CODE_RE.fullmatch(code):
+        return None
+    version = get_version(RECIPE_DELETIONS_VERSION)
+    with _lock:
+        if _cache_version != version:
+            _cache.clear()
+            _cache_version = version
+        recipe_id = _cache.get(code)
+        if recipe_id is not None:
+            _cache.move_to_end(code)
+            return recipe_id
+    recipe_id = (
+        ShortLink.objects.filter(code=code)
+        .values_list("recipe_id", flat=True)
+        .first()
+    )
+    # Unknown codes are not remembered, scanners would flush the cache.
+    if recipe_id is not None:
+        with _lock:
+            _cache[code] = recipe_id
+            if len(_cache) > settings.SHORT_LINK_CACHE_SIZE:
+                _cache.popitem(last=False)
+    return recipe_id
@@ -0,0 +1,236 @@
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+    pre_save,
+)
+from django.dispatch import receiver
+
+from recipes import feed
+from recipes.counters import RECIPE_COUNTERS, USER_COUNTERS, adjust_counter
+from recipes.images import missing_variants, schedule_derivatives
+from recipes.search import index_recipes_on_commit, unindex_recipes
+from recipes.models import (
+    Favorite,
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    ShoppingCart,
+    Tag,
+)
+from recipes.versions import (
+    INGREDIENTS_VERSION,
+    RECIPE_DELETIONS_VERSION,
+    RECIPE_INGREDIENTS_VERSION,
+    RECIPES_VERSION,
+    TAGS_VERSION,
+    bump_recipe_list_versions,
+    bump_shopping_carts,
+    bump_version_on_commit,
+    viewer_version_name,
+)
+from users.models import Subscription, User
+
+
+@receiver(post_save, sender=User)
+def author_changed(sender, instance, created, update_fields, **kwargs):
+    # Recipes embed their author's profile; logins only touch last_login.
+    if not created and set(update_fields or ()) != {"last_login"}:
+        Recipe.objects.filter(author=instance).touch()
+
+
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_delete, sender=ShoppingCart)
+@receiver(post_save, sender=Favorite)
+@receiver(post_delete, sender=Favorite)
+def recipe_list_changed(sender, instance, **kwargs):
+    bump_recipe_list_versions(sender, instance.user_id)
+
+
+@receiver(post_save, sender=Subscription)
+@receiver(post_delete, sender=Subscription)
+def subscription_changed(sender, instance, **kwargs):
+    bump_version_on_commit(viewer_version_name(instance.user_id))
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def recipe_saved_or_deleted(sender, **kwargs):
+    bump_version_on_commit(RECIPES_VERSION)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_changed(sender, instance, created, **kwargs):
+    # Ingredient rows are written in bulk, but every API and admin edit
+    # saves the recipe itself as well.
+    if not created:
+        bump_shopping_carts(recipe=instance)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "pre_clear"):
+        return
+    if not reverse:
+        Recipe.objects.filter(pk=instance.pk).touch()
+    elif action == "pre_clear":
+        Recipe.objects.filter(tags=instance).touch()
+    else:
+        Recipe.objects.filter(pk__in=pk_set).touch()
+
+
+@receiver(post_save, sender=RecipeIngredient)
+@receiver(post_delete, sender=RecipeIngredient)
+def recipe_ingredient_changed(sender, instance, **kwargs):
+    Recipe.objects.filter(pk=instance.recipe_id).touch()
+    index_recipes_on_commit(Recipe.objects.filter(pk=instance.recipe_id))
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_search_index(sender, instance, **kwargs):
+    # The serializers write ingredient rows in bulk around the recipe
+    # save, so the document is built after the commit.
+    index_recipes_on_commit(Recipe.objects.filter(pk=instance.pk))
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_search_unindex(sender, instance, **kwargs):
+    unindex_recipes([instance.pk])
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=RecipeIngredient)
+@receiver(post_delete, sender=RecipeIngredient)
+def pantry_recipe_changed(sender, **kwargs):
+    # Saved recipes carry a fresh updated_at, which the pantry index
+    # uses to pick them up.
+    bump_version_on_commit(RECIPE_INGREDIENTS_VERSION)
+
+
+@receiver(post_delete, sender=Recipe)
+def pantry_recipe_deleted(sender, **kwargs):
+    bump_version_on_commit(RECIPE_DELETIONS_VERSION)
+
+
+@receiver(post_save, sender=Tag)
+def tag_changed(sender, instance, created, **kwargs):
+    bump_version_on_commit(TAGS_VERSION)
+    if not created:
+        Recipe.objects.filter(tags=instance).touch()
+
+
+@receiver(pre_delete, sender=Tag)
+def tag_deleted(sender, instance, **kwargs):
+    bump_version_on_commit(TAGS_VERSION)
+    Recipe.objects.filter(tags=instance).touch()
+
+
+@receiver(post_save, sender=Ingredient)
+def ingredient_changed(sender, instance, created, **kwargs):
+    bump_version_on_commit(INGREDIENTS_VERSION)
+    if not created:
+        recipes = Recipe.objects.filter(
+            recipe_ingredients__ingredient=instance
+        )
+        recipes.touch()
+        index_recipes_on_commit(recipes)
+        bump_shopping_carts(recipe__recipe_ingredients__ingredient=instance)
+
+
+@receiver(post_delete, sender=Ingredient)
+def ingredient_deleted(sender, instance, **kwargs):
+    bump_version_on_commit(INGREDIENTS_VERSION)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_published(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        feed.fan_out(instance)
+
+
+@receiver(post_save, sender=Subscription)
+def author_followed(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        feed.backfill(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Subscription)
+def author_unfollowed(sender, instance, **kwargs):
+    feed.clean_up(instance.user_id, instance.author_id)
+
+
+def count_rows(model, owner_model, foreign_key, field):
+    """Keep ``owner_model.field`` equal to the number of ``model`` rows.
+
+    The counter is updated right after the row is written, inside the
+    same transaction when the caller opened one.
+    """
+
+    def owner(instance):
+        return owner_model.objects.filter(pk=getattr(instance, foreign_key))
+
+    @receiver(post_save, sender=model, weak=False)
+    def row_added(sender, instance, created, raw=False, **kwargs):
+        # Fixtures carry their counters with them.
+        if created and not raw:
+            adjust_counter(owner(instance), field, 1)
+
+    @receiver(post_delete, sender=model, weak=False)
+    def row_deleted(sender, instance, **kwargs):
+        adjust_counter(owner(instance), field, -1)
+
+
+for owner_model, counters in (
+    (Recipe, RECIPE_COUNTERS), (User, USER_COUNTERS)
+):
+    for field, (model, foreign_key) in counters.items():
+        count_rows(model, owner_model, f"{foreign_key}_id", field)
+
+
+# Connected after the counters, so followers_count is already lowered.
+@receiver(post_delete, sender=Subscription)
+def follower_lost(sender, instance, **kwargs):
+    feed.catch_up(instance.author_id)
+
+
+def track_derivatives(model, field):
+    """Keep ``<field>_derivatives_ready`` of ``model`` true to its image.
+
+    Derivatives are only looked for, and scheduled, when a save changes
+    the image: a login, which saves last_login, costs nothing.
+    """
+    ready_field = f"{field}_derivatives_ready"
+    # Set by pre_save when the image changes, read by post_save.
+    changed = f"_{field}_changed"
+
+    @receiver(pre_save, sender=model, weak=False)
+    def image_changing(sender, instance, update_fields=None, raw=False,
+                       **kwargs):
+        setattr(instance, changed, False)
+        if raw or (update_fields is not None and field not in update_fields):
+            return
+        name = getattr(instance, field).name or ""
+        if not instance._state.adding and name == (
+            model.objects.filter(pk=instance.pk)
+            .values_list(field, flat=True).first() or ""
+        ):
+            return
+        setattr(instance, changed, True)
+        setattr(
+            instance, ready_field, bool(name) and not missing_variants(name)
+        )
+
+    @receiver(post_save, sender=model, weak=False)
+    def image_changed(sender, instance, update_fields=None, **kwargs):
+        if not getattr(instance, changed, False):
+            return
+        ready = getattr(instance, ready_field)
+        if update_fields is not None and ready_field not in update_fields:
+            model.objects.filter(pk=instance.pk).update(**{ready_field: ready})
+        if not ready:
+            schedule_derivatives(getattr(instance, field).name)
+
+
+track_derivatives(Recipe, "image")
+track_derivatives(User, "avatar")
@@ -0,0 +1,259 @@
+from itertools import chain, islice
+
+import numpy as np
+from django.db import transaction
+
+from recipes.models import (
+    Favorite,
+    Recipe,
+    RecipeIngredient,
+    RecipeSimilarity,
+    RecipeSimilarityState,
+    ShoppingCart,
+)
+
+DEFAULT_TOP_K = 10
+# Features shared by more recipes than this (salt, water, a user who
+# favorites everything) are skipped when pairing recipes: they say little
+# about similarity and would pair nearly every recipe with every other.
+DEFAULT_MAX_DF = 5000
+BLOCK_SIZE = 256
+LOAD_CHUNK_SIZE = 10_000
+
+# Weights of ingredients, favorites and shopping carts, in code order.
+KIND_WEIGHTS = np.array([1.0, 2.0, 1.5])
+INGREDIENT, FAVORITE, CART = range(len(KIND_WEIGHTS))
+
+
+def load_pairs(queryset, *fields):
+    rows = (
+        queryset.order_by()
+        .values_list(*fields)
+        .iterator(chunk_size=LOAD_CHUNK_SIZE)
+    )
+    pairs = np.fromiter(chain.from_iterable(rows), dtype=np.int64)
+    return pairs.reshape(-1, len(fields))
+
+
+def _ranges(starts, lengths):
+    """Concatenation of range(start, start + length) for every pair."""
+    offsets = np.cumsum(lengths) - lengths
+    return np.repeat(starts - offsets, lengths) + np.arange(lengths.sum())
+
+
+def fingerprints(recipe_positions, codes, size):
+    """Order-independent hash of the feature codes of every recipe."""
+    mixed = codes.astype(np.uint64) * np.uint64(0x9E3779B97F4A7C15)
+    mixed ^= mixed >> np.uint64(29)
+    result = np.zeros(size, dtype=np.uint64)
+    np.add.at(result, recipe_positions, mixed)
+    return result.view(np.int64)
+
+
+class FeatureMatrix:
+    """Sparse TF-IDF vectors of recipes, normalised to unit length.
+
+    A recipe is described by its ingredients and by the users who added
+    it to favorites or to the shopping cart, so the dot product of two
+    rows is the cosine similarity of the recipes. Postings are kept
+    sorted both by recipe and by feature, which turns a block of rows of
+    the similarity matrix into searchsorted, repeat and bincount calls.
+    """
+
+    def __init__(self, recipe_ids, pairs_by_kind, max_df=DEFAULT_MAX_DF):
+        self.recipe_ids = recipe_ids
+        size = len(recipe_ids)
+        recipes = np.concatenate([
+            np.searchsorted(recipe_ids, pairs[:, 0]) for pairs in pairs_by_kind
+        ])
+        codes = np.concatenate([
+            pairs[:, 1] * len(KIND_WEIGHTS) + kind
+            for kind, pairs in enumerate(pairs_by_kind)
+        ])
+        self.fingerprints = fingerprints(recipes, codes, size)
+        _, features, df = np.unique(
+            codes, return_inverse=True, return_counts=True
+        )
+        df = df[features]
+        weights = KIND_WEIGHTS[codes % len(KIND_WEIGHTS)] * np.log(size / df)
+        norms = np.sqrt(np.bincount(recipes, weights ** 2, minlength=size))
+        norms[norms == 0] = 1
+        weights /= norms[recipes]
+        # Features of a single recipe cannot pair it with another one.
+        keep = (df > 1) & (df <= max_df)
+        recipes, features, weights = (
+            recipes[keep], features[keep], weights[keep]
+        )
+        by_recipe = np.argsort(recipes, kind="stable")
+        self.row_recipes = recipes[by_recipe]
+        self.row_features = features[by_recipe]
+        self.row_weights = weights[by_recipe]
+        by_feature = np.argsort(features, kind="stable")
+        self.column_features = features[by_feature]
+        self.column_recipes = recipes[by_feature]
+        self.column_weights = weights[by_feature]
+
+    def positions(self, recipe_ids):
+        recipe_ids = np.asarray(recipe_ids, dtype=np.int64)
+        positions = np.searchsorted(self.recipe_ids, recipe_ids)
+        positions = positions[positions < len(self.recipe_ids)]
+        return positions[self.recipe_ids[positions] == recipe_ids]
+
+    def scores(self, positions):
+        """Non-zero similarities of the recipes at ``positions``.
+
+        Returns (sources, targets, scores) with sources and targets as
+        positions, grouped by source and best first within a group.
+        """
+        size = len(self.recipe_ids)
+        starts = np.searchsorted(self.row_recipes, positions, "left")
+        ends = np.searchsorted(self.row_recipes, positions, "right")
+        rows = _ranges(starts, ends - starts)
+        sources = np.repeat(np.arange(len(positions)), ends - starts)
+        features = self.row_features[rows]
+        starts = np.searchsorted(self.column_features, features, "left")
+        ends = np.searchsorted(self.column_features, features, "right")
+        columns = _ranges(starts, ends - starts)
+        products = np.repeat(self.row_weights[rows], ends - starts)
+        products *= self.column_weights[columns]
+        pairs, inverse = np.unique(
+            np.repeat(sources, ends - starts) * size
+            + self.column_recipes[columns],
+            return_inverse=True,
+        )
+        scores = np.bincount(inverse, weights=products)
+        sources = positions[pairs // size]
+        targets = pairs % size
+        distinct = sources != targets
+        sources, targets, scores = (
+            sources[distinct], targets[distinct], scores[distinct]
+        )
+        order = np.lexsort((-scores, sources))
+        return sources[order], targets[order], scores[order]
+
+
+def top_k(sources, targets, scores, k):
+    """Keep the first ``k`` entries of every group of ``sources``."""
+    ranks = np.arange(len(sources)) - np.searchsorted(sources, sources)
+    best = ranks < k
+    return sources[best], targets[best], scores[best]
+
+
+def build_matrix(max_df=DEFAULT_MAX_DF):
+    """Load recipes, their ingredients, favorites and carts into a matrix."""
+    # load_pairs() drops the ordering; searchsorted needs the ids sorted.
+    recipe_ids = np.sort(load_pairs(Recipe.objects, "pk")[:, 0])
+    pairs_by_kind = [None] * len(KIND_WEIGHTS)
+    pairs_by_kind[INGREDIENT] = load_pairs(
+        RecipeIngredient.objects, "recipe_id", "ingredient_id"
+    )
+    pairs_by_kind[FAVORITE] = load_pairs(
+        Favorite.objects, "recipe_id", "user_id"
+    )
+    pairs_by_kind[CART] = load_pairs(
+        ShoppingCart.objects, "recipe_id", "user_id"
+    )
+    return FeatureMatrix(recipe_ids, pairs_by_kind, max_df)
+
+
+def changed_positions(matrix):
+    """Recipes whose features differ from those of their last computation."""
+    stored = load_pairs(
+        RecipeSimilarityState.objects, "recipe_id", "fingerprint"
+    )
+    fingerprints = np.zeros(len(matrix.recipe_ids), dtype=np.int64)
+    known = np.zeros(len(matrix.recipe_ids), dtype=bool)
+    positions = np.searchsorted(matrix.recipe_ids, stored[:, 0])
+    # Recipes deleted after the matrix was loaded.
+    present = positions < len(matrix.recipe_ids)
+    positions, stored = positions[present], stored[present]
+    present = matrix.recipe_ids[positions] == stored[:, 0]
+    positions, stored = positions[present], stored[present]
+    fingerprints[positions] = stored[:, 1]
+    known[positions] = True
+    return np.flatnonzero(~known | (fingerprints != matrix.fingerprints))
+
+
+def _blocks(positions, block_size):
+    positions = iter(positions.tolist())
+    while block := list(islice(positions, block_size)):
+        yield np.asarray(block, dtype=np.int64)
+
+
+def _save(matrix, positions, sources, targets, scores):
+    recipe_ids = matrix.recipe_ids
+    with transaction.atomic():
+        RecipeSimilarity.objects.filter(
+            recipe_id__in=recipe_ids[positions].tolist()
+        ).delete()
+        RecipeSimilarity.objects.bulk_create(
+            RecipeSimilarity(
+                recipe_id=recipe_id,
+                similar_recipe_id=similar_recipe_id,
+                score=score,
+            )
+            for recipe_id, similar_recipe_id, score in zip(
+                recipe_ids[sources].tolist(),
+                recipe_ids[targets].tolist(),
+                scores.tolist(),
+            )
+        )
+    return len(sources)
+
+
+def _save_states(matrix, positions):
+    recipe_ids = matrix.recipe_ids[positions].tolist()
+    with transaction.atomic():
+        RecipeSimilarityState.objects.filter(recipe_id__in=recipe_ids).delete()
+        RecipeSimilarityState.objects.bulk_create(
+            RecipeSimilarityState(recipe_id=recipe_id, fingerprint=value)
+            for recipe_id, value in zip(
+                recipe_ids, matrix.fingerprints[positions].tolist()
+            )
+        )
+
+
+def refresh_similarities(
+    k=DEFAULT_TOP_K,
+    max_df=DEFAULT_MAX_DF,
+    full=False,
+    block_size=BLOCK_SIZE,
+):
+    """Recompute the nearest neighbours of changed recipes.
+
+    A recipe is recomputed when its ingredients, favorites or carts
+    changed since its last computation, and so is every recipe that
+    shares a feature with it or listed it as a neighbour. The weights of
+    features drift slowly as the catalogue grows, which only a ``full``
+    run accounts for. Returns the numbers of recipes and rows written.
+    """
+    matrix = build_matrix(max_df)
+    if full:
+        changed = np.arange(len(matrix.recipe_ids))
+    else:
+        changed = changed_positions(matrix)
+        full = len(changed) == len(matrix.recipe_ids)
+    affected = []
+    recipes = rows = 0
+    for block in _blocks(changed, block_size):
+        sources, targets, scores = matrix.scores(block)
+        if not full:
+            affected.append(np.unique(targets))
+        rows += _save(matrix, block, *top_k(sources, targets, scores, k))
+        recipes += len(block)
+    if affected:
+        listers = load_pairs(
+            RecipeSimilarity.objects.filter(
+                similar_recipe_id__in=matrix.recipe_ids[changed].tolist()
+            ),
+            "recipe_id",
+        )[:, 0]
+        affected.append(matrix.positions(listers))
+        affected = np.setdiff1d(np.concatenate(affected), changed)
+        for block in _blocks(affected, block_size):
+            rows += _save(
+                matrix, block, *top_k(*matrix.scores(block), k)
+            )
+            recipes += len(block)
+    _save_states(matrix, changed)
+    return recipes, rows
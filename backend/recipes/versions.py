@@ -0,0 +1,91 @@
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+from recipes.models import ShoppingCart
+
+VERSION_PREFIX = "version"
+INGREDIENTS_VERSION = "ingredients"
+TAGS_VERSION = "tags"
+# Saved and deleted recipes, for the recipe lists.
+RECIPES_VERSION = "recipes"
+# Ingredient sets of saved recipes, and recipe deletions, for the pantry.
+RECIPE_INGREDIENTS_VERSION = "recipe_ingredients"
+RECIPE_DELETIONS_VERSION = "recipe_deletions"
+
+
+def _cache_key(name):
+    return f"{VERSION_PREFIX}:{name}"
+
+
+def _initial_version():
+    # Start from the clock so a version that was evicted from the cache
+    # never comes back with a value that old cache entries were keyed by.
+    return time.time_ns()
+
+
+def get_version(name):
+    """Current value of the version counter ``name``."""
+    key = _cache_key(name)
+    version = cache.get(key)
+    if version is None:
+        version = _initial_version()
+        if not cache.add(key, version, timeout=None):
+            version = cache.get(key, version)
+    return version
+
+
+async def aget_version(name):
+    """get_version() for async views."""
+    key = _cache_key(name)
+    version = await cache.aget(key)
+    if version is None:
+        version = _initial_version()
+        if not await cache.aadd(key, version, timeout=None):
+            version = await cache.aget(key, version)
+    return version
+
+
+def bump_version(*names):
+    """Invalidate everything keyed by the version counters ``names``."""
+    for name in names:
+        key = _cache_key(name)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, _initial_version(), timeout=None)
+
+
+def bump_version_on_commit(*names):
+    """Bump ``names`` once the current transaction has been committed."""
+    transaction.on_commit(lambda: bump_version(*names))
+
+
+def viewer_version_name(user_id):
+    """Counter of the user's favorites, cart and subscriptions."""
+    return f"viewer:{user_id}"
+
+
+def shopping_cart_version_name(user_id):
+    return f"shopping_cart:{user_id}"
+
+
+def bump_recipe_list_versions(model, user_id):
+    """Invalidate views of the user's Favorite or ShoppingCart rows."""
+    names = [viewer_version_name(user_id)]
+    if model is ShoppingCart:
+        names.append(shopping_cart_version_name(user_id))
+    bump_version_on_commit(*names)
+
+
+def bump_shopping_carts(**recipe_filter):
+    """Invalidate the carts of every user holding the matching recipes."""
+    user_ids = (
+        ShoppingCart.objects.filter(**recipe_filter)
+        .values_list("user_id", flat=True)
+        .distinct()
+    )
+    bump_version_on_commit(
+        *(shopping_cart_version_name(user_id) for user_id in user_ids)
+    )
@@ -0,0 +1,12 @@
+from django.http import Http404
+from django.shortcuts import redirect
+
+from recipes.short_links import resolve
+
+
+def short_link(request, code):
+    """Redirect a shared short link to the recipe page of the frontend."""
+    recipe_id = resolve(code)
+    if recipe_id is None:
+        raise Http404
+    return redirect(f"/recipes/{recipe_id}/")
@@ -1,6 +1,7 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 from django.contrib.auth import get_user_model
+from django.db.models import Count
 from .models import Subscription
 
 User = get_user_model()
@@ -15,9 +16,14 @@ class UserAdmin(UserAdmin):
         'first_name',
         'last_name',
         'is_staff',
+        'recipes_count',
         'followers_count',
         'following_count',
     )
+    readonly_fields = ('recipes_count', 'followers_count')
+    fieldsets = UserAdmin.fieldsets + (
+        ('Counters', {'fields': ('recipes_count', 'followers_count')}),
+    )
     search_fields = ('username', 'email', 'first_name', 'last_name')
     list_filter = ('is_staff', 'is_superuser', 'is_active')
     ordering = ('username',)
@@ -29,13 +35,14 @@ class UserAdmin(UserAdmin):
         }),
     )
 
-    def followers_count(self, obj):
-        return obj.following.count()
-    followers_count.short_description = 'Followers'
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(
+            following_total=Count('follower'))
 
     def following_count(self, obj):
-        return obj.follower.count()
+        return obj.following_total
     following_count.short_description = 'Following'
+    following_count.admin_order_field = 'following_total'
 
 
 @admin.register(Subscription)
@@ -6,3 +6,6 @@ class UsersConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'users'
     verbose_name = 'Users'
+
+    def ready(self):
+        from users import signals  # noqa: F401
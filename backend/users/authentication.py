@@ -0,0 +1,134 @@
+import copy
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from django.conf import settings
+from django.utils.translation import gettext_lazy as _
+from rest_framework.authentication import (
+    TokenAuthentication,
+    get_authorization_header,
+)
+from rest_framework.exceptions import AuthenticationFailed
+
+CacheInfo = namedtuple("CacheInfo", "hits misses maxsize currsize")
+
+
+class TokenCache:
+    """Thread-safe LRU cache of token keys with a time-to-live.
+
+    Every worker process has its own copy, so an invalidation only
+    reaches the worker that handled it; other workers drop the entry
+    once its TTL runs out.
+    """
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def invalidate_user(self, user_id):
+        with self._lock:
+            for key in [
+                key for key, (_, (user, _token)) in self._entries.items()
+                if user.pk == user_id
+            ]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+    def info(self):
+        with self._lock:
+            return CacheInfo(
+                self.hits, self.misses, self.maxsize, len(self._entries)
+            )
+
+
+token_cache = TokenCache(settings.TOKEN_CACHE_SIZE, settings.TOKEN_CACHE_TTL)
+
+
+def _detached(user):
+    """A copy of ``user`` sharing no state with the cached instance.
+
+    A plain copy.copy() would share _state, with its cache of related
+    objects, and prefetched relations between requests.
+    """
+    clone = copy.copy(user)
+    clone._state = copy.copy(user._state)
+    clone._state.fields_cache = {}
+    clone.__dict__.pop("_prefetched_objects_cache", None)
+    return clone
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """Token authentication that skips the database for recent tokens."""
+
+    def authenticate_credentials(self, key):
+        cached = token_cache.get(key)
+        if cached is not None:
+            user, token = cached
+            # Hand every request its own instance so per-request state
+            # never leaks between requests through the cache.
+            return _detached(user), token
+        user, token = super().authenticate_credentials(key)
+        token_cache.set(key, (user, token))
+        return _detached(user), token
+
+    async def aauthenticate(self, request):
+        """authenticate() for async views, which get a Django request.
+
+        Returns None without credentials; only tokens missing from the
+        cache are looked up in the database.
+        """
+        auth = get_authorization_header(request).split()
+        if not auth or auth[0].lower() != self.keyword.lower().encode():
+            return None
+        if len(auth) != 2:
+            raise AuthenticationFailed(_("Invalid token header."))
+        try:
+            key = auth[1].decode()
+        except UnicodeError:
+            raise AuthenticationFailed(_("Invalid token header."))
+        cached = token_cache.get(key)
+        if cached is None:
+            try:
+                token = await self.get_model().objects.select_related(
+                    "user"
+                ).aget(key=key)
+            except self.get_model().DoesNotExist:
+                raise AuthenticationFailed(_("Invalid token."))
+            if not token.user.is_active:
+                raise AuthenticationFailed(_("User inactive or deleted."))
+            cached = (token.user, token)
+            token_cache.set(key, cached)
+        user, token = cached
+        return _detached(user), token
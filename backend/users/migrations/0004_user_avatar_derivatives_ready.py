@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 21:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_user_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='avatar_derivatives_ready',
+            field=models.BooleanField(default=False, editable=False, verbose_name='Avatar previews ready'),
+        ),
+    ]
@@ -3,7 +3,32 @@ from django.db import models
 from django.db.models import UniqueConstraint
 
 
-class User(AbstractUser):
+class CountersMixin:
+    """Keep the counter columns out of saves of existing rows.
+
+    Counters only change through atomic F() updates; a full save would
+    write back the values the instance was loaded with.
+    """
+
+    counter_fields = ()
+
+    def save(self, *args, **kwargs):
+        if (
+            not self._state.adding
+            and kwargs.get('update_fields') is None
+            and not kwargs.get('force_insert')
+        ):
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.counter_fields
+                and field.attname not in deferred
+            ]
+        super().save(*args, **kwargs)
+
+
+class User(CountersMixin, AbstractUser):
     """Custom user model."""
     email = models.EmailField(
         'Email address',
@@ -16,6 +41,14 @@ class User(AbstractUser):
     last_name = models.CharField('Last name', max_length=150)
     avatar = models.ImageField(
         'Avatar', upload_to='users/avatars/', blank=True, null=True)
+    avatar_derivatives_ready = models.BooleanField(
+        'Avatar previews ready', default=False, editable=False)
+    recipes_count = models.PositiveIntegerField(
+        'Recipes', default=0, editable=False)
+    followers_count = models.PositiveIntegerField(
+        'Followers', default=0, editable=False)
+
+    counter_fields = ('recipes_count', 'followers_count')
 
     class Meta:
         verbose_name = 'User'
@@ -0,0 +1,18 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from users.authentication import token_cache
+from users.models import User
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    token_cache.invalidate(instance.key)
+
+
+@receiver(post_save, sender=User)
+def user_changed(sender, instance, **kwargs):
+    # Covers deactivation and profile edits: cached users must not
+    # outlive the row they were read from.
+    token_cache.invalidate_user(instance.pk)